@@ -10,7 +10,7 @@ from tastypie.authentication import ApiKeyAuthentication
 from tastypie.authorization import Authorization
 from tastypie.exceptions import BadRequest
 
-from ..nerds import NmapConsumer, JuniperConsumer
+from ..nerds import get_consumer
 
 
 class NerdsResource(Resource):
@@ -29,11 +29,6 @@ class NerdsResource(Resource):
             raise BadRequest('Could not find a nerds consumer that matches supplied data')
     
     def get_consumer(self, data):
-        host = data['host']
-        if 'nmap_services_py' in host:
-            return NmapConsumer(data)
-        if 'juniper_conf' in host:
-            return JuniperConsumer(data)
-        return None
+        return get_consumer(data)
 
 
@@ -3,7 +3,6 @@ import logging
 from django.contrib.auth.models import User
 from apps.noclook.models import NodeType, NodeHandle
 from apps.noclook import helpers, activitylog
-import ipaddress
 import graphdb as nc
 
 logger = logging.getLogger(__name__)
@@ -81,6 +80,28 @@ def create_node_handle(node_name, node_type_name, node_meta_type):
     activitylog.create_node(user, node_handle)
     return node_handle
 
+
+def bulk_create_node_handles(node_names, node_type_name, node_meta_type):
+    """
+    Bulk version of create_node_handle, the NodeHandles, their nodes and the activity log entries are created with
+    one statement each.
+    Returns a list of NodeHandle objects in the same order as node_names.
+    """
+    if not node_names:
+        return []
+    user = get_user()
+    node_type = get_node_type(node_type_name)
+    node_handles = NodeHandle.objects.bulk_create([
+        NodeHandle(node_name=node_name, node_type=node_type, node_meta_type=node_meta_type, creator=user,
+                   modifier=user)
+        for node_name in node_names
+    ])
+    # bulk_create does not call NodeHandle.save, create the nodes here
+    nodes = [{'name': nh.node_name, 'handle_id': nh.handle_id} for nh in node_handles]
+    nc.create_nodes(nc.graphdb.manager, nodes, node_meta_type, node_type.get_label())
+    activitylog.bulk_create_nodes(user, [nh.handle_id for nh in node_handles])
+    return node_handles
+
 def get_relationship_model(relationship_id):
     return nc.get_relationship_model(nc.graphdb.manager, relationship_id)
 
@@ -91,27 +112,9 @@ def address_is_a(addresses, node_types):
     :param node_types: List of acceptable node types
     :return: True if the addresses belongs to a host or does not belong to anything
     """
-    ip_addresses = [ipaddress.ip_address(item) for item in addresses]
     for address in addresses:
-        q = '''
-            MATCH (n:Node)
-            USING SCAN n:Node
-            WHERE any(x IN n.ip_addresses WHERE x =~ $address) OR n.ip_address =~ $address
-            RETURN distinct n
-            '''
-        address = '{!s}{!s}'.format(address, '.*')  # Match addresses with / network notation
-        for hit in nc.query_to_list(nc.graphdb.manager, q, address=address):
-            node = nc.get_node_model(nc.graphdb.manager, node=hit['n'])
-            node_addresses = node.data.get('ip_addresses', [])
-            if not node_addresses and node.data.get('ip_address', None):
-                node_addresses = [node.data['ip_address']]
-            for addr in node_addresses:
-                try:
-                    node_address = ipaddress.ip_address(addr.split('/')[0])
-                except ValueError:
-                    continue
-                if node_address in ip_addresses:
-                    if not [l for l in node.labels if l.replace(' ', '_') in node_types]:
-                        helpers.update_noclook_auto_manage(node)
-                        return False
+        for node in nc.get_nodes_by_ip(nc.graphdb.manager, address):
+            if not [l for l in node.labels if l.replace(' ', '_') in node_types]:
+                helpers.update_noclook_auto_manage(node)
+                return False
     return True
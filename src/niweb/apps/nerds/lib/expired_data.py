@@ -0,0 +1,79 @@
+"""
+apps/nerds/lib/expired_data.py
+==============================
+Removes auto managed data that the consumers have not seen for a while. Expiry is evaluated in Cypher by comparing
+noclook_last_seen, an ISO formatted timestamp, to a cutoff timestamp so only the expired ids are returned. They are
+then deleted in batches together with their node handles and activity log entries.
+"""
+
+import logging
+from datetime import datetime, timedelta
+
+from apps.noclook import helpers
+import graphdb as nc
+
+logger = logging.getLogger(__name__)
+
+
+def _expired(var):
+    # Same condition as helpers.neo4j_data_age, ISO timestamps compare as strings
+    return '({0}.noclook_auto_manage = true AND {0}.noclook_last_seen < $cutoff)'.format(var)
+
+
+# Ports and other equipment in routers and the units that are part of them
+ROUTER_QUERY = """
+    MATCH (router:Node:Router)
+    WHERE $router_name IS NULL OR router.name = $router_name
+    MATCH (router)-[:Has*1..]->(physical:Node)
+    OPTIONAL MATCH (physical)<-[:Part_of]-(logical:Node)
+    RETURN collect(DISTINCT CASE WHEN {physical} THEN physical.handle_id END) +
+           collect(DISTINCT CASE WHEN {logical} THEN logical.handle_id END) AS handle_ids
+    """.format(physical=_expired('physical'), logical=_expired('logical'))
+
+# Peering groups and the Uses relationships of peering partners to them
+PEER_QUERY = """
+    MATCH (peer_group:Node:Peering_Group)<-[r:Uses]-(:Peering_Partner)
+    RETURN collect(DISTINCT CASE WHEN {peer_group} THEN peer_group.handle_id END) AS handle_ids,
+           collect(CASE WHEN {r} THEN id(r) END) AS relationship_ids
+    """.format(peer_group=_expired('peer_group'), r=_expired('r'))
+
+
+def expiry_cutoff(data_age):
+    """
+    :param data_age: Hours
+    :return: ISO formatted timestamp, data last seen before it is expired
+    :rtype: str
+    """
+    return (datetime.now() - timedelta(hours=int(data_age))).isoformat()
+
+
+def remove_expired(user, query, data_age, dry_run=False, batch_size=1000, **params):
+    """
+    Runs a query that returns the handle_ids and relationship_ids of expired data for $cutoff and deletes them.
+    Nodes are deleted with their children, like helpers.delete_node does.
+
+    :param user: Django user
+    :param query: Cypher query
+    :param data_age: Data not seen for this many hours is expired
+    :param dry_run: Only count what would be deleted
+    :param batch_size: Nodes or relationships deleted per statement
+    :param params: Other query parameters
+    :return: Number of nodes and relationships, {'nodes': int, 'relationships': int}
+    :rtype: dict
+    """
+    result = nc.query_to_dict(nc.graphdb.manager, query, cutoff=expiry_cutoff(data_age), **params)
+    relationship_ids = result.get('relationship_ids', [])
+    handle_ids = helpers.get_delete_cascade(result.get('handle_ids', []))
+    if not dry_run:
+        # Relationships first, they may belong to expired nodes
+        helpers.delete_relationships(user, relationship_ids, batch_size)
+        helpers.delete_nodes(user, handle_ids, batch_size)
+    return {'nodes': len(handle_ids), 'relationships': len(relationship_ids)}
+
+
+def remove_expired_router_data(user, data_age, router_name=None, dry_run=False):
+    return remove_expired(user, ROUTER_QUERY, data_age, dry_run, router_name=router_name)
+
+
+def remove_expired_peer_data(user, data_age, dry_run=False):
+    return remove_expired(user, PEER_QUERY, data_age, dry_run)
@@ -4,23 +4,44 @@ apps/nerds/lib/juniper_consumer.py
 Shared graph-writing logic for the juniper_conf NERDS producer.
 consume_juniper_conf() or juniper_import() are the main entry points, providing a list of NERDS dicts or a single NERDS dict, respectively.
 Each dict represents a single device, and should have the same structure as the "host" dicts produced by the juniper_conf NERDS producer.
+With bulk=True the interfaces of each router are diffed against the graph and written in batches, and with workers > 1
+the routers are processed concurrently.
 """
 
 import re
-import ipaddress
 import json
 import logging
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
 
+from django.db import connections, transaction
 from apps.noclook import helpers, activitylog
 from apps.noclook.models import UniqueIdGenerator, NodeHandle
 from apps.nerds.lib import consumer_util as nlu
+from apps.nerds.lib.prefix_trie import PrefixTrie
 import graphdb as nc
 from dynamic_preferences.registries import global_preferences_registry
+from neo4j.exceptions import TransientError
 
 logger = logging.getLogger('noclook_consumer.juniper')
 
 PEER_AS_CACHE = {}
-REMOTE_IP_MATCH_CACHE = {}
+# Attempts per router when concurrent routers deadlock on shared nodes
+DEVICE_ATTEMPTS = 5
+# PrefixTrie of all Unit ip_addresses, loaded on first use and dropped whenever units are written
+UNIT_PREFIXES = None
+
+NOT_INTERESTING_INTERFACES = re.compile(r"""
+    .*\*|\.|all|tap|pfe.*|pfh.*|mt.*|pd.*|pe.*|vt.*|bcm.*|dsc.*|em.*|gre.*|ipip.*|lsi.*|mtun.*|pimd.*|pime.*|
+    pp.*|pip.*|irb.*|demux.*|cbp.*|me.*|lo.*
+    """, re.VERBOSE)
+
+
+def _is_interesting(interface):
+    port_name = interface['name']
+    return port_name and not NOT_INTERESTING_INTERFACES.match(port_name) and not interface.get('inactive', False)
 
 def insert_juniper_node(name, model, version, node_type='Router', hardware=None):
     logger.info('Processing {name}...'.format(name=name))
@@ -100,6 +121,7 @@ def insert_interface_unit(iface_node, unit, service_id_regex):
     helpers.set_noclook_auto_manage(unit_node, True)
     unit['ip_addresses'] = [address.lower() for address in unit.get('address', '')]
     helpers.dict_update_node(user, unit_node.handle_id, unit, ['description', 'ip_addresses', 'vlanid'])
+    invalidate_unit_prefixes()
     auto_depend_services(unit_node.handle_id, unit.get('description', ''), service_id_regex, 'Unit')
 
 
@@ -127,17 +149,12 @@ def cleanup_hardware_v1(router_node, user):
 
 
 def insert_juniper_interfaces(router_node, interfaces):
-    p = r"""
-        .*\*|\.|all|tap|pfe.*|pfh.*|mt.*|pd.*|pe.*|vt.*|bcm.*|dsc.*|em.*|gre.*|ipip.*|lsi.*|mtun.*|pimd.*|pime.*|
-        pp.*|pip.*|irb.*|demux.*|cbp.*|me.*|lo.*
-        """
-    not_interesting = re.compile(p, re.VERBOSE)
     user = nlu.get_user()
     cleanup_hardware_v1(router_node, user)
     service_id_regex = _service_id_regex()
     for interface in interfaces:
         port_name = interface['name']
-        if port_name and not not_interesting.match(port_name) and not interface.get('inactive', False):
+        if _is_interesting(interface):
             result = router_node.get_port(port_name)
             if 'Has' in result:
                 port_node = result.get('Has')[0].get('node')
@@ -155,35 +172,205 @@ def insert_juniper_interfaces(router_node, interfaces):
         else:
             logger.info('Interface %s ignored.', port_name)
 
-def match_remote_ip_address(remote_address):
-    for local_network in REMOTE_IP_MATCH_CACHE.keys():
-        if remote_address in local_network:
-            cache_hit = REMOTE_IP_MATCH_CACHE[local_network]
-            return cache_hit['local_network_node'], cache_hit['address']
-    for prefix in [3, 2, 1]:
-        if remote_address.version == 4:
-            mask = '.'.join(str(remote_address).split('.')[0:prefix]) + '.*'
-        else:
-            mask = ':'.join(str(remote_address).split(':')[0:prefix]) + '.*'
-        q = '''
-            MATCH (n:Unit)
-            USING SCAN n:Unit
-            WHERE any(x IN n.ip_addresses WHERE x =~ $mask)
-            RETURN distinct n
-            '''
-        for hit in nc.query_to_list(nc.graphdb.manager, q, mask=mask):
-            for address in hit['n']['ip_addresses']:
-                try:
-                    local_network = ipaddress.ip_network(address, strict=False)
-                except ValueError:
+
+def auto_depend_services_bulk(nodes, service_id_regex):
+    """
+    Bulk version of auto_depend_services.
+
+    :param nodes: (handle_id, description, type) tuples
+    :param service_id_regex: Compiled service id regex
+    """
+    if not service_id_regex:
+        return
+    desc_services = {}
+    node_types = {}
+    for handle_id, description, _type in nodes:
+        if description:
+            desc_services[handle_id] = service_id_regex.findall(description)
+            node_types[handle_id] = _type
+    if not desc_services:
+        return
+    q = """
+        MATCH (s:Service)
+        WHERE s.name IN $names
+        RETURN s.name AS name, collect(s) AS services
+        """
+    names = sorted({service_id for service_ids in desc_services.values() for service_id in service_ids})
+    services = {}
+    for record in nc.query_to_list(nc.graphdb.manager, q, names=names):
+        # Like _find_service, names that are not unique are unknown
+        if len(record['services']) == 1:
+            services[record['name']] = nc.neo4j_entity_to_dict(record['services'][0])
+    dependencies = []
+    for handle_id, service_ids in desc_services.items():
+        for service_id in service_ids:
+            service = services.get(service_id)
+            if not service:
+                logger.info('%s %s description mentions unknown service %s', node_types[handle_id], handle_id,
+                            service_id)
+            elif service.get('operational_state') == 'Decommissioned':
+                logger.warning('%s %s description mentions decommissioned service %s', node_types[handle_id],
+                               handle_id, service_id)
+            elif {'service': service['handle_id'], 'node': handle_id} not in dependencies:
+                dependencies.append({'service': service['handle_id'], 'node': handle_id})
+    # Concurrent routers lock shared services in the same order
+    dependencies.sort(key=lambda dependency: (dependency['service'], dependency['node']))
+    q = """
+        UNWIND $dependencies AS dependency
+        MATCH (s:Node {handle_id: dependency.service}), (n:Node {handle_id: dependency.node})
+        WITH s, n, NOT EXISTS((s)-[:Depends_on]->(n)) AS created
+        MERGE (s)-[:Depends_on]->(n)
+        RETURN created, s.handle_id AS start, n.handle_id AS end
+        """
+    created = [(record['start'], record['end'], 'Depends_on')
+               for record in nc.query_to_list(nc.graphdb.manager, q, dependencies=dependencies) if record['created']]
+    nc.relationships_changed(nc.graphdb.manager, created)
+    activitylog.bulk_create_relationship(nlu.get_user(), created)
+    q = """
+        UNWIND $nodes AS node
+        MATCH (n:Node {handle_id: node.handle_id})<-[:Depends_on]-(s:Service)
+        WHERE s.operational_state <> 'Decommissioned' AND NOT s.name IN node.desc_services
+        RETURN node.handle_id AS handle_id, collect(s) AS unregistered
+        """
+    nodes = [{'handle_id': handle_id, 'desc_services': service_ids} for handle_id, service_ids in desc_services.items()]
+    for record in nc.query_to_list(nc.graphdb.manager, q, nodes=nodes):
+        unregistered = [u'{}({})'.format(s['name'], s['handle_id']) for s in record['unregistered']]
+        logger.info('%s %s has services depending on it not in description: %s', node_types[record['handle_id']],
+                    record['handle_id'], ','.join(unregistered))
+
+
+def get_router_ports(router_node):
+    """
+    Returns all ports of the router with their units as {port name: (port data, {unit name: unit data})}.
+    """
+    q = """
+        MATCH (:Node {handle_id: $handle_id})-[:Has]->(port:Port)
+        OPTIONAL MATCH (port)<-[:Part_of]-(unit:Unit)
+        RETURN port, collect(unit) AS units
+        """
+    ports = {}
+    for record in nc.query_to_list(nc.graphdb.manager, q, handle_id=router_node.handle_id):
+        port = nc.neo4j_entity_to_dict(record['port'])
+        if port['name'] not in ports:
+            units = {}
+            for unit in record['units']:
+                units.setdefault(unit['name'], nc.neo4j_entity_to_dict(unit))
+            ports[port['name']] = (port, units)
+    return ports
+
+
+def insert_juniper_interfaces_bulk(router_node, interfaces):
+    """
+    Bulk version of insert_juniper_interfaces. The router's ports and units are read with one query, missing ports
+    and units are created and all property changes are written in batches, in a single transaction.
+    """
+    user = nlu.get_user()
+    cleanup_hardware_v1(router_node, user)
+    service_id_regex = _service_id_regex()
+    auto_manage_data = {
+        'noclook_auto_manage': True,
+        'noclook_last_seen': datetime.now().isoformat()
+    }
+    for interface in interfaces:
+        if not _is_interesting(interface):
+            logger.info('Interface %s ignored.', interface['name'])
+    interfaces = [interface for interface in interfaces if _is_interesting(interface)]
+    with transaction.atomic(), nc.graphdb.manager.unit_of_work():
+        ports = get_router_ports(router_node)
+        relationships = []
+        new_ports = []
+        for interface in interfaces:
+            if interface['name'] not in ports and interface['name'] not in new_ports:
+                new_ports.append(interface['name'])
+        for nh in nlu.bulk_create_node_handles(new_ports, 'Port', 'Physical'):
+            ports[nh.node_name] = ({'name': nh.node_name, 'handle_id': nh.handle_id}, {})
+            relationships.append((router_node.handle_id, nh.handle_id, 'Has'))
+        new_units = []
+        for interface in interfaces:
+            port, units = ports[interface['name']]
+            for unit in interface['units']:
+                unit_name = u'{}'.format(unit['unit'])
+                if not unit.get('inactive', False) and unit_name not in units:
+                    units[unit_name] = None
+                    new_units.append((port, units, unit_name))
+        node_handles = nlu.bulk_create_node_handles([unit_name for _, _, unit_name in new_units], 'Unit', 'Logical')
+        for (port, units, unit_name), nh in zip(new_units, node_handles):
+            units[unit_name] = {'name': unit_name, 'handle_id': nh.handle_id}
+            relationships.append((nh.handle_id, port['handle_id'], 'Part_of'))
+            logger.info('Unit %s.%s created.', port['name'], unit_name)
+        nc.create_relationships(nc.graphdb.manager, relationships)
+        activitylog.bulk_create_relationship(user, relationships)
+
+        # Only the changed keys are written, properties edited while the router is processed are kept
+        new_properties = {}
+        changes = []
+        depend_nodes = []
+
+        def diff(node, properties, keys):
+            node_changes = helpers.node_property_changes(node, properties, keys)
+            updates = new_properties.setdefault(node['handle_id'], dict(auto_manage_data))
+            updates.update({key: None if value == '' else value for key, _, value in node_changes})
+            return [(node['handle_id'],) + change for change in node_changes]
+
+        for interface in interfaces:
+            port, units = ports[interface['name']]
+            changes += diff(port, interface, ['description', 'name'])
+            for unit in interface['units']:
+                if unit.get('inactive', False):
                     continue
-                if remote_address in local_network:
-                    local_network_node = nc.get_node_model(nc.graphdb.manager, hit['n']['handle_id'])
-                    REMOTE_IP_MATCH_CACHE[local_network] = {
-                        'address': address, 'local_network_node': local_network_node
-                    }
-                    logger.info('Remote IP matched: %s %s done.', local_network_node.data['name'], address)
-                    return local_network_node, address
+                unit_node = units[u'{}'.format(unit['unit'])]
+                unit['ip_addresses'] = [address.lower() for address in unit.get('address', '')]
+                changes += diff(unit_node, unit, ['description', 'ip_addresses', 'vlanid'])
+                depend_nodes.append((unit_node['handle_id'], unit.get('description', ''), 'Unit'))
+            depend_nodes.append((port['handle_id'], interface.get('description', ''), 'Port'))
+        nc.update_nodes_properties(nc.graphdb.manager, new_properties)
+        invalidate_unit_prefixes()
+        activitylog.bulk_update_node_property(user, changes)
+        auto_depend_services_bulk(depend_nodes, service_id_regex)
+    logger.info('%s: %d interfaces done, %d ports and %d units created.', router_node.data['name'], len(interfaces),
+                len(new_ports), len(new_units))
+
+
+def load_unit_prefixes():
+    """
+    Returns a PrefixTrie of the networks of all Unit ip_addresses with (handle_id, address) as values.
+    """
+    q = """
+        MATCH (n:Unit)
+        WHERE n.ip_addresses IS NOT NULL
+        RETURN n.handle_id AS handle_id, n.ip_addresses AS ip_addresses
+        """
+    prefixes = PrefixTrie()
+    for record in nc.query_to_iterator(nc.graphdb.manager, q):
+        for address in record['ip_addresses']:
+            try:
+                prefixes.insert(address, (record['handle_id'], address))
+            except ValueError:
+                continue
+    logger.info('Loaded %d unit networks.', len(prefixes))
+    return prefixes
+
+
+def get_unit_prefixes():
+    global UNIT_PREFIXES
+    prefixes = UNIT_PREFIXES
+    if prefixes is None:
+        prefixes = UNIT_PREFIXES = load_unit_prefixes()
+    return prefixes
+
+
+def invalidate_unit_prefixes():
+    global UNIT_PREFIXES
+    UNIT_PREFIXES = None
+
+
+def match_remote_ip_address(remote_address):
+    match = get_unit_prefixes().longest_match(remote_address)
+    if match:
+        network, (handle_id, address) = match
+        local_network_node = nc.get_node_model(nc.graphdb.manager, handle_id)
+        logger.info('Remote IP matched: %s %s done.', local_network_node.data['name'], address)
+        return local_network_node, address
     logger.info('No local IP address matched for %s.', remote_address)
     return None, None
 
@@ -260,7 +447,7 @@ def insert_external_bgp_peering(peering, peering_group):
     helpers.set_noclook_auto_manage(relationship, True)
     if result.get('Uses')[0].get('created', False):
         activitylog.create_relationship(user, relationship)
-    dependency_node, local_address = match_remote_ip_address(ipaddress.ip_address(remote_address))
+    dependency_node, local_address = match_remote_ip_address(remote_address)
     if dependency_node and local_address:
         result = peering_group.get_group_dependency(dependency_node.handle_id, local_address)
         if not result.get('Depends_on'):
@@ -274,6 +461,11 @@ def insert_external_bgp_peering(peering, peering_group):
 
 
 def insert_juniper_bgp_peerings(bgp_peerings):
+    with helpers.deferred_auto_manage():
+        _insert_juniper_bgp_peerings(bgp_peerings)
+
+
+def _insert_juniper_bgp_peerings(bgp_peerings):
     for peering in bgp_peerings:
         peering_type = peering.get('type')
         if peering_type == 'internal':
@@ -286,12 +478,54 @@ def insert_juniper_bgp_peerings(bgp_peerings):
             helpers.set_noclook_auto_manage(peering_group_node, True)
             insert_external_bgp_peering(peering, peering_group_node)
 
-def consume_juniper_conf(json_list, is_switches=False):
+def insert_juniper_device(jconf, node_type, bulk=False):
+    name     = jconf['name']
+    version  = jconf.get('version', 'Unknown')
+    model    = jconf.get('model', 'Unknown')
+    hardware = jconf.get('hardware')
+    # Last seen is written for all the router's nodes at once when it is done
+    with helpers.deferred_auto_manage():
+        node = insert_juniper_node(name, model, version, node_type, hardware)
+        insert_juniper_hardware(node, hardware)
+        if bulk:
+            insert_juniper_interfaces_bulk(node, jconf['interfaces'])
+        else:
+            insert_juniper_interfaces(node, jconf['interfaces'])
+
+
+def _insert_juniper_device_worker(jconf, node_type, bulk, attempts=DEVICE_ATTEMPTS):
+    """
+    Inserts the device, retrying it when Neo4j reports a transient error like a deadlock with another worker. The
+    failed transactions are rolled back, so the device is inserted again from the start.
+    """
+    try:
+        for attempt in range(1, attempts + 1):
+            try:
+                insert_juniper_device(jconf, node_type, bulk)
+                return
+            except TransientError as e:
+                if attempt == attempts:
+                    raise
+                logger.warning('%s: %s, attempt %d of %d.', jconf['name'], e, attempt, attempts)
+                time.sleep(random.uniform(0, 0.1 * 2 ** attempt))
+    finally:
+        # Worker threads get their own database connections
+        connections.close_all()
+
+
+def consume_juniper_conf(json_list, is_switches=False, bulk=False, workers=1):
     """
     Insert/update graph nodes for a list of NERDS dicts produced by
     juniper_conf (or nso_juniper).  Called by both the batch script and
     the inline HTTP consumer.
+
+    With bulk=True each device's interfaces are written in batches, see insert_juniper_interfaces_bulk.
+    With workers > 1 that many devices are processed concurrently, devices whose transaction fails with a transient
+    error (deadlock) are inserted again. BGP peerings are always inserted afterwards, one at a time.
     """
+    node_type = 'Switch' if is_switches else 'Router'
+    invalidate_unit_prefixes()
+    jconfs = []
     bgp_peerings = []
     for i in json_list:
         if 'nso_juniper' in i['host']:
@@ -301,15 +535,20 @@ def consume_juniper_conf(json_list, is_switches=False):
         else:
             logger.warning('Skipping non-juniper device: %s', i['host'].get('name'))
             continue
-        node_type = 'Switch' if is_switches else 'Router'
-        name     = jconf['name']
-        version  = jconf.get('version', 'Unknown')
-        model    = jconf.get('model', 'Unknown')
-        hardware = jconf.get('hardware')
-        node = insert_juniper_node(name, model, version, node_type, hardware)
-        insert_juniper_hardware(node, hardware)
-        insert_juniper_interfaces(node, jconf['interfaces'])
+        jconfs.append(jconf)
         bgp_peerings += jconf['bgp_peerings']
+    if workers > 1:
+        # Create the shared user and node types up front so the workers do not race to create them
+        nlu.get_user()
+        for type_name in [node_type, 'Port', 'Unit']:
+            nlu.get_node_type(type_name)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(_insert_juniper_device_worker, jconf, node_type, bulk) for jconf in jconfs]
+            for future in futures:
+                future.result()
+    else:
+        for jconf in jconfs:
+            insert_juniper_device(jconf, node_type, bulk)
     insert_juniper_bgp_peerings(bgp_peerings)
 
 
@@ -0,0 +1,72 @@
+"""
+apps/nerds/lib/prefix_trie.py
+=============================
+Binary trie of IPv4 and IPv6 networks for longest-prefix-match lookups.
+"""
+
+import ipaddress
+
+# Trie nodes are lists of [zero child, one child, (network, value)]
+_ZERO, _ONE, _VALUE = 0, 1, 2
+
+
+def _bit(bits, index, max_prefixlen):
+    return (bits >> (max_prefixlen - 1 - index)) & 1
+
+
+class PrefixTrie(object):
+    """
+    Maps networks to values. Inserts and lookups walk at most the prefix length of the network or address,
+    32 steps for IPv4 and 128 for IPv6, regardless of how many networks the trie holds.
+    """
+
+    def __init__(self):
+        self._roots = {4: [None, None, None], 6: [None, None, None]}
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def insert(self, network, value):
+        """
+        Adds a value for the network, host bits are ignored so '10.0.0.1/30' is stored as 10.0.0.0/30.
+        The first value inserted for a network is kept.
+
+        :param network: Network or interface address
+        :type network: str|ipaddress.IPv4Network|ipaddress.IPv6Network
+        :param value: Any value
+        :return: True if the network was added
+        :rtype: bool
+        """
+        network = ipaddress.ip_network(network, strict=False)
+        bits = int(network.network_address)
+        node = self._roots[network.version]
+        for index in range(network.prefixlen):
+            bit = _bit(bits, index, network.max_prefixlen)
+            if node[bit] is None:
+                node[bit] = [None, None, None]
+            node = node[bit]
+        if node[_VALUE] is not None:
+            return False
+        node[_VALUE] = (network, value)
+        self._size += 1
+        return True
+
+    def longest_match(self, address):
+        """
+        :param address: IP address
+        :type address: str|ipaddress.IPv4Address|ipaddress.IPv6Address
+        :return: (network, value) for the most specific network containing the address or None
+        :rtype: tuple|None
+        """
+        address = ipaddress.ip_address(address)
+        bits = int(address)
+        node = self._roots[address.version]
+        match = node[_VALUE]
+        for index in range(address.max_prefixlen):
+            node = node[_bit(bits, index, address.max_prefixlen)]
+            if node is None:
+                break
+            if node[_VALUE] is not None:
+                match = node[_VALUE]
+        return match
@@ -28,3 +28,15 @@ class JuniperConsumer:
             logger.exception("Unable to process juniper conf for %s" % name)
             raise
 
+
+
+def get_consumer(data):
+    """
+    Returns the consumer for a NERDS document or None if there is none for its producer.
+    """
+    host = data['host']
+    if 'nmap_services_py' in host:
+        return NmapConsumer(data)
+    if 'juniper_conf' in host:
+        return JuniperConsumer(data)
+    return None
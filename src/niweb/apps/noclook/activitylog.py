@@ -5,8 +5,74 @@ Created on 2012-11-23 10:18 AM
 @author: lundberg
 """
 
+import threading
+from contextlib import contextmanager
 from actstream import action
+from actstream.models import Action
+from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
+from django.utils import timezone
 from .models import NodeHandle
+from . import report_cache, url_map
+
+_local = threading.local()
+
+
+class _Batch(object):
+
+    def __init__(self):
+        self.actions = []
+        self.modifiers = {}  # handle_id -> user
+        self.renamed = {}  # handle_id -> NodeHandle with a new node_name
+        self.deleted_types = set()  # NodeType ids
+
+    def add(self, user, actions, handle_ids=()):
+        self.actions += actions
+        for handle_id in handle_ids:
+            self.modifiers[handle_id] = user
+
+    @transaction.atomic
+    def flush(self):
+        now = timezone.now()
+        for nh in self.renamed.values():
+            nh.modifier = self.modifiers.get(nh.handle_id, nh.modifier)
+            nh.modified = now
+        NodeHandle.objects.bulk_update(list(self.renamed.values()), ['node_name', 'modifier', 'modified'])
+        # bulk_update does not send post_save
+        for nh in self.renamed.values():
+            url_map.node_slugs.set(nh.handle_id, nh.node_type_id)
+        by_user = {}
+        for handle_id, user in self.modifiers.items():
+            if handle_id not in self.renamed:
+                by_user.setdefault(user, []).append(handle_id)
+        for user, handle_ids in by_user.items():
+            NodeHandle.objects.filter(pk__in=handle_ids).update(modifier=user, modified=now)
+        Action.objects.bulk_create(self.actions)
+        # Written nodes invalidate the reports through graphdb, deleted NodeHandles can only be found by their type
+        report_cache.invalidate_nodes(node_type_ids=self.deleted_types)
+
+
+def _current_batch():
+    return getattr(_local, 'batch', None)
+
+
+@contextmanager
+def batch():
+    """
+    Collects the actions sent in the with block and writes them with one bulk_create when it ends, the modifier
+    and modified time of each changed NodeHandle are updated once. Nested batches join the outermost one.
+
+    Nothing is written if the block raises, the changes the actions describe were rolled back.
+    """
+    if _current_batch() is not None:
+        yield _current_batch()
+        return
+    _local.batch = current = _Batch()
+    try:
+        yield current
+    finally:
+        _local.batch = None
+    current.flush()
 
 
 def update_node_property(user, action_object, property_key, value_before, value_after):
@@ -20,18 +86,21 @@ def update_node_property(user, action_object, property_key, value_before, value_
     :return: None
     """
     action_object.modifier = user
+    noclook = {
+        'action_type': 'node_property',
+        'property': property_key,
+        'value_before': value_before,
+        'value_after': value_after
+    }
+    current_batch = _current_batch()
+    if current_batch is not None:
+        if property_key == 'name':
+            current_batch.renamed[action_object.handle_id] = action_object
+        current_batch.add(user, [_node_action(user, 'update', action_object.handle_id, noclook=noclook)],
+                          [action_object.handle_id])
+        return
     action_object.save()
-    action.send(
-        user,
-        verb='update',
-        action_object=action_object,
-        noclook={
-            'action_type': 'node_property',
-            'property': property_key,
-            'value_before': value_before,
-            'value_after': value_after
-        }
-    )
+    action.send(user, verb='update', action_object=action_object, noclook=noclook)
 
 
 def create_node(user, action_object):
@@ -40,6 +109,11 @@ def create_node(user, action_object):
     :param action_object: NodeHandle instance
     :return: None
     """
+    current_batch = _current_batch()
+    if current_batch is not None:
+        current_batch.add(user, [_node_action(user, 'create', action_object.handle_id,
+                                              noclook={'action_type': 'node'})])
+        return
     action.send(
         user,
         verb='create',
@@ -56,14 +130,29 @@ def delete_node(user, action_object):
     :param action_object: NodeHandle instance
     :return: None
     """
-    action.send(
-        user,
-        verb='delete',
-        noclook={
-            'action_type': 'node',
-            'object_name': u'{}'.format(action_object)
-        }
-    )
+    noclook = {
+        'action_type': 'node',
+        'object_name': u'{}'.format(action_object)
+    }
+    current_batch = _current_batch()
+    if current_batch is not None:
+        current_batch.add(user, [_node_action(user, 'delete', None, noclook=noclook)])
+        current_batch.deleted_types.add(action_object.node_type_id)
+        return
+    action.send(user, verb='delete', noclook=noclook)
+    report_cache.invalidate_nodes(node_type_ids=[action_object.node_type_id])
+
+
+def _relationship_batched(user, verb, relationship, noclook):
+    """
+    Adds the relationship action to the current batch, returns False if there is none.
+    """
+    current_batch = _current_batch()
+    if current_batch is None:
+        return False
+    start, end = relationship.start['handle_id'], relationship.end['handle_id']
+    current_batch.add(user, [_node_action(user, verb, start, end, noclook=noclook)], [start, end])
+    return True
 
 
 def update_relationship_property(user, relationship, property_key, value_before, value_after):
@@ -76,25 +165,22 @@ def update_relationship_property(user, relationship, property_key, value_before,
     :param value_after: JSON supported value
     :return: None
     """
+    noclook = {
+        'action_type': 'relationship_property',
+        'relationship_type': relationship.type,
+        'property': property_key,
+        'value_before': value_before,
+        'value_after': value_after
+    }
+    if _relationship_batched(user, 'update', relationship, noclook):
+        return
     start_nh = NodeHandle.objects.get(pk=relationship.start['handle_id'])
     start_nh.modifier = user
     start_nh.save()
     end_nh = NodeHandle.objects.get(pk=relationship.end['handle_id'])
     end_nh.modifier = user
     end_nh.save()
-    action.send(
-        user,
-        verb='update',
-        action_object=start_nh,
-        target=end_nh,
-        noclook={
-            'action_type': 'relationship_property',
-            'relationship_type': relationship.type,
-            'property': property_key,
-            'value_before': value_before,
-            'value_after': value_after
-        }
-    )
+    action.send(user, verb='update', action_object=start_nh, target=end_nh, noclook=noclook)
 
 
 def create_relationship(user, relationship):
@@ -103,22 +189,19 @@ def create_relationship(user, relationship):
     :param relationship: norduniclient relationship model
     :return: None
     """
+    noclook = {
+        'action_type': 'relationship',
+        'relationship_type': relationship.type
+    }
+    if _relationship_batched(user, 'create', relationship, noclook):
+        return
     start_nh = NodeHandle.objects.get(pk=relationship.start['handle_id'])
     start_nh.modifier = user
     start_nh.save()
     end_nh = NodeHandle.objects.get(pk=relationship.end['handle_id'])
     end_nh.modifier = user
     end_nh.save()
-    action.send(
-        user,
-        verb='create',
-        action_object=start_nh,
-        target=end_nh,
-        noclook={
-            'action_type': 'relationship',
-            'relationship_type': relationship.type
-        }
-    )
+    action.send(user, verb='create', action_object=start_nh, target=end_nh, noclook=noclook)
 
 
 def delete_relationship(user, relationship):
@@ -127,20 +210,135 @@ def delete_relationship(user, relationship):
     :param relationship: norduniclient relationship model
     :return: None
     """
+    noclook = {
+        'action_type': 'relationship',
+        'relationship_type': relationship.type,
+        'object_name': u'{}'.format(relationship.data)
+    }
+    if _relationship_batched(user, 'delete', relationship, noclook):
+        return
     start_nh = NodeHandle.objects.get(pk=relationship.start['handle_id'])
     start_nh.modifier = user
     start_nh.save()
     end_nh = NodeHandle.objects.get(pk=relationship.end['handle_id'])
     end_nh.modifier = user
     end_nh.save()
-    action.send(
-        user,
-        verb='delete',
-        action_object=start_nh,
-        target=end_nh,
-        noclook={
-            'action_type': 'relationship',
-            'relationship_type': relationship.type,
-            'object_name': u'{}'.format(relationship.data)
-        }
+    action.send(user, verb='delete', action_object=start_nh, target=end_nh, noclook=noclook)
+
+
+def _node_action(user, verb, handle_id, target_handle_id=None, **kwargs):
+    """
+    Returns an unsaved Action with the same fields as action.send would store, with NodeHandles given by handle_id.
+    """
+    node_handle_type = ContentType.objects.get_for_model(NodeHandle)
+    new_action = Action(
+        actor_content_type=ContentType.objects.get_for_model(user),
+        actor_object_id=user.pk,
+        verb=verb,
+        timestamp=timezone.now(),
+        data=kwargs,
     )
+    if handle_id is not None:
+        new_action.action_object_content_type = node_handle_type
+        new_action.action_object_object_id = handle_id
+    if target_handle_id is not None:
+        new_action.target_content_type = node_handle_type
+        new_action.target_object_id = target_handle_id
+    return new_action
+
+
+def _bulk_send(user, actions, handle_ids):
+    current_batch = _current_batch()
+    if current_batch is not None:
+        current_batch.add(user, actions, handle_ids)
+        return
+    NodeHandle.objects.filter(pk__in=set(handle_ids)).update(modifier=user, modified=timezone.now())
+    Action.objects.bulk_create(actions)
+
+
+def bulk_create_nodes(user, handle_ids):
+    """
+    Bulk version of create_node.
+    :param user: Django user instance
+    :param handle_ids: NodeHandle ids
+    :return: None
+    """
+    actions = [_node_action(user, 'create', handle_id, noclook={'action_type': 'node'}) for handle_id in handle_ids]
+    current_batch = _current_batch()
+    if current_batch is not None:
+        current_batch.add(user, actions)
+        return
+    Action.objects.bulk_create(actions)
+
+
+def bulk_update_node_property(user, changes):
+    """
+    Bulk version of update_node_property.
+    :param user: Django user instance
+    :param changes: (handle_id, property_key, value_before, value_after) tuples
+    :return: None
+    """
+    actions = []
+    for handle_id, property_key, value_before, value_after in changes:
+        actions.append(_node_action(user, 'update', handle_id, noclook={
+            'action_type': 'node_property',
+            'property': property_key,
+            'value_before': value_before,
+            'value_after': value_after
+        }))
+    _bulk_send(user, actions, [change[0] for change in changes])
+
+
+def bulk_create_relationship(user, relationships):
+    """
+    Bulk version of create_relationship.
+    :param user: Django user instance
+    :param relationships: (start_handle_id, end_handle_id, relationship_type) tuples
+    :return: None
+    """
+    actions = []
+    handle_ids = []
+    for start, end, relationship_type in relationships:
+        actions.append(_node_action(user, 'create', start, end, noclook={
+            'action_type': 'relationship',
+            'relationship_type': relationship_type
+        }))
+        handle_ids += [start, end]
+    _bulk_send(user, actions, handle_ids)
+
+
+def bulk_delete_nodes(user, node_handles):
+    """
+    Bulk version of delete_node.
+    :param user: Django user instance
+    :param node_handles: NodeHandle instances
+    :return: None
+    """
+    actions = [_node_action(user, 'delete', None, noclook={'action_type': 'node', 'object_name': u'{}'.format(nh)})
+               for nh in node_handles]
+    current_batch = _current_batch()
+    if current_batch is not None:
+        current_batch.add(user, actions)
+        current_batch.deleted_types.update(nh.node_type_id for nh in node_handles)
+        return
+    Action.objects.bulk_create(actions)
+    report_cache.invalidate_nodes(node_type_ids=[nh.node_type_id for nh in node_handles])
+
+
+def bulk_delete_relationship(user, relationships):
+    """
+    Bulk version of delete_relationship.
+    :param user: Django user instance
+    :param relationships: Dicts with start, end, type and data as returned by graphdb.delete_relationships
+    :return: None
+    """
+    actions = []
+    handle_ids = []
+    for relationship in relationships:
+        actions.append(_node_action(user, 'delete', relationship['start'], relationship['end'], noclook={
+            'action_type': 'relationship',
+            'relationship_type': relationship['type'],
+            'object_name': u'{}'.format(relationship['data'])
+        }))
+        handle_ids += [relationship['start'], relationship['end']]
+    _bulk_send(user, actions, handle_ids)
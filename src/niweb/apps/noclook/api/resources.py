@@ -15,13 +15,14 @@ from tastypie.exceptions import ImmediateHttpResponse
 from tastypie.constants import ALL
 from tastypie.exceptions import NotFound
 from tastypie.utils import trailing_slash
+from tastypie.paginator import Paginator
 from tastypie.authentication import ApiKeyAuthentication
 from tastypie.authorization import Authorization
 from django.contrib.auth.models import User
 from django.urls import re_path
 from django.urls import reverse, resolve, NoReverseMatch
 from django.core.exceptions import ObjectDoesNotExist, MultipleObjectsReturned
-from django.http import HttpResponseNotAllowed, HttpResponse
+from django.http import HttpResponseNotAllowed, HttpResponse, StreamingHttpResponse
 from django.template.defaultfilters import slugify
 from apps.noclook.models import NodeHandle, NodeType, NordunetUniqueId, Dropdown
 from apps.noclook import forms
@@ -33,6 +34,9 @@ from graphdb.exceptions import NodeNotFound
 import logging
 from datetime import datetime, timedelta
 
+EXPORT_BATCH_SIZE = 500
+EXPORT_MAX_BATCH_SIZE = 2000
+
 logger = logging.getLogger('api_resources')
 logger.setLevel(logging.DEBUG)
 ch = logging.StreamHandler()
@@ -48,7 +52,13 @@ def handle_id2resource_uri(handle_id):
     """
     if not isinstance(handle_id, int):
         handle_id = handle_id['handle_id']
-    nh = NodeHandle.objects.get(pk=handle_id)
+    return nodehandle2resource_uri(NodeHandle.objects.get(pk=handle_id))
+
+
+def nodehandle2resource_uri(nh):
+    """
+    Returns a NodeHandleResource URI from a NodeHandle.
+    """
     view = 'api_dispatch_detail'
     nhr = NodeHandleResource()
     kwargs = nhr.resource_uri_kwargs()
@@ -173,6 +183,20 @@ class NodeTypeResource(ModelResource):
         return bundle
 
 
+class NodeHandlePaginator(Paginator):
+    """
+    Fetches the node data and relationships of every node handle on the page in one query, dehydrate
+    uses them instead of querying the graph for each node.
+    """
+
+    def get_slice(self, limit, offset):
+        node_handles = list(super(NodeHandlePaginator, self).get_slice(limit, offset))
+        graph = nc.get_nodes_with_relationships(nc.graphdb.manager, [nh.handle_id for nh in node_handles])
+        for nh in node_handles:
+            nh.prefetched_graph = graph.get(nh.handle_id)
+        return node_handles
+
+
 class NodeHandleResource(ModelResource):
 
     handle_id = fields.IntegerField(attribute='handle_id', readonly=True, unique=True)
@@ -187,6 +211,7 @@ class NodeHandleResource(ModelResource):
 
     class Meta:
         api_name = 'v1'
+        paginator_class = NodeHandlePaginator
         queryset = NodeHandle.objects.all()
         resource_name = 'node_handle'
         authentication = ApiKeyAuthentication()
@@ -209,6 +234,12 @@ class NodeHandleResource(ModelResource):
 
     def prepend_urls(self):
         return [
+            re_path(r"^(?P<resource_name>%s)/export%s$" % (
+                self._meta.resource_name, utils.trailing_slash()),
+                self.wrap_view('dispatch_export'), name="api_export"),
+            re_path(r"^(?P<resource_name>%s)/ticketinfo%s$" % (
+                self._meta.resource_name, utils.trailing_slash()),
+                self.wrap_view('dispatch_bulk_ticketinfo'), name="api_get_bulk_ticketinfo"),
             re_path(r"^(?P<resource_name>%s)/(?P<pk>\w[\w/-]*)/relationships/(?P<rel_type>\w[\w]*)%s$" % (
                 self._meta.resource_name, utils.trailing_slash()),
                 self.wrap_view('get_relationships'), name="api_get_relationships"),
@@ -296,8 +327,144 @@ class NodeHandleResource(ModelResource):
         }
         return self.create_response(request, data)
 
+    def dispatch_export(self, request, **kwargs):
+        self.method_check(request, allowed=['get'])
+
+        self.is_authenticated(request)
+        self.throttle_check(request)
+
+        # All clear. Process the request.
+        response = self.get_export(request, **kwargs)
+
+        # Add the throttled request.
+        self.log_throttled_access(request)
+
+        return response
+
+    def get_export(self, request, **kwargs):
+        """
+        Streams all node handles of this resource type as newline delimited JSON, ordered by handle_id.
+        Each batch of node handles is read with a handle_id greater than the last one sent and joined with
+        its graph data in one query. Takes after (handle_id to continue from) and batch_size parameters.
+        """
+        try:
+            after = int(request.GET.get('after', 0))
+            batch_size = min(int(request.GET.get('batch_size', EXPORT_BATCH_SIZE)), EXPORT_MAX_BATCH_SIZE)
+        except ValueError:
+            return self.error_response(request, {'error': 'after and batch_size must be integers'})
+        if batch_size < 1:
+            return self.error_response(request, {'error': 'batch_size must be positive'})
+        return StreamingHttpResponse(self._export_lines(request, after, batch_size),
+                                     content_type='application/x-ndjson')
+
+    def _export_lines(self, request, after, batch_size):
+        queryset = self.get_object_list(request).order_by('handle_id')
+        while True:
+            node_handles = list(queryset.filter(handle_id__gt=after)[:batch_size])
+            if not node_handles:
+                return
+            graph = nc.get_nodes_with_relationships(nc.graphdb.manager, [nh.handle_id for nh in node_handles])
+            for nh in node_handles:
+                nh.prefetched_graph = graph.get(nh.handle_id)
+                if nh.prefetched_graph is None:
+                    logger.warning('Node with handle_id {} not found in the graph, not exported.'.format(
+                        nh.handle_id))
+                    continue
+                bundle = self.full_dehydrate(self.build_bundle(obj=nh, request=request), for_list=True)
+                yield self._meta.serializer.to_json(bundle) + '\n'
+            if len(node_handles) < batch_size:
+                return
+            after = node_handles[-1].handle_id
+
+    def dispatch_bulk_ticketinfo(self, request, **kwargs):
+        allowed_methods = ['get', 'post']
+        if 'HTTP_X_HTTP_METHOD_OVERRIDE' in request.META:
+            request.method = request.META['HTTP_X_HTTP_METHOD_OVERRIDE']
+
+        self.method_check(request, allowed=allowed_methods)
+
+        self.is_authenticated(request)
+        self.throttle_check(request)
+
+        # All clear. Process the request.
+        response = self.get_bulk_ticketinfo(request, **kwargs)
+
+        # Add the throttled request.
+        self.log_throttled_access(request)
+
+        return response
+
+    def get_bulk_ticketinfo(self, request, **kwargs):
+        """
+        Ticket info for many failed elements in one request. Takes handle_id and name parameters, repeated
+        in a GET query string or as lists in a POST body, and returns the impact of every element and of all
+        of them together.
+        """
+        if request.method == 'POST':
+            data = self.deserialize(request, request.body,
+                                    format=request.META.get('CONTENT_TYPE', 'application/json'))
+            handle_ids, names = data.get('handle_ids') or [], data.get('names') or []
+        else:
+            handle_ids, names = request.GET.getlist('handle_id'), request.GET.getlist('name')
+        try:
+            handle_ids = [int(handle_id) for handle_id in handle_ids]
+        except (TypeError, ValueError):
+            return self.error_response(request, {'error': 'handle_ids must be integers'})
+
+        # Only elements of this resource type
+        node_handles = self._meta.queryset.filter(handle_id__in=handle_ids) | \
+            self._meta.queryset.filter(node_name__in=names)
+        elements = {nh.handle_id: nh.node_name for nh in node_handles}
+        found = set(elements.keys()) | set(elements.values())
+        not_found = [x for x in handle_ids + names if x not in found]
+
+        dependents = nc.get_dependents_bulk(nc.graphdb.manager, list(elements.keys()))
+        services = {s['handle_id']: s for d in dependents.values() for s in d.get('services', [])}
+        q = """
+            MATCH (n:Node)<-[:Uses]-(u:Node) WHERE n.handle_id IN $handle_ids
+            RETURN n.handle_id AS handle_id, collect(DISTINCT u.name) AS users
+            """
+        users = {r['handle_id']: r['users'] for r in
+                 nc.query_to_list(nc.graphdb.manager, q, handle_ids=list(services.keys()))}
+
+        def impact(dependent_list):
+            impact_services = {s['handle_id']: s for d in dependent_list for s in d.get('services', [])}.values()
+            return {
+                'impacted_users': sorted({u for s in impact_services for u in users.get(s['handle_id'], [])}),
+                'service_ids': sorted({s.get('name') for s in impact_services}),
+                'impacts': sorted({u"{} - {}".format(s.get('name'), s.get('description'))
+                                   for s in impact_services}),
+                'optical_paths': sorted({p.get('name') for d in dependent_list for p in d.get('paths', [])}),
+                'oms': sorted({o.get('name') for d in dependent_list for o in d.get('oms', [])}),
+            }
+
+        data = {
+            'elements': [dict(impact([dependents.get(handle_id, {})]), handle_id=handle_id, name=name)
+                         for handle_id, name in sorted(elements.items())],
+            'total': impact(list(dependents.values())),
+            'not_found': not_found,
+        }
+        return self.create_response(request, data)
+
+    def get_object_list(self, request):
+        return super(NodeHandleResource, self).get_object_list(request).select_related(
+            'node_type', 'creator', 'modifier')
+
+    def _node_graph(self, bundle):
+        # Set for list responses by NodeHandlePaginator
+        graph = getattr(bundle.obj, 'prefetched_graph', None)
+        if graph is None:
+            node = bundle.obj.get_node()
+            graph = {
+                'data': node.data,
+                'relationships': [{'id': rel['relationship_id']} for rels in node.relationships.values()
+                                  for rel in rels],
+            }
+            bundle.obj.prefetched_graph = graph
+        return graph
+
     def dehydrate_node(self, bundle):
-        return bundle.obj.get_node().data
+        return self._node_graph(bundle)['data']
 
     def hydrate_node(self, bundle):
         try:
@@ -318,11 +485,9 @@ class NodeHandleResource(ModelResource):
         bundle.data['relationships'] = []
         rr = RelationshipResource()
         tmp_obj = RelationshipObject()
-        relationships = bundle.obj.get_node().relationships
-        for key in relationships.keys():
-            for rel in relationships.get(key, []):
-                tmp_obj.id = rel['relationship_id']
-                bundle.data['relationships'].append(rr.get_resource_uri(tmp_obj))
+        for rel in self._node_graph(bundle)['relationships']:
+            tmp_obj.id = rel['id']
+            bundle.data['relationships'].append(rr.get_resource_uri(tmp_obj))
         node_data = bundle.data.get("node", {})
         if "internal_description" in node_data:
             del node_data["internal_description"]
@@ -397,13 +562,22 @@ class RelationshipResource(Resource):
         authorization = Authorization()
         allowed_methods = ['get', 'put', 'post']
 
-    def _new_obj(self, rel):
+    def _new_obj(self, rel, node_handles=None):
+        """
+        :param rel: Relationship model
+        :param node_handles: Optional handle_id -> NodeHandle of the end points, looked up one by one otherwise
+        """
+        def resource_uri(node):
+            if node_handles and node['handle_id'] in node_handles:
+                return nodehandle2resource_uri(node_handles[node['handle_id']])
+            return handle_id2resource_uri(node)
+
         new_obj = RelationshipObject()
         new_obj.id = rel.id
         new_obj.type = rel.type
         new_obj.properties.update(rel.data)
-        new_obj.start = handle_id2resource_uri(rel.start)
-        new_obj.end = handle_id2resource_uri(rel.end)
+        new_obj.start = resource_uri(rel.start)
+        new_obj.end = resource_uri(rel.end)
         return new_obj
 
     def get_resource_uri(self, bundle_or_obj=None, url_name='api_dispatch_detail'):
@@ -428,15 +602,15 @@ class RelationshipResource(Resource):
         if kwargs.get('parent_obj', None):
             rel_type = kwargs.get('rel_type', None)
             nh = NodeHandle.objects.get(pk=kwargs['parent_obj'])
-            relationships = nh.get_node().relationships
-            if rel_type:
-                keys = [rel_type]
-            else:
-                keys = relationships.keys()
-            for key in keys:
-                for item in relationships.get(key, []):
-                    relationship = nc.get_relationship_model(nc.graphdb.manager, item['relationship_id'])
-                    results.append(self._new_obj(relationship))
+            graph = nc.get_nodes_with_relationships(nc.graphdb.manager, [nh.handle_id], rel_type)
+            relationships = graph.get(nh.handle_id, {}).get('relationships', [])
+            # All end points in one SQL query
+            handle_ids = {rel['start']['handle_id'] for rel in relationships} | \
+                {rel['end']['handle_id'] for rel in relationships}
+            node_handles = NodeHandle.objects.select_related('node_type').in_bulk(list(handle_ids))
+            for bundle in relationships:
+                relationship = nc.models.BaseRelationshipModel(nc.graphdb.manager).load(bundle)
+                results.append(self._new_obj(relationship, node_handles))
             return results
         else:
             raise ImmediateHttpResponse(HttpResponseNotAllowed(['POST']))
@@ -493,6 +667,7 @@ class CableResource(NodeHandleResource):
     end_points = fields.ListField(help_text='[{"device": "", "device_type": "", "port": ""},]', blank=True, null=True)
 
     class Meta:
+        paginator_class = NodeHandlePaginator
         queryset = NodeHandle.objects.filter(node_type__slug__exact='cable')
         resource_name = 'cable'
         pk_field = 'node_name'
@@ -671,6 +846,7 @@ class NordunetCableResource(CableResource):
 
 class CustomerResource(NodeHandleResource):
     class Meta:
+        paginator_class = NodeHandlePaginator
         queryset = NodeHandle.objects.filter(node_type__slug__exact='customer')
         resource_name = 'customer'
         pk_field = 'node_name'
@@ -685,6 +861,7 @@ class CustomerResource(NodeHandleResource):
 
 class EndUserResource(NodeHandleResource):
     class Meta:
+        paginator_class = NodeHandlePaginator
         queryset = NodeHandle.objects.filter(node_type__slug__exact='end-user')
         resource_name = 'end-user'
         pk_field = 'node_name'
@@ -700,6 +877,7 @@ class EndUserResource(NodeHandleResource):
 class ExternalEquipmentResource(NodeHandleResource):
 
     class Meta:
+        paginator_class = NodeHandlePaginator
         queryset = NodeHandle.objects.filter(node_type__slug__exact='external-equipment')
         resource_name = 'external-equipment'
         authentication = ApiKeyAuthentication()
@@ -713,6 +891,7 @@ class ExternalEquipmentResource(NodeHandleResource):
 class FirewallResource(NodeHandleResource):
 
     class Meta:
+        paginator_class = NodeHandlePaginator
         queryset = NodeHandle.objects.filter(node_type__slug__exact='firewall')
         resource_name = 'firewall'
         authentication = ApiKeyAuthentication()
@@ -726,6 +905,7 @@ class FirewallResource(NodeHandleResource):
 class HostResource(NodeHandleResource):
 
     class Meta:
+        paginator_class = NodeHandlePaginator
         queryset = NodeHandle.objects.filter(node_type__slug__exact='host')
         resource_name = 'host'
         authentication = ApiKeyAuthentication()
@@ -739,6 +919,7 @@ class HostResource(NodeHandleResource):
 class HostProviderResource(NodeHandleResource):
 
     class Meta:
+        paginator_class = NodeHandlePaginator
         queryset = NodeHandle.objects.filter(node_type__slug__exact='host-provider')
         resource_name = 'host-provider'
         authentication = ApiKeyAuthentication()
@@ -752,6 +933,7 @@ class HostProviderResource(NodeHandleResource):
 class HostServiceResource(NodeHandleResource):
 
     class Meta:
+        paginator_class = NodeHandlePaginator
         queryset = NodeHandle.objects.filter(node_type__slug__exact='host-service')
         resource_name = 'host-service'
         authentication = ApiKeyAuthentication()
@@ -765,6 +947,7 @@ class HostServiceResource(NodeHandleResource):
 class HostUserResource(NodeHandleResource):
 
     class Meta:
+        paginator_class = NodeHandlePaginator
         queryset = NodeHandle.objects.filter(node_type__slug__exact='host-user')
         resource_name = 'host-user'
         authentication = ApiKeyAuthentication()
@@ -778,6 +961,7 @@ class HostUserResource(NodeHandleResource):
 class ODFResource(NodeHandleResource):
 
     class Meta:
+        paginator_class = NodeHandlePaginator
         queryset = NodeHandle.objects.filter(node_type__slug__exact='odf')
         resource_name = 'odf'
         authentication = ApiKeyAuthentication()
@@ -791,6 +975,7 @@ class ODFResource(NodeHandleResource):
 class OpticalLinkResource(NodeHandleResource):
 
     class Meta:
+        paginator_class = NodeHandlePaginator
         queryset = NodeHandle.objects.filter(node_type__slug__exact='optical-link')
         resource_name = 'optical-link'
         authentication = ApiKeyAuthentication()
@@ -803,6 +988,7 @@ class OpticalLinkResource(NodeHandleResource):
 
 class OpticalMultiplexSectionResource(NodeHandleResource):
     class Meta:
+        paginator_class = NodeHandlePaginator
         queryset = NodeHandle.objects.filter(node_type__slug__exact='optical-multiplex-section')
         resource_name = 'optical-multiplex-section'
         authentication = ApiKeyAuthentication()
@@ -816,6 +1002,7 @@ class OpticalMultiplexSectionResource(NodeHandleResource):
 class OpticalNodeResource(NodeHandleResource):
 
     class Meta:
+        paginator_class = NodeHandlePaginator
         queryset = NodeHandle.objects.filter(node_type__slug__exact='optical-node')
         resource_name = 'optical-node'
         authentication = ApiKeyAuthentication()
@@ -829,6 +1016,7 @@ class OpticalNodeResource(NodeHandleResource):
 class OpticalFilterResource(NodeHandleResource):
 
     class Meta:
+        paginator_class = NodeHandlePaginator
         queryset = NodeHandle.objects.filter(node_type__slug__exact='optical-filter')
         resource_name = 'optical-filter'
         authentication = ApiKeyAuthentication()
@@ -842,6 +1030,7 @@ class OpticalFilterResource(NodeHandleResource):
 class OpticalPathResource(NodeHandleResource):
 
     class Meta:
+        paginator_class = NodeHandlePaginator
         queryset = NodeHandle.objects.filter(node_type__slug__exact='optical-path')
         resource_name = 'optical-path'
         authentication = ApiKeyAuthentication()
@@ -855,6 +1044,7 @@ class OpticalPathResource(NodeHandleResource):
 class PDUResource(NodeHandleResource):
 
     class Meta:
+        paginator_class = NodeHandlePaginator
         queryset = NodeHandle.objects.filter(node_type__slug__exact='pdu')
         resource_name = 'pdu'
         authentication = ApiKeyAuthentication()
@@ -868,6 +1058,7 @@ class PDUResource(NodeHandleResource):
 class PeeringGroupResource(NodeHandleResource):
 
     class Meta:
+        paginator_class = NodeHandlePaginator
         queryset = NodeHandle.objects.filter(node_type__slug__exact='peering-group')
         resource_name = 'peering-group'
         authentication = ApiKeyAuthentication()
@@ -881,6 +1072,7 @@ class PeeringGroupResource(NodeHandleResource):
 class PeeringPartnerResource(NodeHandleResource):
 
     class Meta:
+        paginator_class = NodeHandlePaginator
         queryset = NodeHandle.objects.filter(node_type__slug__exact='peering-partner')
         resource_name = 'peering-partner'
         authentication = ApiKeyAuthentication()
@@ -894,6 +1086,7 @@ class PeeringPartnerResource(NodeHandleResource):
 class ProviderResource(NodeHandleResource):
 
     class Meta:
+        paginator_class = NodeHandlePaginator
         queryset = NodeHandle.objects.filter(node_type__slug__exact='provider')
         resource_name = 'provider'
         authentication = ApiKeyAuthentication()
@@ -907,6 +1100,7 @@ class ProviderResource(NodeHandleResource):
 class PortResource(NodeHandleResource):
 
     class Meta:
+        paginator_class = NodeHandlePaginator
         queryset = NodeHandle.objects.filter(node_type__slug__exact='port')
         resource_name = 'port'
         authentication = ApiKeyAuthentication()
@@ -920,6 +1114,7 @@ class PortResource(NodeHandleResource):
 class RackResource(NodeHandleResource):
 
     class Meta:
+        paginator_class = NodeHandlePaginator
         queryset = NodeHandle.objects.filter(node_type__slug__exact='rack')
         resource_name = 'rack'
         authentication = ApiKeyAuthentication()
@@ -933,6 +1128,7 @@ class RackResource(NodeHandleResource):
 class RouterResource(NodeHandleResource):
 
     class Meta:
+        paginator_class = NodeHandlePaginator
         queryset = NodeHandle.objects.filter(node_type__slug__exact='router')
         resource_name = 'router'
         authentication = ApiKeyAuthentication()
@@ -957,6 +1153,7 @@ class ServiceResource(NodeHandleResource):
         help_text='Choices: In service, Reserved, Decommissioned, Testing')
 
     class Meta:
+        paginator_class = NodeHandlePaginator
         queryset = NodeHandle.objects.filter(node_type__slug__exact='service')
         resource_name = 'service'
         pk_field = 'node_name'
@@ -1453,6 +1650,7 @@ class ServiceIPCLOSResource(ServiceResource):
 class SiteResource(NodeHandleResource):
 
     class Meta:
+        paginator_class = NodeHandlePaginator
         queryset = NodeHandle.objects.filter(node_type__slug__exact='site')
         resource_name = 'site'
         authentication = ApiKeyAuthentication()
@@ -1466,6 +1664,7 @@ class SiteResource(NodeHandleResource):
 class SiteOwnerResource(NodeHandleResource):
 
     class Meta:
+        paginator_class = NodeHandlePaginator
         queryset = NodeHandle.objects.filter(node_type__slug__exact='site-owner')
         resource_name = 'site-owner'
         authentication = ApiKeyAuthentication()
@@ -1478,6 +1677,7 @@ class SiteOwnerResource(NodeHandleResource):
 
 class SwitchResource(NodeHandleResource):
     class Meta:
+        paginator_class = NodeHandlePaginator
         queryset = NodeHandle.objects.filter(node_type__slug__exact='switch')
         resource_name = 'switch'
         authentication = ApiKeyAuthentication()
@@ -1491,6 +1691,7 @@ class SwitchResource(NodeHandleResource):
 class UnitResource(NodeHandleResource):
 
     class Meta:
+        paginator_class = NodeHandlePaginator
         queryset = NodeHandle.objects.filter(node_type__slug__exact='unit')
         resource_name = 'unit'
         authentication = ApiKeyAuthentication()
@@ -15,4 +15,6 @@ class NOCLookConfig(AppConfig):
         registry.register(Group)
         registry.register(Comment)
         registry.register(self.get_model('Nodehandle'))
+        from . import url_map  # noqa: F401, connects the NodeHandle signals
+        from . import report_cache  # noqa: F401, invalidates reports on graphdb writes
 
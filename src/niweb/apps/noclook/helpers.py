@@ -10,10 +10,15 @@ from django.conf import settings as django_settings
 from django.shortcuts import get_object_or_404
 from django.http import HttpResponse
 from django.core.exceptions import ObjectDoesNotExist
+from django.db import transaction
 from django.core.mail import EmailMessage
+from django_comments.models import Comment
 from datetime import datetime, timedelta
 from actstream.models import action_object_stream, target_stream
 from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
+from functools import wraps
+from contextlib import contextmanager
+import threading
 import csv
 import xlwt
 import re
@@ -21,7 +26,7 @@ import os
 from neo4j.v1.types import Node
 
 from .models import NodeHandle, NodeType
-from . import activitylog
+from . import activitylog, report_cache, url_map
 import graphdb as nc
 from graphdb.exceptions import UniqueNodeError, NodeNotFound
 
@@ -92,6 +97,58 @@ def delete_relationship(user, relationship_id):
     return True
 
 
+def get_delete_cascade(handle_ids):
+    """
+    Returns the handle_ids and the handle_ids of all nodes delete_node would delete with them, the nodes Has and
+    Part_of children of Physical nodes and the Has children of Location nodes.
+    """
+    q = """
+        UNWIND $handle_ids AS handle_id
+        MATCH (n:Node {handle_id: handle_id})
+        OPTIONAL MATCH (n)-[:Has]->(has_child:Node) WHERE n:Physical OR n:Location
+        OPTIONAL MATCH (n)<-[:Part_of]-(part_of_child:Node) WHERE n:Physical
+        RETURN collect(DISTINCT has_child.handle_id) + collect(DISTINCT part_of_child.handle_id) AS children
+        """
+    result = list(dict.fromkeys(handle_ids))
+    seen = set(result)
+    new = result
+    while new:
+        children = nc.query_to_dict(nc.graphdb.manager, q, handle_ids=new).get('children', [])
+        new = [handle_id for handle_id in dict.fromkeys(children) if handle_id not in seen]
+        seen.update(new)
+        result += new
+    return result
+
+
+def delete_nodes(user, handle_ids, batch_size=1000):
+    """
+    Bulk version of delete_node, deletes the nodes, their children, node handles and comments with a few statements
+    per batch.
+
+    :return: Number of deleted node handles
+    :rtype: int
+    """
+    handle_ids = get_delete_cascade(handle_ids)
+    node_handles = list(NodeHandle.objects.filter(pk__in=handle_ids))
+    activitylog.bulk_delete_nodes(user, node_handles)
+    nc.delete_nodes(nc.graphdb.manager, handle_ids, batch_size)
+    Comment.objects.filter(object_pk__in=[str(handle_id) for handle_id in handle_ids]).delete()
+    NodeHandle.objects.filter(pk__in=handle_ids).delete()
+    return len(node_handles)
+
+
+def delete_relationships(user, relationship_ids, batch_size=1000):
+    """
+    Bulk version of delete_relationship.
+
+    :return: Number of deleted relationships
+    :rtype: int
+    """
+    deleted = nc.delete_relationships(nc.graphdb.manager, relationship_ids, batch_size)
+    activitylog.bulk_delete_relationship(user, deleted)
+    return len(deleted)
+
+
 def get_provider_id(provider_name):
     """
     Get a node id to be able to provide a forms initial with a default provider.
@@ -107,6 +164,19 @@ def get_provider_id(provider_name):
     return provider_id
 
 
+def neo4j_unit_of_work(func):
+    """
+    Runs all Neo4j queries made by the decorated function in one transaction that is committed when the function
+    returns, or rolled back if it raises. Activity log actions are batched and written after the transaction ends.
+    SQL writes are made in a database transaction that is rolled back if the Neo4j transaction fails.
+    """
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        with transaction.atomic(), activitylog.batch(), nc.graphdb.manager.unit_of_work():
+            return func(*args, **kwargs)
+    return wrapper
+
+
 def is_empty_value(value):
     """Check if a value is considered empty."""
     if value is None:
@@ -123,6 +193,7 @@ def has_key_in_node_data(node, key):
         return False
 
 
+@neo4j_unit_of_work
 def form_update_node(user, handle_id, form, property_keys=None):
     """
     Take a node, a form and the property keys that should be used to fill the
@@ -152,6 +223,7 @@ def form_update_node(user, handle_id, form, property_keys=None):
 
     # Protected keys that should never be deleted
     PROTECTED_KEYS = {'name'}
+    set_properties, remove = {}, []
     for key in property_keys:
         value = form.cleaned_data.get(key, None)
         current_form_value = form.cleaned_data.get(key)
@@ -163,6 +235,7 @@ def form_update_node(user, handle_id, form, property_keys=None):
                 # Handle date serialization - override with ISO format if needed
                 if hasattr(current_form_value, 'isoformat'):
                     node.data[key] = current_form_value.isoformat()
+                set_properties[key] = node.data[key]
 
                 # Handle special name field update
                 if key == 'name' and hasattr(nh, 'node_name'):
@@ -171,33 +244,50 @@ def form_update_node(user, handle_id, form, property_keys=None):
         # Handle empty/null values - delete existing keys (except protected ones)
         elif (is_empty_value(value) and has_key_in_node_data(node, key) and key not in PROTECTED_KEYS):
             del node.data[key]
+            remove.append(key)
             activitylog.update_node_property(user, nh, key, pre_value, current_form_value)
-    nc.set_node_properties(nc.graphdb.manager, node.handle_id, node.data)
+    if set_properties or remove:
+        nc.update_node_properties(nc.graphdb.manager, node.handle_id, set=set_properties, remove=remove)
     return True
 
 
-def dict_update_node(user, handle_id, properties, keys=None, filtered_keys=list()):
-    nh, node = get_nh_node(handle_id)
+def node_property_changes(data, properties, keys=None, filtered_keys=list()):
+    """
+    Applies properties to the node data dict, values that are set (or 0) replace the current value and empty strings
+    remove the key. Returns the changes as (key, value_before, value_after) tuples.
+    """
+    changes = []
     if not keys:
         keys = properties.keys()
     for key in keys:
         if key in filtered_keys:
             continue
         if properties.get(key, None) or properties.get(key, None) == 0:
-            pre_value = node.data.get(key, '')
+            pre_value = data.get(key, '')
             if pre_value != properties[key]:
-                node.data[key] = properties[key]
-                if key == 'name':
-                    nh.node_name = properties[key]
-                nh.modifier = user
-                nh.save()
-                activitylog.update_node_property(user, nh, key, pre_value, properties[key])
-        elif properties.get(key, None) == '' and key in node.data.keys():
+                data[key] = properties[key]
+                changes.append((key, pre_value, properties[key]))
+        elif properties.get(key, None) == '' and key in data.keys():
             if key != 'name':  # Never delete name
-                pre_value = node.data.get(key, '')
-                del node.data[key]
-                activitylog.update_node_property(user, nh, key, pre_value, properties[key])
-    nc.set_node_properties(nc.graphdb.manager, handle_id, node.data)
+                changes.append((key, data.pop(key), properties[key]))
+    return changes
+
+
+@neo4j_unit_of_work
+def dict_update_node(user, handle_id, properties, keys=None, filtered_keys=list()):
+    nh, node = get_nh_node(handle_id)
+    set_properties, remove = {}, []
+    for key, pre_value, value in node_property_changes(node.data, properties, keys, filtered_keys):
+        if value == '':
+            remove.append(key)
+        else:
+            set_properties[key] = value
+        if key == 'name':
+            nh.node_name = value
+        # Saves the node handle, or updates it once when the batch is written
+        activitylog.update_node_property(user, nh, key, pre_value, value)
+    if set_properties or remove:
+        nc.update_node_properties(nc.graphdb.manager, handle_id, set=set_properties, remove=remove)
     return True
 
 
@@ -269,6 +359,66 @@ def get_or_create_site_unique_node_handle(user, node_name, slug, node_meta_type,
 
 
 
+class AutoManageBuffer(object):
+    """
+    Collects the nodes and relationships passed to set_noclook_auto_manage and update_noclook_auto_manage and
+    writes them with graphdb.touch_auto_managed, one statement per batch, when flushed.
+    """
+
+    def __init__(self):
+        # (auto_manage, keep_disabled) -> (handle_ids, relationship_ids), dicts keep the ids unique and ordered
+        self._pending = {}
+
+    def add(self, item, auto_manage=True, keep_disabled=False):
+        handle_ids, relationship_ids = self._pending.setdefault((auto_manage, keep_disabled), ({}, {}))
+        if isinstance(item, nc.models.BaseNodeModel):
+            handle_ids[item.handle_id] = None
+        elif isinstance(item, nc.models.BaseRelationshipModel):
+            relationship_ids[item.id] = None
+
+    def flush(self):
+        pending, self._pending = self._pending, {}
+        last_seen = datetime.now().isoformat()
+        for (auto_manage, keep_disabled), (handle_ids, relationship_ids) in pending.items():
+            nc.touch_auto_managed(nc.graphdb.manager, list(handle_ids), list(relationship_ids), auto_manage,
+                                  last_seen, keep_disabled)
+
+
+_auto_manage_local = threading.local()
+
+
+@contextmanager
+def deferred_auto_manage():
+    """
+    Defers the writes of set_noclook_auto_manage and update_noclook_auto_manage in the with block until it ends,
+    use it around everything a consumer does for one host or router. Nested blocks join the outermost one. Cached
+    reports are invalidated once, when the block ends.
+    """
+    buffer = getattr(_auto_manage_local, 'buffer', None)
+    if buffer is not None:
+        yield buffer
+        return
+    with report_cache.deferred():
+        _auto_manage_local.buffer = buffer = AutoManageBuffer()
+        try:
+            yield buffer
+        finally:
+            _auto_manage_local.buffer = None
+            buffer.flush()
+
+
+def _touch_auto_managed(item, auto_manage, last_seen, keep_disabled=False):
+    buffer = getattr(_auto_manage_local, 'buffer', None)
+    if buffer is not None:
+        buffer.add(item, auto_manage, keep_disabled)
+    elif isinstance(item, nc.models.BaseNodeModel):
+        nc.touch_auto_managed(nc.graphdb.manager, [item.handle_id], auto_manage=auto_manage, last_seen=last_seen,
+                              keep_disabled=keep_disabled)
+    elif isinstance(item, nc.models.BaseRelationshipModel):
+        nc.touch_auto_managed(nc.graphdb.manager, relationship_ids=[item.id], auto_manage=auto_manage,
+                              last_seen=last_seen, keep_disabled=keep_disabled)
+
+
 def set_noclook_auto_manage(item, auto_manage):
     """
     Sets the node or relationship noclook_auto_manage flag to True or False. 
@@ -282,15 +432,9 @@ def set_noclook_auto_manage(item, auto_manage):
         'noclook_auto_manage': auto_manage,
         'noclook_last_seen': datetime.now().isoformat()
     }
-    if isinstance(item, nc.models.BaseNodeModel):
-        node = nc.get_node_model(nc.graphdb.manager, item.handle_id)
-        node.data.update(auto_manage_data)
-        nc.set_node_properties(nc.graphdb.manager, node.handle_id, node.data)
-    elif isinstance(item, nc.models.BaseRelationshipModel):
-        relationship = nc.get_relationship_model(nc.graphdb.manager, item.id)
-        relationship.data.update(auto_manage_data)
-        nc.set_relationship_properties(nc.graphdb.manager, relationship.id, relationship.data)
-    
+    _touch_auto_managed(item, auto_manage, auto_manage_data['noclook_last_seen'])
+    item.data.update(auto_manage_data)
+
 
 def update_noclook_auto_manage(item):
     """
@@ -305,14 +449,8 @@ def update_noclook_auto_manage(item):
     if auto_manage or auto_manage is None:
         auto_manage_data['noclook_auto_manage'] = True
         auto_manage_data['noclook_last_seen'] = datetime.now().isoformat()
-        if isinstance(item, nc.models.BaseNodeModel):
-            node = nc.get_node_model(nc.graphdb.manager, item.handle_id)
-            node.data.update(auto_manage_data)
-            nc.set_node_properties(nc.graphdb.manager, node.handle_id, node.data)
-        elif isinstance(item, nc.models.BaseRelationshipModel):
-            relationship = nc.get_relationship_model(nc.graphdb.manager, item.id)
-            relationship.data.update(auto_manage_data)
-            nc.set_relationship_properties(nc.graphdb.manager, relationship.id, relationship.data)
+        _touch_auto_managed(item, True, auto_manage_data['noclook_last_seen'], keep_disabled=True)
+        item.data.update(auto_manage_data)
 
 
 def isots_to_dt(data):
@@ -574,6 +712,7 @@ def bulk_create_ports(parent_node, creator, num_ports=0, port_type='', offset=1,
         set_has(creator, parent_node, port_handle.handle_id)
 
 
+@neo4j_unit_of_work
 def logical_to_physical(user, handle_id):
     """
     :param user: Django user
@@ -602,6 +741,7 @@ def logical_to_physical(user, handle_id):
     return nh, physical_node
 
 
+@neo4j_unit_of_work
 def physical_to_logical(user, handle_id):
     """
     :param user: Django user
@@ -626,6 +766,28 @@ def physical_to_logical(user, handle_id):
     return nh, logical_node
 
 
+def _write_result_relationship(node, item, outgoing):
+    """
+    Builds the relationship model from a node set_* result without fetching it again.
+
+    :param node: norduniclient model the set_* method was called on
+    :param item: result item with created, relationship and node
+    :param outgoing: True if the relationship starts in node
+    :return: norduniclient relationship model, boolean
+    """
+    relationship = item.get('relationship')
+    other = item.get('node')
+    start, end = (node, other) if outgoing else (other, node)
+    bundle = {
+        'type': relationship.type,
+        'id': relationship.id,
+        'data': nc.neo4j_entity_to_dict(relationship),
+        'start': start.data,
+        'end': end.data,
+    }
+    return nc.models.BaseRelationshipModel(nc.graphdb.manager).load(bundle), item.get('created')
+
+
 def set_location(user, node, location_id):
     """
     :param user: Django user
@@ -637,9 +799,7 @@ def set_location(user, node, location_id):
     if node.meta_type == 'Logical':
         nh, node = logical_to_physical(user, node.handle_id)
     result = node.set_location(location_id)
-    relationship_id = result.get('Located_in')[0].get('relationship_id')
-    relationship = nc.get_relationship_model(nc.graphdb.manager, relationship_id)
-    created = result.get('Located_in')[0].get('created')
+    relationship, created = _write_result_relationship(node, result.get('Located_in')[0], outgoing=True)
     if created:
         activitylog.create_relationship(user, relationship)
     return relationship, created
@@ -664,9 +824,7 @@ def set_owner(user, node, owner_id):
     if not isinstance(owner_id, int):
         owner_id = owner_id['handle_id']
     result = node.set_owner(owner_id)
-    relationship_id = result.get('Owns')[0].get('relationship_id')
-    relationship = nc.get_relationship_model(nc.graphdb.manager, relationship_id)
-    created = result.get('Owns')[0].get('created')
+    relationship, created = _write_result_relationship(node, result.get('Owns')[0], outgoing=False)
     if created:
         activitylog.create_relationship(user, relationship)
     return relationship, created
@@ -682,9 +840,7 @@ def set_user(user, node, user_id):
     if not isinstance(user_id, int):
         user_id = user_id['handle_id']
     result = node.set_user(user_id)
-    relationship_id = result.get('Uses')[0].get('relationship_id')
-    relationship = nc.get_relationship_model(nc.graphdb.manager, relationship_id)
-    created = result.get('Uses')[0].get('created')
+    relationship, created = _write_result_relationship(node, result.get('Uses')[0], outgoing=False)
     if created:
         activitylog.create_relationship(user, relationship)
     return relationship, created
@@ -698,9 +854,7 @@ def set_provider(user, node, provider_id):
     :return: norduniclient model, boolean
     """
     result = node.set_provider(provider_id)
-    relationship_id = result.get('Provides')[0].get('relationship_id')
-    relationship = nc.get_relationship_model(nc.graphdb.manager, relationship_id)
-    created = result.get('Provides')[0].get('created')
+    relationship, created = _write_result_relationship(node, result.get('Provides')[0], outgoing=False)
     if created:
         activitylog.create_relationship(user, relationship)
     return relationship, created
@@ -717,9 +871,7 @@ def set_depends_on(user, node, dependency_id):
     if node.meta_type == 'Physical':
         nh, node = physical_to_logical(user, node.handle_id)
     result = node.set_dependency(dependency_id)
-    relationship_id = result.get('Depends_on')[0].get('relationship_id')
-    relationship = nc.get_relationship_model(nc.graphdb.manager, relationship_id)
-    created = result.get('Depends_on')[0].get('created')
+    relationship, created = _write_result_relationship(node, result.get('Depends_on')[0], outgoing=True)
     if created:
         activitylog.create_relationship(user, relationship)
     return relationship, created
@@ -733,9 +885,7 @@ def set_responsible_for(user, node, responsible_for_id):
     :return: norduniclient model, boolean
     """
     result = node.set_responsible_for(responsible_for_id)
-    relationship_id = result.get('Responsible_for')[0].get('relationship_id')
-    relationship = nc.get_relationship_model(nc.graphdb.manager, relationship_id)
-    created = result.get('Responsible_for')[0].get('created')
+    relationship, created = _write_result_relationship(node, result.get('Responsible_for')[0], outgoing=False)
     if created:
         activitylog.create_relationship(user, relationship)
     return relationship, created
@@ -749,9 +899,7 @@ def set_part_of(user, node, part_id):
     :return: norduniclient model, boolean
     """
     result = node.set_part_of(part_id)
-    relationship_id = result.get('Part_of')[0].get('relationship_id')
-    relationship = nc.get_relationship_model(nc.graphdb.manager, relationship_id)
-    created = result.get('Part_of')[0].get('created')
+    relationship, created = _write_result_relationship(node, result.get('Part_of')[0], outgoing=False)
     if created:
         activitylog.create_relationship(user, relationship)
     return relationship, created
@@ -765,14 +913,30 @@ def set_has(user, node, has_id):
     :return: norduniclient model, boolean
     """
     result = node.set_has(has_id)
-    relationship_id = result.get('Has')[0].get('relationship_id')
-    relationship = nc.get_relationship_model(nc.graphdb.manager, relationship_id)
-    created = result.get('Has')[0].get('created')
+    relationship, created = _write_result_relationship(node, result.get('Has')[0], outgoing=True)
     if created:
         activitylog.create_relationship(user, relationship)
     return relationship, created
 
 
+def set_relationships(user, relationships):
+    """
+    Bulk version of the set_* helpers, the relationships are merged with one statement per relationship type.
+
+    :param user: Django user
+    :param relationships: (handle_id, other_handle_id, rel_type) triples
+    :return: list of norduniclient model, boolean tuples
+    """
+    result = []
+    with activitylog.batch():
+        for bundle, created in nc.merge_relationships(nc.graphdb.manager, relationships):
+            relationship = nc.models.BaseRelationshipModel(nc.graphdb.manager).load(bundle)
+            if created:
+                activitylog.create_relationship(user, relationship)
+            result.append((relationship, created))
+    return result
+
+
 def set_connected_to(user, node, has_id):
     """
     :param user: Django user
@@ -781,9 +945,7 @@ def set_connected_to(user, node, has_id):
     :return: norduniclient model, boolean
     """
     result = node.set_connected_to(has_id)
-    relationship_id = result.get('Connected_to')[0].get('relationship_id')
-    relationship = nc.get_relationship_model(nc.graphdb.manager, relationship_id)
-    created = result.get('Connected_to')[0].get('created')
+    relationship, created = _write_result_relationship(node, result.get('Connected_to')[0], outgoing=True)
     if created:
         activitylog.create_relationship(user, relationship)
     return relationship, created
@@ -838,15 +1000,41 @@ def find_recursive(key, target):
         yield getattr(target, key)
 
 
+def _node_handle_id(item):
+    # Node models and NodeHandles have a handle_id attribute, neo4j nodes and node dicts a handle_id key
+    if isinstance(item, (dict, Node)):
+        return item.get('handle_id')
+    return getattr(item, 'handle_id', None)
+
+
+def collect_handle_ids(*args):
+    """
+    Returns the handle_ids in the shapes passed to get_node_urls: node models, NodeHandles, neo4j nodes and node
+    dicts, and lists, tuples and dicts of them. Dicts without a handle_id are query result rows, relationship dicts
+    like {'node': ..., 'relationship': ...}, {'data': ..., 'type': ...} report rows and rel_type or category -> list
+    dicts, their list, dict and node values are collected. The properties of a node are not looked into.
+
+    :rtype: set
+    """
+    handle_ids = set()
+    stack = list(args)
+    while stack:
+        target = stack.pop()
+        if isinstance(target, (list, tuple)):
+            stack.extend(target)
+            continue
+        handle_id = _node_handle_id(target)
+        if handle_id is not None:
+            handle_ids.add(handle_id)
+        elif isinstance(target, dict):
+            stack.extend(value for value in target.values()
+                         if isinstance(value, (list, tuple, dict, Node)) or hasattr(value, 'handle_id'))
+    return handle_ids
+
+
 def get_node_urls(*args):
-    ids = set()
-    for arg in args:
-        ids.update(find_recursive("handle_id", arg))
-    nodes = NodeHandle.objects.filter(handle_id__in=ids).select_related('node_type')
-    urls = {}
-    for n in nodes:
-        urls[n.handle_id] = n.get_absolute_url()
-    return urls
+    slugs = url_map.node_slugs.get_many(collect_handle_ids(*args))
+    return {handle_id: url_map.node_url(slug, handle_id) for handle_id, slug in slugs.items()}
 
 
 def paginate(full_list, page=None, per_page=250):
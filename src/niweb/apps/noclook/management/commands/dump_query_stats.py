@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+
+from django.core.management.base import BaseCommand, CommandError
+from graphdb.instrumentation import LATENCY_BUCKETS, load_dumps
+import graphdb as nc
+
+
+class Command(BaseCommand):
+    help = 'Prints the Cypher query fingerprints with the highest total time, collected from NEO4J_QUERY_STATS_DIR'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dir', help='Directory with query statistics, defaults to NEO4J_QUERY_STATS_DIR')
+        parser.add_argument('--limit', type=int, default=20, help='Number of fingerprints to print')
+        parser.add_argument('--order-by', default='total_ms', choices=['total_ms', 'max_ms', 'count', 'rows'])
+
+    def handle(self, *args, **options):
+        dump_dir = options['dir'] or nc.query_stats.dump_dir
+        if not dump_dir:
+            raise CommandError('Set NEO4J_QUERY_STATS_DIR or use --dir.')
+        buckets = ['<={}ms'.format(bound) for bound in LATENCY_BUCKETS] + ['>{}ms'.format(LATENCY_BUCKETS[-1])]
+        for entry in load_dumps(dump_dir, options['order_by'], options['limit']):
+            self.stdout.write('{total_ms:.0f} ms total, {count} runs, {max_ms:.0f} ms max, {rows} rows'.format(**entry))
+            histogram = ', '.join('{} {}'.format(b, n) for b, n in zip(buckets, entry['histogram']) if n)
+            self.stdout.write('    {}'.format(histogram))
+            self.stdout.write('    {}'.format(entry['fingerprint']))
@@ -0,0 +1,15 @@
+# -*- coding: utf-8 -*-
+
+from django.core.management.base import BaseCommand
+import graphdb as nc
+
+
+class Command(BaseCommand):
+    help = 'Recalculates the stored placement and location paths of all Physical and Location nodes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Nodes updated per transaction')
+
+    def handle(self, *args, **options):
+        updated = nc.rebuild_location_paths(nc.graphdb.manager, batch_size=options['batch_size'])
+        self.stdout.write('Updated location paths for {} nodes.'.format(updated))
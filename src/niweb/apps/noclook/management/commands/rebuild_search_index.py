@@ -0,0 +1,17 @@
+# -*- coding: utf-8 -*-
+
+from django.core.management.base import BaseCommand
+import graphdb as nc
+
+
+class Command(BaseCommand):
+    help = 'Recalculates the full-text search text, IP index and typeahead name properties of all nodes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Nodes updated per transaction')
+
+    def handle(self, *args, **options):
+        updated = nc.rebuild_search_text(nc.graphdb.manager, batch_size=options['batch_size'])
+        self.stdout.write('Updated search text and IP addresses for {} nodes.'.format(updated))
+        updated = nc.rebuild_typeahead(nc.graphdb.manager, batch_size=options['batch_size'])
+        self.stdout.write('Updated typeahead names for {} nodes.'.format(updated))
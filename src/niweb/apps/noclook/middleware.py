@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+import logging
+
+from django.conf import settings
+
+import graphdb as nc
+
+logger = logging.getLogger(__name__)
+
+
+class QueryStatsMiddleware:
+    """
+    Adds the number of Cypher statements run for the request, their total time in milliseconds and the number of
+    rows they returned as X-Neo4j-Queries, X-Neo4j-Query-Time and X-Neo4j-Rows response headers. The headers are
+    only added with DEBUG set or for staff users.
+
+    Statements run while a streaming response is sent happen after its headers, they are only logged when the
+    stream ends.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        nc.query_stats.begin_request()
+        try:
+            response = self.get_response(request)
+        except Exception:
+            nc.query_stats.end_request()
+            raise
+        if response.streaming and not getattr(response, 'is_async', False):
+            response.streaming_content = self._stream(request, response.streaming_content)
+            return response
+        totals = nc.query_stats.end_request()
+        if settings.DEBUG or getattr(getattr(request, 'user', None), 'is_staff', False):
+            response['X-Neo4j-Queries'] = totals['queries']
+            response['X-Neo4j-Query-Time'] = '{:.1f}'.format(totals['time_ms'])
+            response['X-Neo4j-Rows'] = totals['rows']
+        self._log(request, totals)
+        return response
+
+    def _stream(self, request, content):
+        try:
+            yield from content
+        finally:
+            self._log(request, nc.query_stats.end_request())
+
+    @staticmethod
+    def _log(request, totals):
+        if totals is not None:
+            logger.debug('%s: %d Cypher statements, %.1f ms, %d rows', request.path, totals['queries'],
+                         totals['time_ms'], totals['rows'])
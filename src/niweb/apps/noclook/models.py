@@ -1,5 +1,5 @@
 # -*- coding: utf-8 -*-
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import User
 from django_comments.signals import comment_was_posted, comment_was_flagged
 from django.dispatch import receiver
@@ -95,12 +95,19 @@ class NodeHandle(models.Model):
             #  A node associated with this handle_id already exists
             pass
 
+    def _node_exists(self):
+        q = 'MATCH (n:Node {handle_id: $handle_id}) RETURN count(n) AS nodes'
+        return nc.query_to_dict(nc.graphdb.manager, q, handle_id=self.handle_id).get('nodes', 0) > 0
+
     def save(self, *args, **kwargs):
         """
-        Create a new node and associate it to the handle.
+        Create a new node and associate it to the handle, or recreate the node of an existing handle if it is missing.
         """
+        adding = self._state.adding
         super(NodeHandle, self).save(*args, **kwargs)
-        self._create_node()
+        # A failing CREATE would abort an ongoing unit of work, check that the node is missing first
+        if adding or not self._node_exists():
+            self._create_node()
         return self
 
     save.alters_data = True
@@ -142,23 +149,45 @@ class UniqueIdGenerator(models.Model):
     def __str__(self):
         return self.name
 
+    def format_id(self, base_id):
+        """
+        Returns the id for a base id with the generators prefix, suffix and zero fill.
+        """
+        if self.zfill:
+            base_id = str(base_id).zfill(self.base_id_length)
+        return '%s%s%s' % (self.prefix or '', base_id, self.suffix or '')
+
     def get_id(self):
         """
         Returns the next id and increments the base_id field.
         """
-        base_id = self.base_id
-        if self.zfill:
-            base_id = str(self.base_id).zfill(self.base_id_length)
-        prefix = suffix = ''
-        if self.prefix:
-            prefix = self.prefix
-        if self.suffix:
-            suffix = self.suffix
-        unique_id = '%s%s%s' % (prefix, base_id, suffix)
-        self.last_id = unique_id
-        self.base_id += 1
-        self.save()
-        return unique_id
+        return self.get_ids(1)[0]
+
+    def get_ids(self, count):
+        """
+        Returns the next count ids and increments the base_id field by count. The generator row is locked while the
+        block is taken, so concurrent callers get separate ranges.
+
+        :param count: Number of ids, no ids are taken for counts below 1
+        :return: List of ids
+        """
+        if count < 1:
+            return []
+        with transaction.atomic():
+            generator = UniqueIdGenerator.objects.select_for_update().get(pk=self.pk)
+            unique_ids = [generator.format_id(base_id) for base_id in range(generator.base_id, generator.base_id + count)]
+            generator.advance(generator.base_id + count, unique_ids[-1])
+        self.base_id, self.last_id, self.next_id = generator.base_id, generator.last_id, generator.next_id
+        return unique_ids
+
+    def advance(self, base_id, last_id):
+        """
+        Sets the base_id and last_id fields of a generator locked with select_for_update.
+        """
+        self.base_id = base_id
+        self.last_id = last_id
+        self.save(update_fields=['base_id', 'last_id', 'next_id', 'modified'])
+    advance.alters_data = True
 
     def get_regex(self):
         prefix = suffix = ''
@@ -173,15 +202,7 @@ class UniqueIdGenerator(models.Model):
         """
         Increments the base_id.
         """
-        base_id = self.base_id
-        if self.zfill:
-            base_id = str(self.base_id).zfill(self.base_id_length)
-        prefix = suffix = ''
-        if self.prefix:
-            prefix = self.prefix
-        if self.suffix:
-            suffix = self.suffix
-        self.next_id = '%s%s%s' % (prefix, base_id, suffix)
+        self.next_id = self.format_id(self.base_id)
         super(UniqueIdGenerator, self).save(*args, **kwargs)
 
     save.alters_data = True
@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+"""
+Caches the results of whole-graph report queries in the default Django cache.
+
+Each result is stored under a key made from the report name, its parameters and a version per node type the report
+reads. Every node written through graphdb gives its type a new version, so the next request computes the report
+again. Versions are random tokens written with a plain set, so concurrent invalidations can not get lost on backends
+without atomic increments like the file backend. Writes inside deferred() give each type one new version when the
+block ends. Only one request per key computes a missing result, concurrent requests wait for it instead of running
+the same query. That lock uses cache.add, which is only atomic on backends like redis, with the file backend two
+requests can compute the same report.
+
+The versions live in the default cache. With a per-process backend like locmem a write only invalidates the reports
+cached by the writing process, other processes serve their results until REPORT_CACHE_TTL runs out. Use a shared
+backend (file or redis) when more than one process serves or writes nodes, the consumers included.
+"""
+
+import hashlib
+import json
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import cache
+from neo4j.v1.types import Node, Relationship
+
+import graphdb as nc
+from . import url_map
+from .models import NodeType
+
+REPORT_CACHE_TTL = getattr(settings, 'REPORT_CACHE_TTL', 60)
+LOCK_TIMEOUT = 30
+_MISSING = object()
+_local = threading.local()
+
+
+def _version_key(node_type):
+    return 'noclook:report-version:{}'.format(node_type)
+
+
+def _new_version():
+    return uuid.uuid4().hex[:12]
+
+
+def get_versions(node_types):
+    """
+    :param node_types: NodeType slugs
+    :return: Current version of each node type
+    :rtype: list
+    """
+    keys = [_version_key(node_type) for node_type in node_types]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            # Another process may set it first, use the version that was stored
+            cache.add(key, _new_version(), None)
+            versions[key] = cache.get(key)
+    return [versions[key] for key in keys]
+
+
+def invalidate(*node_types):
+    """
+    Gives the node types new versions, cached reports that read them are computed again.
+
+    :param node_types: NodeType slugs
+    """
+    pending = getattr(_local, 'pending', None)
+    if pending is not None:
+        pending['node_types'].update(node_types)
+    elif node_types:
+        cache.set_many({_version_key(node_type): _new_version() for node_type in set(node_types)}, None)
+
+
+def invalidate_nodes(handle_ids=(), node_type_ids=()):
+    """
+    Invalidates the node types of the nodes, connected to graphdb.write_listeners so every write through graphdb
+    invalidates the reports reading the written type. Node types are looked up in the handle_id map of url_map, not
+    with a query per write.
+
+    :param handle_ids: NodeHandle ids
+    :param node_type_ids: NodeType ids, for nodes whose NodeHandle is deleted
+    """
+    node_types = set()
+    if node_type_ids:
+        node_types.update(NodeType.objects.filter(pk__in=set(node_type_ids)).values_list('slug', flat=True))
+    pending = getattr(_local, 'pending', None)
+    if pending is not None:
+        pending['handle_ids'].update(handle_ids)
+    elif handle_ids:
+        node_types.update(url_map.node_slugs.get_many(handle_ids).values())
+    invalidate(*node_types)
+
+
+@contextmanager
+def deferred():
+    """
+    Collects the invalidations in the with block and gives each node type one new version when it ends, use it
+    around writes made node by node, like a consumer's. Nested blocks join the outermost one.
+    """
+    if getattr(_local, 'pending', None) is not None:
+        yield
+        return
+    _local.pending = pending = {'handle_ids': set(), 'node_types': set()}
+    try:
+        yield
+    finally:
+        _local.pending = None
+        if pending['handle_ids']:
+            pending['node_types'].update(url_map.node_slugs.get_many(pending['handle_ids']).values())
+        invalidate(*pending['node_types'])
+
+
+if invalidate_nodes not in nc.write_listeners:
+    nc.write_listeners.append(invalidate_nodes)
+
+
+def cached(name, node_types, compute, ttl=None, **params):
+    """
+    Returns the cached result of compute() for the report and params, or computes and caches it.
+
+    :param name: Report name
+    :param node_types: NodeType slugs of the nodes the report reads
+    :param compute: Function without arguments returning a picklable result
+    :param ttl: Seconds the result is cached, defaults to REPORT_CACHE_TTL
+    :param params: Parameters the result depends on
+    """
+    versions = '.'.join(str(v) for v in get_versions(node_types))
+    digest = hashlib.md5(json.dumps(params, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+    key = 'noclook:report:{}:{}:{}'.format(name, versions, digest)
+    value = cache.get(key, _MISSING)
+    if value is not _MISSING:
+        return value
+    lock = '{}:lock'.format(key)
+    if not cache.add(lock, 1, LOCK_TIMEOUT):
+        # Another request computes the result, wait for it
+        deadline = time.monotonic() + LOCK_TIMEOUT
+        while time.monotonic() < deadline:
+            time.sleep(0.1)
+            value = cache.get(key, _MISSING)
+            if value is not _MISSING:
+                return value
+    try:
+        value = compute()
+        cache.set(key, value, REPORT_CACHE_TTL if ttl is None else ttl)
+    finally:
+        cache.delete(lock)
+    return value
+
+
+def _to_python(value):
+    if isinstance(value, (Node, Relationship)):
+        return nc.neo4j_entity_to_dict(value)
+    if isinstance(value, dict):
+        return {k: _to_python(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_to_python(v) for v in value]
+    return value
+
+
+def query_to_list(node_types, query, **kwargs):
+    """
+    Cached version of graphdb.query_to_list, nodes and relationships in the result are returned as property dicts.
+
+    :param node_types: NodeType slugs of the nodes the query reads
+    """
+    def compute():
+        return _to_python(nc.query_to_list(nc.graphdb.manager, query, **kwargs))
+    return cached('query', node_types, compute, query=query, **kwargs)
@@ -9,8 +9,8 @@ def paginate_path(context, value, param="page"):
     """
     query = context['request'].GET.copy()
 
+    # Empty params are kept, the list filters are flags without a value
     query[param] = value
-    query = clean_queryparams(query)
     return query.urlencode()
   
 @register.simple_tag(takes_context=True)
@@ -5,11 +5,12 @@ try:
 except NameError:
     # Python 3 has reload in importlib
     from importlib import reload
-from django.test import TestCase, Client, tag
+from django.core.cache import cache
+from django.test import TestCase, TransactionTestCase, Client, tag
 from django.contrib.auth.models import User
 from apps.noclook.models import NodeHandle
 from dynamic_preferences.registries import global_preferences_registry
-from apps.noclook import forms, helpers
+from apps.noclook import forms, helpers, url_map
 from django.template.defaultfilters import slugify
 from apps.noclook.tests.testing import nc
 
@@ -17,8 +18,7 @@ from apps.noclook.tests.testing import nc
 global_preferences = global_preferences_registry.manager()
 
 
-@tag('db', 'neo4j')
-class NeoTestCase(TestCase):
+class NeoTestMixin(object):
 
     def setUp(self):
         # Create user
@@ -36,7 +36,10 @@ class NeoTestCase(TestCase):
     def tearDown(self):
         with nc.graphdb.manager.session as s:
             s.run("MATCH (a:Node) OPTIONAL MATCH (a)-[r]-(b) DELETE a, b, r")
-        super(NeoTestCase, self).tearDown()
+        nc.node_cache.clear()
+        cache.clear()
+        url_map.node_slugs.clear()
+        super(NeoTestMixin, self).tearDown()
 
     def get_full_url(self, what):
         if isinstance(what, NodeHandle):
@@ -76,3 +79,15 @@ class NeoTestCase(TestCase):
             creator=self.user,
             modifier=self.user,
         )
+
+
+@tag('db', 'neo4j')
+class NeoTestCase(NeoTestMixin, TestCase):
+    pass
+
+
+@tag('db', 'neo4j')
+class NeoTransactionTestCase(NeoTestMixin, TransactionTestCase):
+    """
+    For tests where other threads, with their own database connections, need to see the data.
+    """
@@ -1,5 +1,7 @@
 # -*- coding: utf-8 -*-
 
+import json
+
 from django.contrib.auth.models import User
 from tastypie.test import ResourceTestCaseMixin
 from django.test import TestCase
@@ -32,6 +34,7 @@ class ApiTest(ResourceTestCaseMixin, TestCase):
             nh.delete()
         with nc.graphdb.manager.session as s:
             s.run("MATCH (a:Node) OPTIONAL MATCH (a)-[r]-(b) DELETE a, b, r")
+        nc.node_cache.clear()
         super(ApiTest, self).tearDown()
 
     def get_credentials(self):
@@ -84,3 +87,88 @@ class ApiTest(ResourceTestCaseMixin, TestCase):
         self.assertIsNotNone(cable_node.data.get('name', None))
         connections = cable_node.get_connected_equipment()
         self.assertEqual(len(connections), 1)
+
+    def test_bulk_ticketinfo(self):
+        def create(name, node_type, meta_type):
+            return NodeHandle.objects.create(node_name=name, node_type=node_type, node_meta_type=meta_type,
+                                             creator=self.user, modifier=self.user)
+        unit_type = NodeType.objects.create(type='Unit', slug='unit')
+        service_type = NodeType.objects.create(type='Service', slug='service')
+        customer_type = NodeType.objects.create(type='Customer', slug='customer')
+        service = create('NU-S000001', service_type, 'Logical')
+        customer = create('Customer1', customer_type, 'Relation')
+        cables = []
+        for name in ['12345678', '87654321']:
+            cable = create(name, self.cable_node_type, 'Physical')
+            port = create('ge-{}'.format(name), self.port_node_type, 'Physical')
+            unit = create('0', unit_type, 'Logical')
+            nc.create_relationship(nc.graphdb.manager, cable.handle_id, port.handle_id, 'Connected_to')
+            nc.create_relationship(nc.graphdb.manager, unit.handle_id, port.handle_id, 'Part_of')
+            nc.create_relationship(nc.graphdb.manager, service.handle_id, unit.handle_id, 'Depends_on')
+            cables.append(cable)
+        nc.create_relationship(nc.graphdb.manager, customer.handle_id, service.handle_id, 'Uses')
+
+        resp = self.api_client.post('/api/v1/cable/ticketinfo/', format='json',
+                                    data={'handle_ids': [cables[0].handle_id], 'names': ['87654321', 'missing']},
+                                    authentication=self.get_credentials())
+        self.assertValidJSONResponse(resp)
+        result = self.deserialize(resp)
+        self.assertEqual(['12345678', '87654321'], [element['name'] for element in result['elements']])
+        self.assertEqual(['NU-S000001'], result['elements'][0]['service_ids'])
+        self.assertEqual(['NU-S000001'], result['total']['service_ids'])
+        self.assertEqual(['Customer1'], result['total']['impacted_users'])
+        self.assertEqual(['missing'], result['not_found'])
+
+        resp = self.api_client.get('/api/v1/cable/ticketinfo/', format='json', data={'name': '12345678'},
+                                   authentication=self.get_credentials())
+        self.assertEqual(['Customer1'], self.deserialize(resp)['total']['impacted_users'])
+
+    def test_list_relationships(self):
+        cable = NodeHandle.objects.create(node_name='12345678', node_type=self.cable_node_type,
+                                          node_meta_type='Physical', creator=self.user, modifier=self.user)
+        ports = []
+        for name in ['1', '2']:
+            port = NodeHandle.objects.create(node_name=name, node_type=self.port_node_type,
+                                             node_meta_type='Physical', creator=self.user, modifier=self.user)
+            nc.create_relationship(nc.graphdb.manager, cable.handle_id, port.handle_id, 'Connected_to')
+            ports.append(port)
+
+        resp = self.api_client.get('/api/v1/cable/{}/relationships/Connected_to/'.format(cable.node_name),
+                                   format='json', authentication=self.get_credentials())
+        self.assertValidJSONResponse(resp)
+        objects = self.deserialize(resp)['objects']
+        self.assertEqual(2, len(objects))
+        self.assertEqual(
+            sorted('/api/v1/port/{}/'.format(port.handle_id) for port in ports),
+            sorted(obj['end'] for obj in objects))
+        self.assertEqual({'/api/v1/cable/{}/'.format(cable.node_name)}, {obj['start'] for obj in objects})
+
+        resp = self.api_client.get('/api/v1/cable/{}/relationships/Has/'.format(cable.node_name),
+                                   format='json', authentication=self.get_credentials())
+        self.assertEqual([], self.deserialize(resp)['objects'])
+
+        resp = self.api_client.get('/api/v1/port/', format='json', authentication=self.get_credentials())
+        self.assertValidJSONResponse(resp)
+        objects = self.deserialize(resp)['objects']
+        self.assertEqual(['1', '2'], sorted(obj['node']['name'] for obj in objects))
+        self.assertEqual([1, 1], [len(obj['relationships']) for obj in objects])
+
+    def test_export(self):
+        ports = []
+        for name in ['1', '2', '3']:
+            ports.append(NodeHandle.objects.create(node_name=name, node_type=self.port_node_type,
+                                                   node_meta_type='Physical', creator=self.user, modifier=self.user))
+        NodeHandle.objects.create(node_name='12345678', node_type=self.cable_node_type, node_meta_type='Physical',
+                                  creator=self.user, modifier=self.user)
+
+        resp = self.api_client.get('/api/v1/port/export/?batch_size=2', authentication=self.get_credentials())
+        self.assertEqual(200, resp.status_code)
+        self.assertEqual('application/x-ndjson', resp['Content-Type'])
+        lines = [json.loads(line) for line in b''.join(resp.streaming_content).decode().splitlines()]
+        self.assertEqual([port.handle_id for port in ports], [line['handle_id'] for line in lines])
+        self.assertEqual(['1', '2', '3'], [line['node']['name'] for line in lines])
+
+        resp = self.api_client.get('/api/v1/port/export/?after={}'.format(ports[1].handle_id),
+                                   authentication=self.get_credentials())
+        lines = b''.join(resp.streaming_content).decode().splitlines()
+        self.assertEqual([ports[2].handle_id], [json.loads(line)['handle_id'] for line in lines])
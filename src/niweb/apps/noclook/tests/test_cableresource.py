@@ -86,6 +86,7 @@ class CableResourceTest(ResourceTestCaseMixin, TestCase):
             nh.delete()
         with nc.graphdb.manager.session as s:
             s.run("MATCH (a:Node) OPTIONAL MATCH (a)-[r]-(b) DELETE a, b, r")
+        nc.node_cache.clear()
         super(CableResourceTest, self).tearDown()
 
     def get_credentials(self):
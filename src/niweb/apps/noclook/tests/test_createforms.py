@@ -64,6 +64,7 @@ class FormTestCase(TestCase):
     def tearDown(self):
         with nc.graphdb.manager.session as s:
             s.run("MATCH (a:Node) OPTIONAL MATCH (a)-[r]-(b) DELETE a, b, r")
+        nc.node_cache.clear()
         super(FormTestCase, self).tearDown()
 
     def get_full_url(self, path):
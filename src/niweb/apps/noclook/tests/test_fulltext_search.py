@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+from unittest import mock
+
+from .neo4j_base import NeoTestCase
+from apps.noclook import helpers
+import graphdb as nc
+
+
+class FulltextSearchTest(NeoTestCase):
+
+    def setUp(self):
+        super(FulltextSearchTest, self).setUp()
+        self.router = self.create_node('uk-hex.nordu.net', 'router')
+        self.host = self.create_node('hex-backup', 'host')
+        self.port = self.create_node('ge-0/0/1', 'port')
+        self.site = self.create_node('UK-HEX', 'site', 'Location')
+        helpers.dict_update_node(self.user, self.port.handle_id, {'description': 'Uplink to HEX'})
+        helpers.dict_update_node(self.user, self.host.handle_id, {'ip_addresses': ['10.0.1.12', '2001:db8::12']})
+
+    def search(self, value, **kwargs):
+        return [n['name'] for n in nc.fulltext_search(nc.graphdb.manager, value, **kwargs)]
+
+    def test_title_match_ranking(self):
+        result = self.search('hex')
+        self.assertEqual(['hex-backup', 'UK-HEX', 'uk-hex.nordu.net', 'ge-0/0/1'], result)
+
+    def test_search_other_properties(self):
+        self.assertEqual(['ge-0/0/1'], self.search('uplink to'))
+        self.assertEqual(['hex-backup'], self.search('10.0.1.1'))
+        self.assertEqual(['hex-backup'], self.search('DB8::'))
+
+    def test_node_type_and_limit(self):
+        self.assertEqual(['UK-HEX'], self.search('hex', node_type='Site'))
+        self.assertEqual(['hex-backup', 'UK-HEX'], self.search('hex', limit=2))
+
+    def test_export_not_limited(self):
+        with mock.patch.object(nc, 'SEARCH_LIMIT', 1):
+            resp = self.client.get('/search/hex/result.csv')
+        self.assertEqual(200, resp.status_code)
+        self.assertContains(resp, 'uk-hex.nordu.net')
+        self.assertContains(resp, 'ge-0/0/1')
+
+    def test_prop(self):
+        result = list(nc.search_nodes_by_value(nc.graphdb.manager, 'hex', 'description'))
+        self.assertEqual(['ge-0/0/1'], [n['name'] for n in result])
+
+    def test_no_words(self):
+        self.assertEqual([], self.search('.*'))
+
+    def test_search_text_hidden(self):
+        node = self.port.get_node()
+        self.assertNotIn(nc.SEARCH_PROPERTY, node.data)
+        self.assertNotIn(nc.SEARCH_PROPERTY, nc.fulltext_search(nc.graphdb.manager, 'uplink')[0])
+
+    def test_rebuild_search_text(self):
+        with nc.graphdb.manager.session as s:
+            s.run('MATCH (n:Node) REMOVE n.{}'.format(nc.SEARCH_PROPERTY))
+        self.assertEqual([], self.search('uplink'))
+        self.assertEqual(4, nc.rebuild_search_text(nc.graphdb.manager, batch_size=3))
+        self.assertEqual(['ge-0/0/1'], self.search('uplink'))
@@ -1,6 +1,7 @@
 # -*- coding: utf-8 -*-
 from .neo4j_base import NeoTestCase
-from apps.noclook import helpers
+from apps.noclook import helpers, url_map
+from apps.noclook.models import NodeHandle
 from actstream.models import actor_stream
 from graphdb.exceptions import UniqueNodeError
 import graphdb as nc
@@ -57,3 +58,82 @@ class Neo4jHelpersTest(NeoTestCase):
         out = helpers.relationship_to_str(rel)
         expected = '(Router1 ({a_id}))-[{r_id}:Has]->(Port1 ({b_id}))'.format(a_id=nh1.handle_id, r_id=relationship_id, b_id=nh2.handle_id)
         self.assertEqual(expected, out)
+
+    def test_update_node_properties(self):
+        nh = self.create_node('router1.test.dev', 'router')
+        nc.set_node_properties(nc.graphdb.manager, nh.handle_id, {'name': 'router1.test.dev', 'model': 'MX',
+                                                                  'version': '21.4'})
+        data = nc.update_node_properties(nc.graphdb.manager, nh.handle_id, set={'description': 'Core router'},
+                                         remove=['version'])
+        self.assertEqual({'handle_id': nh.handle_id, 'name': 'router1.test.dev', 'model': 'MX',
+                          'description': 'Core router'}, data)
+        self.assertEqual([nh.handle_id], [n['handle_id'] for n in nc.search_nodes_by_value(
+            nc.graphdb.manager, 'Core router')])
+        self.assertEqual([], list(nc.search_nodes_by_value(nc.graphdb.manager, '21.4')))
+
+    def test_set_noclook_auto_manage(self):
+        nh = self.create_node('router1.test.dev', 'router')
+        node = nh.get_node()
+        nc.update_node_properties(nc.graphdb.manager, nh.handle_id, set={'model': 'MX'})
+        # The node model is stale, auto manage must not write its properties back
+        helpers.set_noclook_auto_manage(node, True)
+        data = nh.get_node().data
+        self.assertTrue(data['noclook_auto_manage'])
+        self.assertEqual('MX', data['model'])
+
+    def test_deferred_auto_manage(self):
+        router = self.create_node('router1.test.dev', 'router').get_node()
+        port = self.create_node('ge-0/0/1', 'port').get_node()
+        helpers.set_noclook_auto_manage(port, False)
+        with helpers.deferred_auto_manage():
+            helpers.set_noclook_auto_manage(router, True)
+            helpers.update_noclook_auto_manage(nc.get_node_model(nc.graphdb.manager, port.handle_id))
+            self.assertNotIn('noclook_auto_manage', nc.get_node(nc.graphdb.manager, router.handle_id))
+        data = nc.get_node(nc.graphdb.manager, router.handle_id)
+        self.assertTrue(data['noclook_auto_manage'])
+        # Disabled nodes are left as they are by update_noclook_auto_manage
+        self.assertFalse(nc.get_node(nc.graphdb.manager, port.handle_id)['noclook_auto_manage'])
+        # The search text follows the new timestamp
+        search_text = nc.query_to_dict(nc.graphdb.manager, 'MATCH (n:Node {handle_id: $handle_id}) RETURN n.%s AS text'
+                                       % nc.SEARCH_PROPERTY, handle_id=router.handle_id)['text']
+        self.assertEqual(['router1.test.dev', data['noclook_last_seen']], search_text.split('\n'))
+
+    def test_get_node_urls(self):
+        router = self.create_node('router1.test.dev', 'router')
+        port = self.create_node('ge-0/0/1', 'port')
+        results = [{'node': router.get_node(), 'ports': [{'handle_id': port.handle_id, 'name': 'ge-0/0/1'}]}]
+        self.assertEqual({router.handle_id, port.handle_id}, helpers.collect_handle_ids(results, 'text', None))
+
+        expected = {router.handle_id: router.get_absolute_url(), port.handle_id: port.get_absolute_url()}
+        self.assertEqual(expected, helpers.get_node_urls(results))
+        with self.assertNumQueries(0):
+            self.assertEqual(expected, helpers.get_node_urls(results))
+
+        port.delete()
+        self.assertEqual({router.handle_id: router.get_absolute_url()}, helpers.get_node_urls(results))
+
+    def test_collect_handle_ids_shapes(self):
+        router = self.create_node('router1.test.dev', 'router')
+        rows = [{'host_user': {'handle_id': 1, 'name': 'AwesomeCo', 'backup': {'handle_id': 99}},
+                 'hosts': [{'data': {'handle_id': 2, 'name': 'host'}, 'type': ['Logical']}]}]
+        relations = {'Has': [{'node': router.get_node(), 'relationship': object(), 'relationship_id': 3}]}
+        # Node properties are not looked into
+        self.assertEqual({1, 2, router.handle_id}, helpers.collect_handle_ids(rows, relations))
+
+    def test_get_node_urls_type_changed(self):
+        host = self.create_node('host1.test.dev', 'host', 'Logical')
+        results = [{'handle_id': host.handle_id}]
+        helpers.get_node_urls(results)
+        # Changes without signals, like those of other processes, are seen after invalidate
+        node_type = helpers.slug_to_node_type('firewall', create=True)
+        NodeHandle.objects.filter(pk=host.handle_id).update(node_type=node_type)
+        url_map.invalidate()
+        host.refresh_from_db()
+        self.assertEqual({host.handle_id: host.get_absolute_url()}, helpers.get_node_urls(results))
+
+        # or once the map has expired
+        node_type = helpers.slug_to_node_type('switch', create=True)
+        NodeHandle.objects.filter(pk=host.handle_id).update(node_type=node_type)
+        url_map.node_slugs._expires = 0
+        host.refresh_from_db()
+        self.assertEqual({host.handle_id: host.get_absolute_url()}, helpers.get_node_urls(results))
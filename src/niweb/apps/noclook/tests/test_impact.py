@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+from unittest import mock
+from .neo4j_base import NeoTestCase
+from apps.noclook import helpers
+import graphdb as nc
+
+
+class ImpactCacheTest(NeoTestCase):
+
+    def setUp(self):
+        super(ImpactCacheTest, self).setUp()
+        self.manager = nc.graphdb.manager
+        self.router = self.create_node('router1.test.dev', 'router')
+        self.port = helpers.create_port(self.router.get_node(), 'ge-0/0/1', self.user)
+        self.unit = self.create_node('0', 'unit', meta='Logical')
+        self.service = self.create_node('NU-S000001', 'service', meta='Logical')
+        helpers.set_part_of(self.user, self.port, self.unit.handle_id)
+        helpers.set_depends_on(self.user, self.service.get_node(), self.unit.handle_id)
+
+    def service_names(self, handle_id):
+        node = nc.get_node_model(self.manager, handle_id)
+        return [service['name'] for service in node.get_dependent_as_types()['services']]
+
+    def stored(self, handle_id, prop=nc.DEPENDENTS_CACHE):
+        q = 'MATCH (n:Node {handle_id: $handle_id}) RETURN n.%s AS summary' % prop
+        return nc.query_to_dict(self.manager, q, handle_id=handle_id)['summary']
+
+    def test_stored(self):
+        self.assertEqual(['NU-S000001'], self.service_names(self.router.handle_id))
+        self.assertIsNotNone(self.stored(self.router.handle_id))
+        # Read from the stored summary
+        self.assertEqual(['NU-S000001'], self.service_names(self.router.handle_id))
+        self.assertNotIn(nc.DEPENDENTS_CACHE, self.router.get_node().data)
+
+    def test_invalidated_on_new_dependency(self):
+        self.assertEqual(['NU-S000001'], self.service_names(self.router.handle_id))
+        service = self.create_node('NU-S000002', 'service', meta='Logical')
+        helpers.set_depends_on(self.user, service.get_node(), self.unit.handle_id)
+        self.assertIsNone(self.stored(self.router.handle_id))
+        self.assertEqual(['NU-S000001', 'NU-S000002'], sorted(self.service_names(self.router.handle_id)))
+
+    def test_invalidated_on_delete(self):
+        self.assertEqual(['NU-S000001'], self.service_names(self.port.handle_id))
+        dependencies = self.service.get_node().get_dependencies_as_types()
+        self.assertEqual(['0'], [node['name'] for node in dependencies['direct']])
+
+        relationship_id = self.service.get_node().get_dependencies()['Depends_on'][0]['relationship_id']
+        nc.delete_relationship(self.manager, relationship_id)
+        self.assertEqual([], self.service_names(self.port.handle_id))
+        self.assertIsNone(self.stored(self.service.handle_id, nc.DEPENDENCIES_CACHE))
+
+    def test_unrelated_kept(self):
+        other = self.create_node('router2.test.dev', 'router')
+        self.service_names(other.handle_id)
+        service = self.create_node('NU-S000002', 'service', meta='Logical')
+        helpers.set_depends_on(self.user, service.get_node(), self.unit.handle_id)
+        self.assertIsNotNone(self.stored(other.handle_id))
+
+    def test_expired_computed_again(self):
+        with mock.patch('graphdb.core.IMPACT_CACHE_TTL', -1):
+            self.assertEqual(['NU-S000001'], self.service_names(self.router.handle_id))
+        # Change the graph behind the back of graphdb, the expired summary is not used
+        q = 'MATCH (s:Node {handle_id: $handle_id})-[r:Depends_on]->() DELETE r'
+        self.query_to_list(q, handle_id=self.service.handle_id)
+        self.assertEqual([], self.service_names(self.router.handle_id))
+
+    def test_invalidated_while_computed(self):
+        service = self.create_node('NU-S000002', 'service', meta='Logical')
+
+        def compute():
+            result = {'services': [self.service.get_node().data]}
+            # A new dependency commits after the summary was computed
+            helpers.set_depends_on(self.user, service.get_node(), self.unit.handle_id)
+            return result
+        nc.get_impact(self.manager, self.router.handle_id, nc.DEPENDENTS_CACHE, compute)
+        self.assertIsNone(self.stored(self.router.handle_id))
+        self.assertEqual(['NU-S000001', 'NU-S000002'], sorted(self.service_names(self.router.handle_id)))
+
+    def test_has_only_invalidates_ancestors(self):
+        self.assertEqual(['NU-S000001'], self.service_names(self.router.handle_id))
+        self.service.get_node().get_dependencies_as_types()
+        helpers.create_port(self.router.get_node(), 'ge-0/0/2', self.user)
+        self.assertIsNone(self.stored(self.router.handle_id))
+        self.assertIsNotNone(self.stored(self.service.handle_id, nc.DEPENDENCIES_CACHE))
+
+    def test_dependents_bulk(self):
+        other = self.create_node('router2.test.dev', 'router')
+        handle_ids = [self.router.handle_id, self.port.handle_id, self.unit.handle_id, other.handle_id]
+        nc.query_stats.begin_request()
+        dependents = nc.get_dependents_bulk(self.manager, handle_ids)
+        # Stored summaries, one query per model (router, port and unit), storing and hydrating
+        self.assertEqual(6, nc.query_stats.end_request()['queries'])
+        for handle_id in handle_ids[:3]:
+            self.assertEqual(['NU-S000001'], [s['name'] for s in dependents[handle_id]['services']])
+            self.assertIsNotNone(self.stored(handle_id))
+        self.assertEqual([], dependents[other.handle_id].get('services', []))
+        self.assertEqual(dependents[self.router.handle_id]['services'][0]['handle_id'],
+                         nc.get_dependents_bulk(self.manager, [self.router.handle_id])[self.router.handle_id]
+                         ['services'][0]['handle_id'])
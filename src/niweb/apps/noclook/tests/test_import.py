@@ -1,5 +1,9 @@
+from unittest import mock
 from .neo4j_base import NeoTestCase
 from apps.noclook import helpers
+from apps.noclook.models import NodeHandle
+from graphdb.exceptions import NoRelationshipPossible
+import graphdb as nc
 import io
 
 
@@ -130,6 +134,24 @@ class ImportSiteTest(NeoTestCase):
         # Maybe we should have an error page instad?
         self.assertRedirects(resp, self.get_absolute_url(site))
 
+    def test_import_relationship_error_rolls_back(self):
+        error = NoRelationshipPossible(1, 'Location', 2, 'Physical', 'Has')
+        with mock.patch.object(helpers, 'set_relationships', side_effect=error):
+            resp, site = self.import_to_site({
+                "import": True,
+                "Rack1.node_type": "Rack",
+                "Rack1.name": "Sweet rack1",
+                "Rack1.rack_units": "48",
+                "Rack1.ODF1.node_type": "ODF",
+                "Rack1.ODF1.name": "TEST-ODF-01",
+            })
+        self.assertEqual(200, resp.status_code)
+        self.assertContains(resp, "Could not create the relationships")
+        # Neither the node handles nor the nodes are left behind
+        self.assertFalse(NodeHandle.objects.filter(node_name__in=["Sweet rack1", "TEST-ODF-01"]).exists())
+        q = 'MATCH (n:Node) WHERE n.name IN ["Sweet rack1", "TEST-ODF-01"] RETURN count(n) AS nodes'
+        self.assertEqual(0, nc.query_to_dict(nc.graphdb.manager, q)['nodes'])
+
     def import_to_site(self,data):
         site = self.create_site()
         resp = self.client.post(self.get_absolute_url(site)+"import", data)
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+from .neo4j_base import NeoTestCase
+from apps.nerds.lib import consumer_util
+from apps.noclook import helpers
+import graphdb as nc
+
+
+class IpLookupTest(NeoTestCase):
+
+    def setUp(self):
+        super(IpLookupTest, self).setUp()
+        self.manager = nc.graphdb.manager
+        self.host = self.create_node('host1.test.dev', 'host', meta='Logical')
+        nc.set_node_properties(self.manager, self.host.handle_id, {
+            'name': 'host1.test.dev',
+            'ip_addresses': ['10.0.0.1', '2001:DB8:0::1/64'],
+        })
+        self.unit = self.create_node('0', 'unit', meta='Logical')
+        nc.set_node_properties(self.manager, self.unit.handle_id, {
+            'name': '0',
+            'ip_addresses': ['10.0.0.10/24'],
+        })
+
+    def test_get_nodes_by_ip(self):
+        nodes = nc.get_nodes_by_ip(self.manager, '10.0.0.1')
+        self.assertEqual([self.host.handle_id], [node.handle_id for node in nodes])
+        nodes = nc.get_nodes_by_ip(self.manager, '2001:db8::1')
+        self.assertEqual([self.host.handle_id], [node.handle_id for node in nodes])
+        nodes = nc.get_nodes_by_ip(self.manager, '10.0.0.10')
+        self.assertEqual([self.unit.handle_id], [node.handle_id for node in nodes])
+        self.assertEqual([], nc.get_nodes_by_ip(self.manager, '10.0.0.10', 'Host'))
+        self.assertEqual([], nc.get_nodes_by_ip(self.manager, '10.0.0.2'))
+
+    def test_index_follows_updates(self):
+        nc.set_node_properties(self.manager, self.host.handle_id, {'name': 'host1.test.dev', 'ip_address': '10.0.0.2'})
+        self.assertEqual([], nc.get_nodes_by_ip(self.manager, '10.0.0.1'))
+        self.assertEqual(1, len(nc.get_nodes_by_ip(self.manager, '10.0.0.2')))
+
+    def test_find_host_updated_by_form(self):
+        host = self.create_node('host2.test.dev', 'host', meta='Logical')
+        helpers.dict_update_node(self.user, host.handle_id, {'ip_addresses': ['192.0.2.1', '192.0.2.2/28']})
+        nodes = nc.get_nodes_by_ip(self.manager, '192.0.2.2', 'Host')
+        self.assertEqual([host.handle_id], [node.handle_id for node in nodes])
+        record = self.query_to_list('MATCH (n:Node {handle_id: $handle_id}) RETURN n.ip_keys AS ip_keys',
+                                    handle_id=host.handle_id)[0]
+        self.assertEqual('192.0.2.1 192.0.2.2', record['ip_keys'])
+
+    def test_ip_keys_hidden(self):
+        self.assertNotIn(nc.IP_PROPERTY, self.host.get_node().data)
+
+    def test_normalize_ip(self):
+        self.assertEqual('fe80::1', nc.normalize_ip('FE80:0:0::1/64'))
+        with self.assertRaises(ValueError):
+            nc.normalize_ip('not an address')
+
+    def test_address_is_a(self):
+        self.assertTrue(consumer_util.address_is_a(['10.0.0.1'], ['Host']))
+        self.assertTrue(consumer_util.address_is_a(['10.0.0.3'], ['Host']))
+        self.assertFalse(consumer_util.address_is_a(['10.0.0.1', '10.0.0.10'], ['Host']))
@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+import copy
+import re
+from unittest import mock
+
+from actstream.models import action_object_stream
+from django.test import SimpleTestCase
+from .neo4j_base import NeoTestCase, NeoTransactionTestCase
+from apps.nerds.lib import expired_data, juniper_consumer
+from apps.nerds.lib.prefix_trie import PrefixTrie
+from apps.noclook.models import NodeHandle
+from neo4j.exceptions import TransientError
+import graphdb as nc
+
+
+INTERFACES = [
+    {'name': 'ge-0/0/1', 'description': 'Customer NU-S000001', 'units': [
+        {'unit': 0, 'description': 'Customer unit', 'address': ['10.0.0.1/30', 'FE80::1/64'], 'vlanid': 100},
+        {'unit': 1, 'description': 'Inactive unit', 'address': [], 'inactive': True},
+    ]},
+    {'name': 'ge-0/0/2', 'description': '', 'units': []},
+    {'name': 'lo0', 'description': 'Loopback', 'units': []},
+    {'name': 'ge-0/0/3', 'description': 'Inactive port', 'units': [], 'inactive': True},
+]
+
+
+def _jconf(name):
+    return {'host': {'juniper_conf': {
+        'name': name,
+        'version': '21.4',
+        'model': 'mx480',
+        'interfaces': copy.deepcopy(INTERFACES),
+        'bgp_peerings': [],
+    }}}
+
+
+class PrefixTrieTest(SimpleTestCase):
+
+    def test_longest_match(self):
+        prefixes = PrefixTrie()
+        prefixes.insert('10.0.0.0/8', 'a')
+        prefixes.insert('10.1.2.1/30', 'b')
+        prefixes.insert('2001:db8::1/64', 'c')
+        self.assertEqual('b', prefixes.longest_match('10.1.2.2')[1])
+        self.assertEqual('a', prefixes.longest_match('10.1.2.4')[1])
+        self.assertEqual('c', prefixes.longest_match('2001:db8::ffff')[1])
+        self.assertIsNone(prefixes.longest_match('192.168.0.1'))
+        self.assertIsNone(prefixes.longest_match('2001:db9::1'))
+
+    def test_first_value_kept(self):
+        prefixes = PrefixTrie()
+        self.assertTrue(prefixes.insert('10.0.0.1/30', 'a'))
+        self.assertFalse(prefixes.insert('10.0.0.2/30', 'b'))
+        self.assertEqual(1, len(prefixes))
+        self.assertEqual('a', prefixes.longest_match('10.0.0.3')[1])
+
+    def test_default_route(self):
+        prefixes = PrefixTrie()
+        prefixes.insert('0.0.0.0/0', 'default')
+        self.assertEqual('default', prefixes.longest_match('192.168.0.1')[1])
+
+
+class JuniperConsumerTest(NeoTestCase):
+
+    def graph_state(self, router_name):
+        q = """
+            MATCH (router:Router {name: $name})-[:Has]->(port:Port)
+            OPTIONAL MATCH (port)<-[:Part_of]-(unit:Unit)
+            WITH port, unit ORDER BY unit.name
+            RETURN port.name AS name, port.description AS description, port.noclook_auto_manage AS auto_manage,
+                   collect([unit.name, unit.description, unit.ip_addresses, unit.vlanid, unit.noclook_auto_manage])
+                   AS units
+            ORDER BY name
+            """
+        return nc.query_to_list(nc.graphdb.manager, q, name=router_name)
+
+    def test_bulk_matches_sequential(self):
+        juniper_consumer.consume_juniper_conf([_jconf('sequential.test.dev')])
+        juniper_consumer.consume_juniper_conf([_jconf('bulk.test.dev')], bulk=True)
+        sequential = self.graph_state('sequential.test.dev')
+        self.assertEqual(2, len(sequential))
+        self.assertEqual(sequential, self.graph_state('bulk.test.dev'))
+        unit = sequential[0]['units'][0]
+        self.assertEqual(['0', 'Customer unit', ['10.0.0.1/30', 'fe80::1/64'], 100, True], unit)
+
+    def test_bulk_update(self):
+        juniper_consumer.consume_juniper_conf([_jconf('bulk.test.dev')], bulk=True)
+        jconf = _jconf('bulk.test.dev')
+        jconf['host']['juniper_conf']['interfaces'][0]['description'] = 'Changed'
+        juniper_consumer.consume_juniper_conf([jconf], bulk=True)
+
+        state = self.graph_state('bulk.test.dev')
+        self.assertEqual(2, len(state))
+        self.assertEqual('Changed', state[0]['description'])
+        self.assertEqual(1, len(state[0]['units']))
+
+        port = NodeHandle.objects.get(node_name='ge-0/0/1')
+        history = [a.data['noclook'] for a in action_object_stream(port)]
+        self.assertIn({'action_type': 'node'}, history)
+        self.assertIn({'action_type': 'node_property', 'property': 'description',
+                       'value_before': 'Customer NU-S000001', 'value_after': 'Changed'}, history)
+
+    def test_bulk_keeps_concurrent_edits(self):
+        juniper_consumer.consume_juniper_conf([_jconf('bulk.test.dev')], bulk=True)
+        router = NodeHandle.objects.get(node_name='bulk.test.dev').get_node()
+        ports = juniper_consumer.get_router_ports(router)
+        port = ports['ge-0/0/2'][0]
+        # Edited through a form after the ports were read
+        nc.update_node_properties(nc.graphdb.manager, port['handle_id'], set={'comment': 'Edited'})
+        with mock.patch.object(juniper_consumer, 'get_router_ports', return_value=ports):
+            juniper_consumer.insert_juniper_interfaces_bulk(router, copy.deepcopy(INTERFACES))
+        self.assertEqual('Edited', nc.get_node(nc.graphdb.manager, port['handle_id']).data['comment'])
+
+    def test_auto_depend_services_bulk(self):
+        service = self.create_node('NU-S000001', 'service', meta='Logical')
+        port = self.create_node('ge-0/0/1', 'port')
+        nodes = [(port.handle_id, 'Customer NU-S000001 NU-S999999', 'Port')]
+        juniper_consumer.auto_depend_services_bulk(nodes, re.compile(r'(NU-S\d+)'))
+        juniper_consumer.auto_depend_services_bulk(nodes, re.compile(r'(NU-S\d+)'))
+
+        q = """
+            MATCH (s:Node {handle_id: $service})-[r:Depends_on]->(:Node {handle_id: $port})
+            RETURN count(r) AS dependencies
+            """
+        result = nc.query_to_dict(nc.graphdb.manager, q, service=service.handle_id, port=port.handle_id)
+        self.assertEqual(1, result['dependencies'])
+
+    def test_match_remote_ip_address(self):
+        juniper_consumer.consume_juniper_conf([_jconf('bulk.test.dev')], bulk=True)
+        unit, address = juniper_consumer.match_remote_ip_address('10.0.0.2')
+        self.assertEqual('0', unit.data['name'])
+        self.assertEqual('10.0.0.1/30', address)
+        self.assertEqual((None, None), juniper_consumer.match_remote_ip_address('10.0.0.5'))
+
+        # Units written during the run are picked up
+        interfaces = copy.deepcopy(INTERFACES)
+        interfaces[0]['units'][0]['address'] = ['10.0.0.5/30']
+        router = NodeHandle.objects.get(node_name='bulk.test.dev').get_node()
+        juniper_consumer.insert_juniper_interfaces_bulk(router, interfaces)
+        unit, address = juniper_consumer.match_remote_ip_address('10.0.0.6')
+        self.assertEqual('10.0.0.5/30', address)
+
+
+class JuniperWorkersTest(NeoTransactionTestCase):
+
+    graph_state = JuniperConsumerTest.graph_state
+
+    def test_workers_shared_service(self):
+        service = self.create_node('NU-S000001', 'service', meta='Logical')
+        jconfs = [_jconf('router1.test.dev'), _jconf('router2.test.dev')]
+        juniper_consumer.consume_juniper_conf(jconfs, bulk=True, workers=2)
+        self.assertEqual(self.graph_state('router1.test.dev'), self.graph_state('router2.test.dev'))
+        q = """
+            MATCH (:Node {handle_id: $service})-[:Depends_on]->(port:Port)
+            RETURN count(port) AS ports
+            """
+        self.assertEqual(2, nc.query_to_dict(nc.graphdb.manager, q, service=service.handle_id)['ports'])
+
+    def test_worker_retries_transient_errors(self):
+        insert = juniper_consumer.insert_juniper_device
+        calls = []
+
+        def deadlock_once(jconf, node_type, bulk):
+            calls.append(jconf['name'])
+            if len(calls) == 1:
+                raise TransientError('Deadlock detected')
+            insert(jconf, node_type, bulk)
+        jconf = _jconf('bulk.test.dev')['host']['juniper_conf']
+        with mock.patch.object(juniper_consumer, 'insert_juniper_device', side_effect=deadlock_once), \
+                mock.patch.object(juniper_consumer.time, 'sleep'):
+            juniper_consumer._insert_juniper_device_worker(jconf, 'Router', True)
+        self.assertEqual(2, len(calls))
+        self.assertEqual(2, len(self.graph_state('bulk.test.dev')))
+
+
+class ExpiredDataTest(NeoTestCase):
+
+    def test_remove_expired_router_data(self):
+        juniper_consumer.consume_juniper_conf([_jconf('bulk.test.dev')], bulk=True)
+        q = """
+            MATCH (:Router {name: 'bulk.test.dev'})-[:Has]->(port:Port {name: 'ge-0/0/2'})
+            SET port.noclook_last_seen = '2000-01-01T00:00:00'
+            RETURN port.handle_id AS handle_id
+            """
+        port = nc.query_to_dict(nc.graphdb.manager, q)['handle_id']
+
+        counts = expired_data.remove_expired_router_data(self.user, 24, dry_run=True)
+        self.assertEqual({'nodes': 1, 'relationships': 0}, counts)
+        self.assertTrue(NodeHandle.objects.filter(pk=port).exists())
+
+        counts = expired_data.remove_expired_router_data(self.user, 24, router_name='bulk.test.dev')
+        self.assertEqual(1, counts['nodes'])
+        self.assertFalse(NodeHandle.objects.filter(pk=port).exists())
+        with self.assertRaises(nc.exceptions.NodeNotFound):
+            nc.get_node(nc.graphdb.manager, port)
+        self.assertTrue(NodeHandle.objects.filter(node_name='ge-0/0/1').exists())
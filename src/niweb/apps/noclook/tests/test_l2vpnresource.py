@@ -131,6 +131,7 @@ class ServiceL2VPNResourceTest(ResourceTestCaseMixin, TestCase):
             nh.delete()
         with nc.graphdb.manager.session as s:
             s.run("MATCH (a:Node) OPTIONAL MATCH (a)-[r]-(b) DELETE a, b, r")
+        nc.node_cache.clear()
         super(ServiceL2VPNResourceTest, self).tearDown()
 
     def get_credentials(self):
@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+from .neo4j_base import NeoTestCase
+from apps.noclook import helpers
+import graphdb as nc
+
+
+class LocationPathTest(NeoTestCase):
+
+    def setUp(self):
+        super(LocationPathTest, self).setUp()
+        self.manager = nc.graphdb.manager
+        self.site = helpers.create_unique_node_handle(self.user, 'UK-HEX', 'site', 'Location')
+        self.room = helpers.get_generic_node_handle(self.user, 'Room 1', 'room', 'Location')
+        self.rack = helpers.get_generic_node_handle(self.user, 'A.01', 'rack', 'Location')
+        helpers.set_has(self.user, self.site.get_node(), self.room.handle_id)
+        helpers.set_has(self.user, self.room.get_node(), self.rack.handle_id)
+        self.odf = helpers.create_unique_node_handle(self.user, 'test-odf1', 'odf', 'Physical')
+        self.port = helpers.create_port(self.odf.get_node(), '1+2', self.user)
+        helpers.set_location(self.user, self.odf.get_node(), self.rack.handle_id)
+
+    def names(self, path):
+        return [node['name'] for node in path]
+
+    def test_paths(self):
+        self.assertEqual(['UK-HEX', 'Room 1'], self.names(self.rack.get_node().get_location_path()['location_path']))
+        self.assertEqual(['UK-HEX', 'Room 1', 'A.01'],
+                         self.names(self.odf.get_node().get_location_path()['location_path']))
+        self.assertEqual(['UK-HEX', 'Room 1', 'A.01', 'test-odf1'],
+                         self.names(self.port.get_location_path()['location_path']))
+        self.assertEqual(['test-odf1'], self.names(self.port.get_placement_path()['placement_path']))
+        self.assertEqual([], self.odf.get_node().get_placement_path()['placement_path'])
+
+    def test_hierarchy_change(self):
+        relationship_id = self.room.get_node().get_parent()['Has'][0]['relationship_id']
+        nc.delete_relationship(self.manager, relationship_id)
+        self.assertEqual(['Room 1', 'A.01', 'test-odf1'], self.names(self.port.get_location_path()['location_path']))
+
+        nc.delete_node(self.manager, self.rack.handle_id)
+        self.assertEqual([], self.port.get_location_path()['location_path'])
+
+    def test_rebuild(self):
+        with self.manager.session as s:
+            s.run('MATCH (n:Node) REMOVE n.placement_path, n.location_path')
+        self.assertEqual([], self.port.get_location_path()['location_path'])
+        self.assertEqual(5, nc.rebuild_location_paths(self.manager, batch_size=4))
+        self.assertEqual(['UK-HEX', 'Room 1', 'A.01', 'test-odf1'],
+                         self.names(self.port.get_location_path()['location_path']))
+
+    def test_hidden(self):
+        self.assertNotIn(nc.LOCATION_PATH, self.port.data)
+
+    def test_list_views(self):
+        resp = self.client.get('/odf/')
+        self.assertContains(resp, 'Room 1')
+        resp = self.client.get('/rack/')
+        self.assertContains(resp, 'UK-HEX')
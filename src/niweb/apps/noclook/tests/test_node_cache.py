@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+import threading
+from django.test import SimpleTestCase
+from django.urls import reverse
+from .neo4j_base import NeoTestCase
+from graphdb.cache import NodeBundleCache
+import graphdb as nc
+
+
+class NodeBundleCacheTest(SimpleTestCase):
+
+    def test_lru_eviction(self):
+        cache = NodeBundleCache(max_size=2, ttl=60)
+        cache.set(1, {'data': {'name': 'a'}})
+        cache.set(2, {'data': {'name': 'b'}})
+        cache.get(1)
+        cache.set(3, {'data': {'name': 'c'}})
+        self.assertIsNone(cache.get(2))
+        self.assertEqual('a', cache.get(1)['data']['name'])
+        self.assertEqual(1, cache.stats()['evictions'])
+
+    def test_ttl(self):
+        cache = NodeBundleCache(max_size=2, ttl=-1)
+        cache.set(1, {'data': {'name': 'a'}})
+        self.assertIsNone(cache.get(1))
+
+    def test_copies(self):
+        cache = NodeBundleCache()
+        bundle = {'data': {'name': 'a'}}
+        cache.set(1, bundle)
+        bundle['data']['name'] = 'b'
+        cache.get(1)['data']['name'] = 'c'
+        self.assertEqual('a', cache.get(1)['data']['name'])
+        stats = cache.stats()
+        self.assertEqual(2, stats['hits'])
+        self.assertEqual(0, stats['misses'])
+
+
+class NodeCacheTest(NeoTestCase):
+
+    def setUp(self):
+        super(NodeCacheTest, self).setUp()
+        self.manager = nc.graphdb.manager
+        self.router = self.create_node('router1.test.dev', 'router')
+        self.port = self.create_node('ge-0/0/1', 'port')
+
+    def test_hit(self):
+        nc.get_node_bundle(self.manager, self.router.handle_id)
+        hits = nc.node_cache.hits
+        bundle = nc.get_node_bundle(self.manager, self.router.handle_id)
+        self.assertEqual(hits + 1, nc.node_cache.hits)
+        self.assertEqual('router1.test.dev', bundle['data']['name'])
+
+    def test_invalidate_on_set_properties(self):
+        nc.get_node(self.manager, self.router.handle_id)
+        nc.set_node_properties(self.manager, self.router.handle_id, {'name': 'router1.test.dev', 'model': 'MX'})
+        self.assertEqual('MX', nc.get_node(self.manager, self.router.handle_id).get('model'))
+
+    def test_invalidate_on_label_change(self):
+        router = self.router.get_node()
+        router.change_meta_type('Logical')
+        self.assertEqual('Logical', nc.get_node_bundle(self.manager, self.router.handle_id)['meta_type'])
+
+    def test_invalidate_on_delete(self):
+        nc.get_node(self.manager, self.port.handle_id)
+        nc.delete_node(self.manager, self.port.handle_id)
+        with self.assertRaises(nc.exceptions.NodeNotFound):
+            nc.get_node(self.manager, self.port.handle_id)
+
+    def test_not_cached_in_unit_of_work(self):
+        with self.assertRaises(ValueError):
+            with self.manager.unit_of_work():
+                nc.set_node_properties(self.manager, self.router.handle_id, {'name': 'router1.test.dev', 'model': 'MX'})
+                nc.get_node(self.manager, self.router.handle_id)
+                raise ValueError('Roll back')
+        self.assertNotIn('model', nc.get_node(self.manager, self.router.handle_id))
+
+    def test_invalidate_on_commit(self):
+        with self.manager.unit_of_work():
+            nc.set_node_properties(self.manager, self.router.handle_id, {'name': 'router1.test.dev', 'model': 'MX'})
+            # Another thread caches the last committed state before the unit of work commits
+            reader = threading.Thread(target=nc.get_node, args=(self.manager, self.router.handle_id))
+            reader.start()
+            reader.join()
+        self.assertEqual('MX', nc.get_node(self.manager, self.router.handle_id).get('model'))
+
+    def test_update_properties_invalidate_on_commit(self):
+        nc.get_node(self.manager, self.router.handle_id)
+        with self.manager.unit_of_work():
+            nc.update_node_properties(self.manager, self.router.handle_id, set={'model': 'MX'})
+            reader = threading.Thread(target=nc.get_node, args=(self.manager, self.router.handle_id))
+            reader.start()
+            reader.join()
+        self.assertEqual('MX', nc.get_node(self.manager, self.router.handle_id).get('model'))
+
+    def test_stats_view(self):
+        nc.get_node(self.manager, self.router.handle_id)
+        resp = self.client.get(reverse('node_cache_stats'))
+        self.assertEqual(200, resp.status_code)
+        self.assertIn('hits', resp.json())
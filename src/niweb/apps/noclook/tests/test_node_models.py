@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+from .neo4j_base import NeoTestCase
+from apps.noclook import helpers
+import graphdb as nc
+
+
+class NodeModelsTest(NeoTestCase):
+
+    def setUp(self):
+        super(NodeModelsTest, self).setUp()
+        self.router = self.create_node('uk-hex.nordu.net', 'router')
+        self.router_node = self.router.get_node()
+
+    def get_port_nodes(self):
+        q = """
+            MATCH (:Node {handle_id: $handle_id})-[:Has]->(port:Port)
+            RETURN port
+            """
+        return [r['port'] for r in self.query_to_list(q, handle_id=self.router.handle_id)]
+
+    def test_get_node_model_class(self):
+        self.assertIs(nc.models.RouterModel, nc.get_node_model_class('Physical', ['Router']))
+        self.assertIs(nc.models.PeeringPartnerModel, nc.get_node_model_class('Relation', ['Peering_Partner']))
+        self.assertIs(nc.models.PhysicalModel, nc.get_node_model_class('Physical', ['Unknown_Type']))
+        self.assertIs(nc.models.BaseNodeModel, nc.get_node_model_class(None, ['Unknown_Type']))
+
+    def test_get_node_models(self):
+        helpers.bulk_create_ports(self.router_node, self.user, num_ports=3, port_type='LC')
+        site = self.create_node('UK-HEX', 'site', 'Location')
+        nodes = self.get_port_nodes() + [self.query_to_list('MATCH (n:Site) RETURN n')[0]['n']]
+
+        bulk = nc.get_node_models(nc.graphdb.manager, nodes)
+        single = [nc.get_node_model(nc.graphdb.manager, node=node) for node in nodes]
+        self.assertEqual([type(m) for m in single], [type(m) for m in bulk])
+        self.assertEqual([m.data for m in single], [m.data for m in bulk])
+        self.assertEqual([m.meta_type for m in single], [m.meta_type for m in bulk])
+        self.assertEqual([m.labels for m in single], [m.labels for m in bulk])
+        self.assertEqual(site.handle_id, bulk[-1].handle_id)
+
+    def test_get_ports(self):
+        helpers.bulk_create_ports(self.router_node, self.user, num_ports=3, port_type='LC')
+        ports = self.router_node.get_ports()['Has']
+        self.assertEqual(3, len(ports))
+        self.assertTrue(all(isinstance(p['node'], nc.models.PortModel) for p in ports))
+
+    def count_queries(self, f):
+        nc.query_stats.begin_request()
+        f()
+        return nc.query_stats.end_request()['queries']
+
+    def test_router_with_500_ports_round_trips(self):
+        helpers.bulk_create_ports(self.router_node, self.user, num_ports=500, port_type='LC')
+        small_router = self.create_node('se-tug.nordu.net', 'router').get_node()
+        helpers.bulk_create_ports(small_router, self.user, num_ports=1, port_type='LC')
+        nodes = self.get_port_nodes()
+        self.assertEqual(500, len(nodes))
+
+        # Hydrating already fetched nodes does not go back to the database
+        self.assertEqual(0, self.count_queries(lambda: nc.get_node_models(nc.graphdb.manager, nodes)))
+        # The number of statements does not grow with the number of ports
+        self.assertEqual(self.count_queries(small_router.get_ports), self.count_queries(self.router_node.get_ports))
@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+import tempfile
+import time
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.test import SimpleTestCase, override_settings
+from django.urls import reverse
+from .neo4j_base import NeoTestCase
+from graphdb.instrumentation import InstrumentedSession, QueryStats, fingerprint, load_dumps
+import graphdb as nc
+
+
+class QueryStatsTest(SimpleTestCase):
+
+    def test_fingerprint(self):
+        self.assertEqual('MATCH (n:Node {name: ?}) WHERE n.port = ? RETURN n LIMIT $limit',
+                         fingerprint("MATCH (n:Node {name: 'ge-0/0/1'})\n   WHERE n.port = 22 RETURN n LIMIT $limit"))
+        self.assertEqual(fingerprint('MATCH (n:Node {name: "a"}) RETURN n'),
+                         fingerprint('MATCH (n:Node {name: \'b\'}) RETURN n'))
+
+    def test_record(self):
+        stats = QueryStats(slow_query_ms=0)
+        stats.begin_request()
+        stats.record('MATCH (n {handle_id: 1}) RETURN n', 0.002, 1)
+        stats.record('MATCH (n {handle_id: 2}) RETURN n', 0.020, 1)
+        stats.record('MATCH (n) RETURN n', 0.001, 10)
+        self.assertEqual({'queries': 3, 'time_ms': 23.0, 'rows': 12}, stats.end_request())
+        self.assertIsNone(stats.end_request())
+
+        top = stats.stats(limit=1)[0]
+        self.assertEqual('MATCH (n {handle_id: ?}) RETURN n', top['fingerprint'])
+        self.assertEqual(2, top['count'])
+        self.assertAlmostEqual(20.0, top['max_ms'])
+        self.assertEqual([0, 1, 0, 1, 0, 0, 0, 0, 0], top['histogram'])
+
+    def test_run_time_included(self):
+        # Statements that block in run() are recorded with the time spent there
+        def run(statement, parameters=None):
+            time.sleep(0.02)
+            return mock.Mock(single=mock.Mock(return_value=None))
+        stats = QueryStats(slow_query_ms=0)
+        stats.begin_request()
+        InstrumentedSession(mock.Mock(run=run), stats).run('MATCH (n) RETURN n').single()
+        self.assertGreaterEqual(stats.end_request()['time_ms'], 20)
+
+    def test_load_dumps(self):
+        with tempfile.TemporaryDirectory() as dump_dir:
+            stats = QueryStats(dump_dir=dump_dir)
+            stats.record('MATCH (n) RETURN n', 0.01, 2)
+            stats.dump()
+            entries = load_dumps(dump_dir)
+        self.assertEqual(1, len(entries))
+        self.assertEqual(2, entries[0]['rows'])
+
+
+class QueryStatsMiddlewareTest(NeoTestCase):
+
+    def test_headers(self):
+        router = self.create_node('router1.test.dev', 'router')
+        nc.node_cache.invalidate(router.handle_id)
+        resp = self.client.get(router.get_absolute_url())
+        self.assertEqual(200, resp.status_code)
+        self.assertGreater(int(resp['X-Neo4j-Queries']), 0)
+        self.assertIn('X-Neo4j-Query-Time', resp)
+
+        resp = self.client.get(reverse('query_stats'))
+        self.assertEqual(200, resp.status_code)
+        self.assertTrue(resp.json()['fingerprints'])
+
+    def test_headers_staff_only(self):
+        router = self.create_node('router1.test.dev', 'router')
+        user = User.objects.create_user(username='viewer', password='test')
+        self.client.force_login(user)
+        resp = self.client.get(router.get_absolute_url())
+        self.assertEqual(200, resp.status_code)
+        self.assertNotIn('X-Neo4j-Queries', resp)
+
+        with override_settings(DEBUG=True):
+            resp = self.client.get(router.get_absolute_url())
+        self.assertIn('X-Neo4j-Queries', resp)
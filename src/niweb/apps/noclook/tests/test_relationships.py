@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+from .neo4j_base import NeoTestCase
+from apps.noclook import helpers
+from graphdb.exceptions import NoRelationshipPossible, NodeNotFound
+import graphdb as nc
+
+
+class CreateRelationshipTest(NeoTestCase):
+
+    def setUp(self):
+        super(CreateRelationshipTest, self).setUp()
+        self.manager = nc.graphdb.manager
+        self.site = self.create_node('UK-HEX', 'site', 'Location')
+        self.router = self.create_node('uk-hex.nordu.net', 'router', 'Physical')
+        self.port = self.create_node('ge-0/0/1', 'port', 'Physical')
+        self.service = self.create_node('NU-S000001', 'service', 'Logical')
+        self.customer = self.create_node('AwesomeCo', 'customer', 'Relation')
+
+    def test_create_relationship(self):
+        rel_id = nc.create_relationship(self.manager, self.router.handle_id, self.site.handle_id, 'Located_in')
+        relationship = nc.get_relationship_bundle(self.manager, rel_id)
+        self.assertEqual('Located_in', relationship['type'])
+        self.assertEqual(self.router.handle_id, relationship['start']['handle_id'])
+        self.assertEqual(self.site.handle_id, relationship['end']['handle_id'])
+
+    def test_create_relationship_not_possible(self):
+        with self.assertRaises(NoRelationshipPossible) as cm:
+            nc.create_relationship(self.manager, self.site.handle_id, self.router.handle_id, 'Located_in')
+        self.assertEqual('Location', cm.exception.meta_type1)
+        self.assertEqual('Physical', cm.exception.meta_type2)
+        with self.assertRaises(NoRelationshipPossible):
+            nc.create_logical_relationship(self.manager, self.service.handle_id, self.customer.handle_id, 'Depends_on')
+        with self.assertRaises(NoRelationshipPossible):
+            nc.create_relationship(self.manager, self.router.handle_id, self.port.handle_id, 'Unknown')
+        self.assertEqual([], nc.get_relationships(self.manager, self.site.handle_id, self.router.handle_id))
+
+    def test_create_relationship_node_not_found(self):
+        with self.assertRaises(NodeNotFound):
+            nc.create_relationship(self.manager, self.router.handle_id, -1, 'Has')
+
+    def test_create_relationships(self):
+        ids = nc.create_relationships(self.manager, [
+            (self.router.handle_id, self.site.handle_id, 'Located_in'),
+            (self.router.handle_id, self.port.handle_id, 'Has'),
+            (self.customer.handle_id, self.service.handle_id, 'Uses'),
+            (self.service.handle_id, self.port.handle_id, 'Depends_on'),
+        ])
+        self.assertEqual(4, len(ids))
+        types = [nc.get_relationship_bundle(self.manager, rel_id)['type'] for rel_id in ids]
+        self.assertEqual(['Located_in', 'Has', 'Uses', 'Depends_on'], types)
+
+    def test_create_relationships_rolls_back(self):
+        with self.assertRaises(NoRelationshipPossible):
+            nc.create_relationships(self.manager, [
+                (self.router.handle_id, self.port.handle_id, 'Has'),
+                (self.port.handle_id, self.customer.handle_id, 'Has'),
+            ])
+        self.assertEqual([], nc.get_relationships(self.manager, self.router.handle_id, self.port.handle_id))
+
+    def test_set_helper_relationship(self):
+        relationship, created = helpers.set_has(self.user, self.router.get_node(), self.port.handle_id)
+        self.assertTrue(created)
+        self.assertEqual('Has', relationship.type)
+        self.assertEqual(self.router.handle_id, relationship.start['handle_id'])
+        self.assertEqual(self.port.handle_id, relationship.end['handle_id'])
+        self.assertEqual(relationship, nc.get_relationship_model(self.manager, relationship.id))
+
+        relationship, created = helpers.set_owner(self.user, self.router.get_node(), self.customer.handle_id)
+        self.assertTrue(created)
+        self.assertEqual(self.customer.handle_id, relationship.start['handle_id'])
+        self.assertEqual(self.router.handle_id, relationship.end['handle_id'])
+
+        relationship, created = helpers.set_has(self.user, self.router.get_node(), self.port.handle_id)
+        self.assertFalse(created)
+
+    def test_set_relationships(self):
+        existing, created = helpers.set_has(self.user, self.router.get_node(), self.port.handle_id)
+        result = helpers.set_relationships(self.user, [
+            (self.router.handle_id, self.site.handle_id, 'Located_in'),
+            (self.router.handle_id, self.port.handle_id, 'Has'),
+        ])
+        self.assertEqual([('Located_in', True), ('Has', False)],
+                         [(relationship.type, created) for relationship, created in result])
+        self.assertEqual(existing.id, result[1][0].id)
+        self.assertEqual(self.site.handle_id, result[0][0].end['handle_id'])
+        self.assertEqual(1, len(nc.get_relationships(self.manager, self.router.handle_id, self.port.handle_id)))
@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+from .neo4j_base import NeoTestCase
+from apps.noclook import helpers
+import graphdb as nc
+
+
+class TypeaheadTest(NeoTestCase):
+
+    def setUp(self):
+        super(TypeaheadTest, self).setUp()
+        self.manager = nc.graphdb.manager
+        self.site = helpers.create_unique_node_handle(self.user, 'UK-HEX', 'site', 'Location')
+        self.rack = helpers.get_generic_node_handle(self.user, 'A.01', 'rack', 'Location')
+        helpers.set_has(self.user, self.site.get_node(), self.rack.handle_id)
+        self.odf = helpers.create_unique_node_handle(self.user, 'test-odf1', 'odf', 'Physical')
+        self.port = helpers.create_port(self.odf.get_node(), '1+2', self.user)
+
+    def port_names(self, query):
+        return [r['name'] for r in nc.typeahead_search(self.manager, query, prop=nc.TYPEAHEAD_PATH, labels=['Port'])]
+
+    def test_location_path(self):
+        result = nc.typeahead_search(self.manager, 'hex a.01', prop=nc.TYPEAHEAD_PATH, labels=['Location'])
+        self.assertEqual(['UK-HEX A.01'], [r['name'] for r in result])
+
+    def test_port_follows_location(self):
+        # Ports on equipment without a location are not listed
+        self.assertEqual([], self.port_names('odf 1+2'))
+        helpers.set_location(self.user, self.odf.get_node(), self.rack.handle_id)
+        self.assertEqual(['UK-HEX A.01 test-odf1 1+2'], self.port_names('odf 1+2'))
+
+        rack = self.rack.get_node()
+        nc.set_node_properties(self.manager, rack.handle_id, dict(rack.data, name='B.02'))
+        self.assertEqual(['UK-HEX B.02 test-odf1 1+2'], self.port_names('odf 1+2'))
+
+        relationship_id = rack.get_located_in()['Located_in'][0]['relationship_id']
+        nc.delete_relationship(self.manager, relationship_id)
+        self.assertEqual([], self.port_names('odf 1+2'))
+
+    def test_name_with_parent(self):
+        result = nc.typeahead_search(self.manager, 'odf1 1+2')
+        self.assertEqual([(self.port.handle_id, 'test-odf1 1+2', self.odf.handle_id)],
+                         [(r['handle_id'], r['name'], r['parent_id']) for r in result])
+        self.assertEqual([], nc.typeahead_search(self.manager, '1+2 odf1'))
+        self.assertEqual([], nc.typeahead_search(self.manager, 'odf1', exclude_labels=['Physical']))
+
+    def test_rebuild(self):
+        helpers.set_location(self.user, self.odf.get_node(), self.rack.handle_id)
+        with self.manager.session as s:
+            s.run('MATCH (n:Node) REMOVE n.typeahead_name, n.typeahead_path')
+        self.assertEqual([], self.port_names('odf 1+2'))
+        nc.rebuild_typeahead(self.manager, batch_size=2)
+        self.assertEqual(['UK-HEX A.01 test-odf1 1+2'], self.port_names('odf 1+2'))
+
+    def test_hidden(self):
+        self.assertNotIn(nc.TYPEAHEAD_NAME, self.port.data)
+
+    def test_limit_view(self):
+        helpers.create_port(self.odf.get_node(), '3+4', self.user)
+        resp = self.client.get('/search/typeahead/non-locations', {'query': 'odf1', 'limit': 1})
+        self.assertEqual(1, len(resp.json()))
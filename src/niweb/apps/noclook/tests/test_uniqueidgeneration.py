@@ -6,7 +6,8 @@ Created on 2014-06-26 1:40 PM
 """
 
 from django.test import TestCase
-from django.db import transaction, IntegrityError
+from django.db import connection, transaction, IntegrityError
+from django.test.utils import CaptureQueriesContext
 from django.contrib.auth.models import User
 from apps.noclook.models import UniqueIdGenerator, NordunetUniqueId
 from apps.noclook import unique_ids
@@ -68,6 +69,33 @@ class UniqueIdGeneration(TestCase):
         new_id = unique_ids.get_collection_unique_id(self.id_generator, self.id_collection)
         self.assertEqual(new_id, 'TEST-000201')
 
+    def test_reserve_sequence_block(self):
+        unique_ids.bulk_reserve_id_range(3, 4, self.id_generator, self.id_collection, 'Reserve message', self.user)
+        with CaptureQueriesContext(connection) as queries:
+            seq = unique_ids.reserve_id_sequence(1000, self.id_generator, self.id_collection, 'Reserve message',
+                                                 self.user)
+        self.assertLess(len(queries), 10)
+        self.assertEqual(1000, len(seq))
+        self.assertEqual(['TEST-000003', 'TEST-000004'], [r['unique_id'] for r in seq if r['error_message']])
+        self.assertEqual(1000, self.id_collection.objects.count())
+        self.assertEqual('TEST-001001', self.id_generator.next_id)
+        self.assertEqual(['TEST-001001', 'TEST-001002'], self.id_generator.get_ids(2))
+
+    def test_get_no_ids(self):
+        base_id = self.id_generator.base_id
+        with self.assertNumQueries(0):
+            self.assertEqual([], self.id_generator.get_ids(0))
+            self.assertEqual([], self.id_generator.get_ids(-1))
+        self.id_generator.refresh_from_db()
+        self.assertEqual(base_id, self.id_generator.base_id)
+
+    def test_reserve_range_conflicts(self):
+        unique_ids.bulk_reserve_id_range(5, 10, self.id_generator, self.id_collection, 'Reserve message', self.user)
+        with self.assertRaisesMessage(IntegrityError, 'TEST-000009, TEST-000010'):
+            unique_ids.bulk_reserve_id_range(1, 12, self.id_generator, self.id_collection, 'Reserve message',
+                                             self.user)
+        self.assertEqual(6, self.id_collection.objects.count())
+
     def test_register_reserved_id(self):
         unique_ids.bulk_reserve_id_range(1, 99, self.id_generator, self.id_collection, 'Reserve message', self.user)
         result = unique_ids.register_unique_id(self.id_collection, 'TEST-000001')
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from .neo4j_base import NeoTestCase
+from apps.noclook import activitylog, helpers
+from apps.noclook.models import NodeHandle
+import graphdb as nc
+
+
+class UnitOfWorkTest(NeoTestCase):
+
+    def setUp(self):
+        super(UnitOfWorkTest, self).setUp()
+        self.manager = nc.graphdb.manager
+        self.router = self.create_node('router1.test.dev', 'router')
+
+    def test_commit(self):
+        with self.manager.unit_of_work() as tx:
+            nc.set_node_properties(self.manager, self.router.handle_id, {'name': 'router1.test.dev', 'model': 'MX'})
+            # Reads in the unit of work see its own writes
+            self.assertEqual('MX', nc.get_node(self.manager, self.router.handle_id).get('model'))
+            with self.manager.session as s:
+                self.assertIs(tx, s)
+        self.assertIsNone(self.manager.bound_transaction)
+        self.assertEqual('MX', self.router.get_node().data.get('model'))
+
+    def test_rollback(self):
+        with self.assertRaises(ValueError):
+            with self.manager.unit_of_work():
+                nc.set_node_properties(self.manager, self.router.handle_id, {'name': 'router1.test.dev', 'model': 'MX'})
+                raise ValueError('Fail halfway')
+        self.assertIsNone(self.manager.bound_transaction)
+        self.assertNotIn('model', self.router.get_node().data)
+
+    def test_nested(self):
+        with self.assertRaises(ValueError):
+            with self.manager.unit_of_work():
+                helpers.dict_update_node(self.user, self.router.handle_id, {'model': 'MX'})
+                raise ValueError('Fail after inner unit of work')
+        self.assertNotIn('model', self.router.get_node().data)
+
+    def test_dict_update_node(self):
+        helpers.dict_update_node(self.user, self.router.handle_id, {'model': 'MX', 'version': '21.4'})
+        node = self.router.get_node()
+        self.assertEqual('MX', node.data.get('model'))
+        self.assertEqual('21.4', node.data.get('version'))
+
+    def test_batched_history(self):
+        switch = self.create_node('switch1.test.dev', 'switch')
+        properties = {'name': 'renamed.test.dev', 'model': 'MX', 'version': '21.4'}
+        for key, value in properties.items():
+            activitylog.update_node_property(self.user, switch, key, '', value)
+
+        with CaptureQueriesContext(connection) as queries:
+            helpers.dict_update_node(self.user, self.router.handle_id, properties)
+        updates = [q['sql'] for q in queries.captured_queries
+                   if q['sql'].startswith('UPDATE') and NodeHandle._meta.db_table in q['sql']]
+        self.assertEqual(1, len(updates))
+
+        router = NodeHandle.objects.get(pk=self.router.handle_id)
+        self.assertEqual('renamed.test.dev', router.node_name)
+        self.assertEqual(self.user, router.modifier)
+
+        def history(nh):
+            return [(a.verb, a.data['noclook']['property'], a.data['noclook']['value_after'])
+                    for a in helpers.get_history(nh)]
+        self.assertEqual(sorted(history(switch)), sorted(history(router)))
+        self.assertEqual(3, len(history(router)))
+
+    def test_batch_not_written_on_rollback(self):
+        with self.assertRaises(ValueError):
+            with activitylog.batch():
+                activitylog.update_node_property(self.user, self.router, 'model', '', 'MX')
+                raise ValueError('Roll back')
+        self.assertEqual([], list(helpers.get_history(self.router)))
+        # The next batch starts empty
+        with activitylog.batch() as batch:
+            self.assertEqual([], batch.actions)
+
+    def test_sql_rollback(self):
+        @helpers.neo4j_unit_of_work
+        def rename(handle_id):
+            nh = NodeHandle.objects.get(pk=handle_id)
+            nh.node_name = 'router2.test.dev'
+            nh.save()
+            raise ValueError('Neo4j transaction fails')
+
+        with self.assertRaises(ValueError):
+            rename(self.router.handle_id)
+        self.assertEqual('router1.test.dev', NodeHandle.objects.get(pk=self.router.handle_id).node_name)
+
+    def test_save_recreates_missing_node(self):
+        nc.delete_node(self.manager, self.router.handle_id)
+        self.router.save()
+        self.assertEqual('router1.test.dev', nc.get_node(self.manager, self.router.handle_id).get('name'))
+        # Saving a handle with a node does not touch it
+        self.router.save()
+        self.assertEqual(1, len(self.query_to_list('MATCH (n:Node {handle_id: $handle_id}) RETURN n',
+                                                   handle_id=self.router.handle_id)))
@@ -1,7 +1,8 @@
 from .neo4j_base import NeoTestCase
 from apps.noclook.helpers import set_user, set_noclook_auto_manage
-from apps.noclook import forms
+from apps.noclook import forms, report_cache, url_map
 from django.urls import reverse
+import graphdb as nc
 
 
 class ViewTest(NeoTestCase):
@@ -23,6 +24,48 @@ class ViewTest(NeoTestCase):
         self.assertEqual(table_rows[2].cols[0].get('handle_id'), router2.handle_id)
         self.assertEqual(table_rows[1].cols[0].get('handle_id'), router3.handle_id)
 
+    def test_router_list_pagination(self):
+        router1 = self.create_node('awesome-router.test.dev', 'router')
+        router2 = self.create_node('fine.test.dev', 'router')
+        router3 = self.create_node('different-router.test.dev', 'router')
+
+        resp = self.client.get('/router/', {'per_page': 2})
+        self.assertEqual(3, resp.context['page'].paginator.count)
+        table_rows = resp.context['table'].rows
+        self.assertEqual([router1.handle_id, router3.handle_id], [r.cols[0].get('handle_id') for r in table_rows])
+        self.assertNotContains(resp, router2.node_name)
+
+        resp = self.client.get('/router/', {'per_page': 2, 'page': 2})
+        table_rows = resp.context['table'].rows
+        self.assertEqual([router2.handle_id], [r.cols[0].get('handle_id') for r in table_rows])
+
+    def test_router_list_search_and_export(self):
+        router1 = self.create_node('awesome-router.test.dev', 'router')
+        router2 = self.create_node('fine.test.dev', 'router')
+        router3 = self.create_node('different-router.test.dev', 'router')
+
+        resp = self.client.get('/router/', {'q': 'ROUTER', 'per_page': 1})
+        self.assertEqual(2, resp.context['page'].paginator.count)
+        self.assertEqual([router1.handle_id], [r.cols[0].get('handle_id') for r in resp.context['table'].rows])
+
+        resp = self.client.get('/router/', {'per_page': 1, 'page': 2, 'all': ''})
+        self.assertEqual([router1.handle_id, router3.handle_id, router2.handle_id],
+                         [r.cols[0].get('handle_id') for r in resp.context['table'].rows])
+
+    def test_router_list_expired_filter(self):
+        router1 = self.create_node('awesome-router.test.dev', 'router')
+        router2 = self.create_node('fine.test.dev', 'router')
+        router2_node = router2.get_node()
+        router2_node.data.update({'noclook_auto_manage': True, 'noclook_last_seen': '2011-11-01T14:37:13.713434'})
+        nc.set_node_properties(nc.graphdb.manager, router2.handle_id, router2_node.data)
+
+        resp = self.client.get('/router/')
+        self.assertEqual([router1.handle_id], [r.cols[0].get('handle_id') for r in resp.context['table'].rows])
+
+        resp = self.client.get('/router/', {'show_expired': '', 'hide_current': ''})
+        self.assertEqual([router2.handle_id], [r.cols[0].get('handle_id') for r in resp.context['table'].rows])
+        self.assertEqual('expired', resp.context['table'].rows[0].classes)
+
     def test_host_detail_view(self):
         host = self.create_node('sweet-host.nordu.net', 'host')
 
@@ -73,5 +116,42 @@ class ViewTest(NeoTestCase):
 
         self.assertContains(resp, host.node_name)
 
+    def test_report_cache(self):
+        host_user = self.create_node('AwesomeCo', 'host-user', 'Relation')
+        host = self.create_node('sweet-host.nordu.net', 'host', 'Logical')
+        set_user(self.user, host.get_node(), host_user.handle_id)
+        url = reverse('host_users_report')
+        first = self.client.get(url)
+        cached = self.client.get(url)
+        self.assertContains(cached, host.node_name)
+        self.assertLess(int(cached['X-Neo4j-Queries']), int(first['X-Neo4j-Queries']))
+
+        # Writes through the activity log invalidate the cached report
+        other_host = self.create_node('other-host.nordu.net', 'host', 'Logical')
+        set_user(self.user, other_host.get_node(), host_user.handle_id)
+        resp = self.client.get(url)
+        self.assertContains(resp, other_host.node_name)
+
+        # So do writes that bypass it, like the consumers
+        nc.update_node_properties(nc.graphdb.manager, other_host.handle_id, set={'name': 'renamed-host.nordu.net'})
+        resp = self.client.get(url)
+        self.assertContains(resp, 'renamed-host.nordu.net')
+
+    def test_report_cache_invalidate_nodes(self):
+        host = self.create_node('sweet-host.nordu.net', 'host', 'Logical')
+        url_map.node_slugs.get_many([host.handle_id])
+        versions = report_cache.get_versions(['host'])
+        # Node types are found in the handle_id map, without queries
+        with self.assertNumQueries(0):
+            report_cache.invalidate_nodes([host.handle_id])
+        self.assertNotEqual(versions, report_cache.get_versions(['host']))
+
+        versions = report_cache.get_versions(['host'])
+        with report_cache.deferred():
+            report_cache.invalidate_nodes([host.handle_id])
+            report_cache.invalidate_nodes([host.handle_id])
+            self.assertEqual(versions, report_cache.get_versions(['host']))
+        self.assertNotEqual(versions, report_cache.get_versions(['host']))
+
     # import nodes? it is tested seperatly
 
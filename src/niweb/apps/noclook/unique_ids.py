@@ -45,18 +45,34 @@ def is_free_unique_id(unique_id_collection, unique_id):
     return False
 
 
-def get_collection_unique_id(unique_id_generator, unique_id_collection=NordunetUniqueId):
+def get_collection_unique_id(unique_id_generator, unique_id_collection=NordunetUniqueId, window=100):
     """
     Return the next available unique id by counting up the id generator until an available id is found
     in the unique id collection.
+
+    The generator is locked while the next window ids are checked with one query, the first free one is created and
+    the generator is moved past it.
     :param unique_id_generator: UniqueIdGenerator instance
     :param unique_id_collection: UniqueId subclass instance
+    :param window: Number of ids checked per query
     :return: String unique id
     """
-    created = False
-    while not created:
-        unique_id = unique_id_generator.get_id()
-        obj, created = unique_id_collection.objects.get_or_create(unique_id=unique_id)
+    with transaction.atomic():
+        generator = UniqueIdGenerator.objects.select_for_update().get(pk=unique_id_generator.pk)
+        base_id = generator.base_id
+        while True:
+            candidates = [generator.format_id(i) for i in range(base_id, base_id + window)]
+            taken = set(unique_id_collection.objects.filter(unique_id__in=candidates).values_list('unique_id', flat=True))
+            free = [i for i, candidate in enumerate(candidates) if candidate not in taken]
+            if free:
+                break
+            base_id += window
+        base_id += free[0]
+        unique_id = candidates[free[0]]
+        unique_id_collection.objects.create(unique_id=unique_id)
+        generator.advance(base_id + 1, unique_id)
+    unique_id_generator.base_id, unique_id_generator.last_id = generator.base_id, generator.last_id
+    unique_id_generator.next_id = generator.next_id
     return unique_id
 
 
@@ -79,7 +95,7 @@ def register_unique_id(unique_id_collection, unique_id):
 def bulk_reserve_id_range(start, end, unique_id_generator, unique_id_collection, reserve_message, reserver, site=None):
     """
     Reserves IDs start to end in the format used in the unique id generator in the unique id collection without
-    incrementing the unique ID generator.
+    incrementing the unique ID generator. Nothing is reserved if any of the IDs is already in the collection.
 
     bulk_reserve_ids(100, 102, nordunet_service_unique_id_generator, nordunet_unique_id_collection...) would try to
     reserve NU-S000100, NU-S000101 and NU-S000102 in the NORDUnet unique ID collection.
@@ -91,28 +107,28 @@ def bulk_reserve_id_range(start, end, unique_id_generator, unique_id_collection,
     :param reserve_message: String
     :param reserver: Django user object
     :return: List of reserved unique_id_collection objects.
+    :raises IntegrityError: Listing the IDs already in the collection.
     """
-    reserve_list = []
     prefix = suffix = ''
     if unique_id_generator.prefix:
         prefix = unique_id_generator.prefix
     if unique_id_generator.suffix:
         suffix = unique_id_generator.suffix
-    for unique_id in range(start, end+1):
-        reserve_list.append(unique_id_collection(
-            unique_id='%s%s%s' % (prefix, str(unique_id).zfill(unique_id_generator.base_id_length), suffix),
-            reserved=True,
-            reserve_message=reserve_message,
-            reserver=reserver,
-            site=site,
-        ))
+    unique_ids = ['%s%s%s' % (prefix, str(unique_id).zfill(unique_id_generator.base_id_length), suffix)
+                  for unique_id in range(start, end+1)]
+    taken = list(unique_id_collection.objects.filter(unique_id__in=unique_ids).values_list('unique_id', flat=True))
+    if taken:
+        raise IntegrityError('IDs already in the db: %s' % ', '.join(sorted(taken)))
+    reserve_list = [unique_id_collection(unique_id=unique_id, reserved=True, reserve_message=reserve_message,
+                                         reserver=reserver, site=site) for unique_id in unique_ids]
     unique_id_collection.objects.bulk_create(reserve_list)
     return reserve_list
 
 
 def reserve_id_sequence(num_of_ids, unique_id_generator, unique_id_collection, reserve_message, reserver, site=None):
     """
-    Reserves IDs by incrementing the unique ID generator.
+    Reserves IDs by incrementing the unique ID generator. The IDs are taken from the generator as one block and
+    inserted with one bulk_create, IDs that are already in the collection are reported with an error message.
     :param num_of_ids: Number of IDs to reserve.
     :param unique_id_generator: Instance of UniqueIdGenerator
     :param unique_id_collection: Instance of UniqueId subclass
@@ -120,15 +136,16 @@ def reserve_id_sequence(num_of_ids, unique_id_generator, unique_id_collection, r
     :param reserver: Django user object
     :return: List of dicts with reserved ids, reserve message and eventual error message.
     """
-    reserve_list = []
-    for x in range(0, num_of_ids):
-        unique_id = unique_id_generator.get_id()
-        error_message = ''
-        try:
-            with transaction.atomic():
-                unique_id_collection.objects.create(unique_id=unique_id, reserved=True,
-                                                    reserve_message=reserve_message, reserver=reserver, site=site)
-        except IntegrityError:
-            error_message = 'ID already in database. Manual check needed.'
-        reserve_list.append({'unique_id': unique_id, 'reserve_message': reserve_message, 'error_message': error_message})
-    return reserve_list
+    if num_of_ids < 1:
+        return []
+    unique_ids = unique_id_generator.get_ids(num_of_ids)
+    with transaction.atomic():
+        taken = set(unique_id_collection.objects.filter(unique_id__in=unique_ids).values_list('unique_id', flat=True))
+        unique_id_collection.objects.bulk_create([
+            unique_id_collection(unique_id=unique_id, reserved=True, reserve_message=reserve_message,
+                                 reserver=reserver, site=site)
+            for unique_id in unique_ids if unique_id not in taken
+        ], ignore_conflicts=True)
+    error_message = 'ID already in database. Manual check needed.'
+    return [{'unique_id': unique_id, 'reserve_message': reserve_message,
+             'error_message': error_message if unique_id in taken else ''} for unique_id in unique_ids]
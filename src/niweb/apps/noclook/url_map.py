@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+"""
+In-process map of handle_id to NodeType slug, used to build node URLs without a NodeHandle query per request.
+"""
+
+import threading
+import time
+import uuid
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.urls import reverse
+
+from .models import NodeHandle, NodeType
+
+# Seconds before the map is loaded again, changes made without signals are seen after at most this long
+URL_MAP_TTL = getattr(settings, 'URL_MAP_TTL', 300)
+VERSION_KEY = 'noclook:url-map-version'
+
+
+def _shared_version():
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, uuid.uuid4().hex, None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def invalidate():
+    """
+    Makes every process sharing the default cache load the map again on its next lookup. Call it after changing the
+    node type of NodeHandles with update() or bulk_update(), which do not send post_save.
+    """
+    cache.set(VERSION_KEY, uuid.uuid4().hex, None)
+
+
+class HandleSlugMap(object):
+    """
+    Maps handle_ids to NodeType ids and NodeType ids to slugs. Loads every NodeHandle on first use and is kept up to
+    date by the NodeHandle save and delete signals of this process. handle_ids that are not in the map, created by
+    another process or with bulk_create, are looked up when they are first asked for.
+
+    Node type changes in other processes bump a version in the default cache, which is checked on every lookup, and
+    the map is loaded again after ttl seconds to pick up changes made without signals.
+    """
+
+    def __init__(self, ttl=URL_MAP_TTL):
+        self.ttl = ttl
+        self._types = None
+        self._slugs = {}
+        self._version = None
+        self._expires = 0
+        self._lock = threading.Lock()
+
+    def _load(self, version):
+        self._slugs = dict(NodeType.objects.values_list('pk', 'slug'))
+        self._types = dict(NodeHandle.objects.values_list('pk', 'node_type_id').iterator())
+        self._version = version
+        self._expires = time.monotonic() + self.ttl
+
+    def get_many(self, handle_ids):
+        """
+        :param handle_ids: NodeHandle ids
+        :return: handle_id -> slug for the existing NodeHandles
+        :rtype: dict
+        """
+        version = _shared_version()
+        with self._lock:
+            if self._types is None or version != self._version or time.monotonic() >= self._expires:
+                self._load(version)
+            types = {handle_id: self._types.get(handle_id) for handle_id in handle_ids}
+        missing = [handle_id for handle_id, type_id in types.items() if type_id is None]
+        if missing:
+            loaded = dict(NodeHandle.objects.filter(pk__in=missing).values_list('pk', 'node_type_id'))
+            types.update(loaded)
+            with self._lock:
+                if self._types is not None:
+                    self._types.update(loaded)
+        if any(type_id not in self._slugs for type_id in types.values() if type_id is not None):
+            self._slugs = dict(NodeType.objects.values_list('pk', 'slug'))
+        return {handle_id: self._slugs[type_id] for handle_id, type_id in types.items()
+                if type_id in self._slugs}
+
+    def set(self, handle_id, node_type_id):
+        """
+        :return: True if the map had another node type for handle_id
+        :rtype: bool
+        """
+        with self._lock:
+            if self._types is None:
+                return False
+            previous = self._types.get(handle_id, node_type_id)
+            self._types[handle_id] = node_type_id
+        return previous != node_type_id
+
+    def discard(self, handle_id):
+        with self._lock:
+            if self._types is not None:
+                self._types.pop(handle_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._types = None
+        _list_url.cache_clear()
+
+
+node_slugs = HandleSlugMap()
+
+
+@lru_cache(maxsize=None)
+def _list_url(slug):
+    return reverse('generic_list', args=[slug])
+
+
+def node_url(slug, handle_id):
+    """
+    Same as NodeHandle.url, detail URLs are the list URL of the type followed by the handle_id.
+    """
+    return '{}{}/'.format(_list_url(slug), handle_id)
+
+
+@receiver(post_save, sender=NodeHandle, dispatch_uid='apps.noclook.url_map.save')
+def _node_handle_saved(sender, instance, **kwargs):
+    if node_slugs.set(instance.handle_id, instance.node_type_id):
+        invalidate()
+
+
+@receiver(post_delete, sender=NodeHandle, dispatch_uid='apps.noclook.url_map.delete')
+def _node_handle_deleted(sender, instance, **kwargs):
+    node_slugs.discard(instance.handle_id)
@@ -155,6 +155,8 @@ urlpatterns = [
 
     # -- debug view
     path('nodes/<int:handle_id>/debug', debug.generic_debug, name='debug'),
+    path('debug/node-cache.json', debug.node_cache_stats, name='node_cache_stats'),
+    path('debug/query-stats.json', debug.query_stats, name='query_stats'),
 ]
 
 if not settings.DJANGO_LOGIN_DISABLED:
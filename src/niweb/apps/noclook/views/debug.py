@@ -1,8 +1,10 @@
 # -*- coding: utf-8 -*-
 from django.contrib.auth.decorators import login_required
+from django.http import JsonResponse
 from django.shortcuts import render, get_object_or_404
 
 from apps.noclook.models import NodeHandle
+import graphdb as nc
 
 
 @login_required
@@ -12,3 +14,13 @@ def generic_debug(request, handle_id):
     node = nh.get_node()
     return render(request, 'noclook/debug.html',
                   {'node_handle': nh, 'node': node})
+
+
+@login_required
+def node_cache_stats(request):
+    return JsonResponse(nc.node_cache.stats())
+
+
+@login_required
+def query_stats(request):
+    return JsonResponse({'fingerprints': nc.query_stats.stats(limit=100)})
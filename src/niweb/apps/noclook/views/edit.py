@@ -18,6 +18,7 @@ from apps.noclook import forms
 from apps.noclook import activitylog
 from apps.noclook import helpers
 from apps.noclook import unique_ids
+from apps.noclook import url_map
 import graphdb as nc
 from graphdb.exceptions import UniqueNodeError
 
@@ -209,6 +210,7 @@ def convert_host(request, handle_id, slug):
         node.switch_type(nh.node_type.get_label(), node_type.get_label())
         nh.node_type = node_type
         nh.save()
+        url_map.invalidate()  # Other processes map the handle_id to the old type
         node_properties = {
             'backup': ''
         }
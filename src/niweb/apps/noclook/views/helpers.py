@@ -1,3 +1,6 @@
+import graphdb as nc
+
+
 
 class Table(object):
     def __init__(self, *args):
@@ -58,3 +61,62 @@ def create_filter(badge, name, param, params):
         params[param] = ''
     link = "?{}".format(params.urlencode())
     return (badge, name, link, active)
+
+
+class QueryList(object):
+    """
+    Lazy list of nodes matched by a Cypher query. Only count() and the requested slice are
+    fetched from the database, so it can be handed to a django Paginator without loading
+    every node.
+
+        match: MATCH clause finding the listed nodes, e.g. 'MATCH (host:Host)'
+        var: variable of the listed node in match, e.g. 'host'
+        order_by: ORDER BY expression, e.g. 'host.name'
+        tail: clauses applied to the sliced nodes, must end with RETURN and ORDER BY
+    """
+    def __init__(self, match, var, order_by, tail=None, **params):
+        self.match = match
+        self.var = var
+        self.order_by = order_by
+        self.tail = tail or 'RETURN {var} ORDER BY {order_by}'.format(var=var, order_by=order_by)
+        self.params = params
+        self.where = []
+        self._count = None
+
+    def filter(self, where, **params):
+        self.where.append('({})'.format(where))
+        self.params.update(params)
+        self._count = None
+        return self
+
+    def _match(self):
+        if self.where:
+            return u'{} WHERE {}'.format(self.match, ' AND '.join(self.where))
+        return self.match
+
+    def count(self):
+        if self._count is None:
+            q = u"""
+                {match}
+                RETURN count({var}) AS total
+                """.format(match=self._match(), var=self.var)
+            self._count = nc.query_to_dict(nc.graphdb.manager, q, **self.params).get('total', 0)
+        return self._count
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, key):
+        if not isinstance(key, slice):
+            return self[key:key + 1][0]
+        start = key.start or 0
+        stop = self.count() if key.stop is None else key.stop
+        if stop <= start:
+            return []
+        q = u"""
+            {match}
+            WITH {var} ORDER BY {order_by} SKIP $skip LIMIT $limit
+            {tail}
+            """.format(match=self._match(), var=self.var, order_by=self.order_by, tail=self.tail)
+        params = dict(self.params, skip=start, limit=stop - start)
+        return nc.query_to_list(nc.graphdb.manager, q, **params)
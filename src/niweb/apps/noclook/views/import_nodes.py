@@ -16,6 +16,14 @@ from apps.noclook import helpers
 import graphdb as nc
 from graphdb.exceptions import UniqueNodeError
 
+
+class ImportFailed(Exception):
+
+    def __init__(self, errors):
+        super(ImportFailed, self).__init__(errors)
+        self.errors = errors
+
+
 VALIDATION_FORMS = {
   'Rack': forms.EditRackForm,
   'Room': forms.EditRoomForm,
@@ -162,18 +170,31 @@ class ImportNodesView(View):
                       {'parent': parent, 'data': data, 'errors': errors})
 
     def create(self, request, parent, data):
-        user = request.user
-        errors = []
-        for item in data:
-            error = self.create_node(item, parent, user)
-            errors += error
+        try:
+            self.create_all(request.user, parent, data)
+        except ImportFailed as e:
+            return self.edit(request, parent, data, {'global': e.errors})
+        return HttpResponseRedirect(parent.get_absolute_url())
 
-        if errors:
-            return self.edit(request, parent, data, {'global': errors})
-        else:
-            return HttpResponseRedirect(parent.get_absolute_url())
+    @helpers.neo4j_unit_of_work
+    def create_all(self, user, parent, data):
+        """
+        Creates the nodes and their relationships in one transaction, nothing is created if any of it fails.
+        """
+        relationships = []
+        for item in data:
+            errors = self.create_node(item, parent, user, relationships)
+            if errors:
+                # The transaction is rolled back, the remaining items are not tried
+                raise ImportFailed(errors)
+        if relationships:
+            # All relationships of the import are created together, one statement per relationship type
+            try:
+                helpers.set_relationships(user, relationships)
+            except (nc.exceptions.NoRelationshipPossible, nc.exceptions.NodeNotFound) as e:
+                raise ImportFailed([u'Could not create the relationships, got error: {}'.format(e)])
 
-    def create_node(self, item, parent_nh, user):
+    def create_node(self, item, parent_nh, user, relationships):
         errors = []
         slug = slugify(item['node_type']).replace("_", "-")
         meta_type = META_TYPES.get(item['node_type'], 'Physical')
@@ -211,11 +232,11 @@ class ImportNodesView(View):
                                                     'children',
                                                     'ports'])
             if item['node_type'] in HAS_RELATION:
-                helpers.set_has(user, parent_nh.get_node(), nh.handle_id)
+                relationships.append((parent_nh.handle_id, nh.handle_id, 'Has'))
             else:
-                helpers.set_location(user, nh.get_node(), parent_nh.handle_id)
+                relationships.append((nh.handle_id, parent_nh.handle_id, 'Located_in'))
             for child in item.get('children', []):
-                cerrors = self.create_node(child, nh, user)
+                cerrors = self.create_node(child, nh, user, relationships)
                 errors += cerrors
         return errors
 
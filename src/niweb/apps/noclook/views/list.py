@@ -1,15 +1,20 @@
 # -*- coding: utf-8 -*-
 
+from datetime import datetime, timedelta
+from django.conf import settings
 from django.contrib.auth.decorators import login_required
 from django.shortcuts import get_object_or_404, render
 
-from apps.noclook.models import NodeType, NodeHandle
-from apps.noclook.views.helpers import Table, TableRow
-from apps.noclook.helpers import get_node_urls, neo4j_data_age
+from apps.noclook.models import NodeType
+from apps.noclook.views.helpers import Table, TableRow, QueryList
+from apps.noclook.helpers import get_node_urls, neo4j_data_age, paginate
 import graphdb as nc
 
 __author__ = 'lundberg'
 
+PER_PAGE = 250
+MAX_PER_PAGE = 1000
+
 OPERATIONAL_BADGES = [
     ('badge-info', 'Testing'),
     ('badge-warning', 'Reserved'),
@@ -32,36 +37,57 @@ def _set_operational_state(row, node):
         row.classes = node.get('operational_state').lower()
 
 
-def _set_filters_expired(table, request):
-    table.add_filter('', 'Current', 'hide_current', request.GET.copy())
-    table.add_filter('badge-important', 'Expired', 'show_expired', request.GET.copy())
-
-
-def _set_filters_operational_state(table, request):
-    table.add_filter('', 'In service', 'hide_in_service', request.GET.copy())
-    table.add_filter('badge-info', 'Testing', 'show_testing', request.GET.copy())
-    table.add_filter('badge-warning', 'Reserved', 'show_reserved', request.GET.copy())
-    table.add_filter('badge-important', 'Decommissioned', 'show_decommissioned', request.GET.copy())
+def _path_tail(var, prop=nc.LOCATION_PATH):
+    # Resolves the handle_ids of the path stored on the node, one index lookup per path element
+    return """
+        OPTIONAL MATCH (path_node:Node) WHERE path_node.handle_id IN coalesce({var}.{prop}, [])
+        WITH {var}, collect(path_node) AS path_nodes
+        RETURN {var}, [handle_id IN coalesce({var}.{prop}, []) |
+                       [path_node IN path_nodes WHERE path_node.handle_id = handle_id][0]] AS location_path
+        ORDER BY {var}.name
+        """.format(var=var, prop=prop)
 
 
-def any_filter(filters, n):
-    return any([f(n) for f in filters])
+def _filter_params(request):
+    # Changing a filter changes the number of pages, start over from the first one
+    params = request.GET.copy()
+    params.pop('page', None)
+    return params
 
 
-def all_filters(filters, n):
-    return all([f(n) for f in filters])
+def _set_filters_expired(table, request):
+    table.add_filter('', 'Current', 'hide_current', _filter_params(request))
+    table.add_filter('badge-important', 'Expired', 'show_expired', _filter_params(request))
 
 
-def _filter_expired(nodes, request, select=lambda n: n):
-    filters = []
+def _set_filters_operational_state(table, request):
+    table.add_filter('', 'In service', 'hide_in_service', _filter_params(request))
+    table.add_filter('badge-info', 'Testing', 'show_testing', _filter_params(request))
+    table.add_filter('badge-warning', 'Reserved', 'show_reserved', _filter_params(request))
+    table.add_filter('badge-important', 'Decommissioned', 'show_decommissioned', _filter_params(request))
+
+
+def _expired_where(request, var):
+    """
+    Returns a Cypher WHERE condition and parameters for the show_expired and hide_current filters.
+    See helpers.neo4j_data_age for the definition of expired.
+    """
+    max_age = timedelta(hours=int(settings.NEO4J_MAX_DATA_AGE))
+    expired = 'coalesce({var}.noclook_auto_manage = true AND {var}.noclook_last_seen < $expired_before, false)'.format(
+        var=var)
+    conditions = []
     if 'show_expired' in request.GET:
-        filters.append(lambda n: is_expired(n))
+        conditions.append(expired)
     if 'hide_current' not in request.GET:
-        filters.append(lambda n: not is_expired(n))
-    return [n for n in nodes if any_filter(filters, select(n))]
+        conditions.append('NOT {}'.format(expired))
+    where = ' OR '.join(conditions) or 'false'
+    return where, {'expired_before': (datetime.now() - max_age).isoformat()}
 
 
-def _filter_operational_state(nodes, request, select=lambda n: n):
+def _operational_state_where(request, var):
+    """
+    Returns a Cypher WHERE condition and parameters for the operational state filters.
+    """
     exclude = []
     if 'show_testing' not in request.GET:
         exclude.append('testing')
@@ -71,7 +97,50 @@ def _filter_operational_state(nodes, request, select=lambda n: n):
         exclude.append('decommissioned')
     if 'hide_in_service' in request.GET:
         exclude.append('in service')
-    return [n for n in nodes if select(n).get('operational_state', '').lower() not in exclude]
+    where = 'NOT toLower(coalesce({var}.operational_state, "")) IN $exclude_states'.format(var=var)
+    return where, {'exclude_states': exclude}
+
+
+def _filter_expired(node_list, request):
+    where, params = _expired_where(request, node_list.var)
+    return node_list.filter(where, **params)
+
+
+def _filter_operational_state(node_list, request):
+    where, params = _operational_state_where(request, node_list.var)
+    return node_list.filter(where, **params)
+
+
+def _search_where(request, var):
+    """
+    Returns a Cypher WHERE condition and parameters matching the q search parameter against name and description.
+    """
+    where = ('toLower(toString(coalesce({var}.name, ""))) CONTAINS $q OR '
+             'toLower(toString(coalesce({var}.description, ""))) CONTAINS $q').format(var=var)
+    return where, {'q': request.GET.get('q', '').strip().lower()}
+
+
+def _paginate(request, node_list):
+    if request.GET.get('q', '').strip():
+        where, params = _search_where(request, node_list.var)
+        node_list.filter(where, **params)
+    if 'all' in request.GET:
+        # Used by the CSV and Excel export, which needs every row and not only the current page
+        return paginate(node_list, 1, max(node_list.count(), 1))
+    try:
+        per_page = min(max(int(request.GET.get('per_page', PER_PAGE)), 1), MAX_PER_PAGE)
+    except ValueError:
+        per_page = PER_PAGE
+    return paginate(node_list, request.GET.get('page'), per_page)
+
+
+def _render_list(request, table, name, page):
+    urls = get_node_urls(page.object_list)
+    search_params = [(key, value) for key, values in _filter_params(request).lists() if key not in ('q', 'all')
+                     for value in values]
+    return render(request, 'noclook/list/list_generic.html',
+                  {'table': table, 'name': name, 'urls': urls, 'page': page, 'q': request.GET.get('q', ''),
+                   'search_params': search_params})
 
 
 def _type_table(wrapped_node):
@@ -84,22 +153,15 @@ def _type_table(wrapped_node):
 @login_required
 def list_by_type(request, slug):
     node_type = get_object_or_404(NodeType, slug=slug)
-    q = """
-        MATCH (node:%(nodetype)s)
-        RETURN node
-        ORDER BY node.name
-        """ % {'nodetype': node_type.get_label()}
-    node_list = nc.query_to_list(nc.graphdb.manager, q)
-    node_list = _filter_expired(node_list, request, select=lambda n: n.get('node'))
-    # Since all is the same type... we could use a defaultdict with type/id return
-    urls = get_node_urls(node_list)
+    node_list = QueryList('MATCH (node:%(nodetype)s)' % {'nodetype': node_type.get_label()}, 'node', 'node.name')
+    _filter_expired(node_list, request)
+    page = _paginate(request, node_list)
 
     table = Table('Name', 'Description')
-    table.rows = [_type_table(node) for node in node_list]
+    table.rows = [_type_table(node) for node in page]
     _set_filters_expired(table, request)
 
-    return render(request, 'noclook/list/list_generic.html',
-                  {'table': table, 'name': '{}s'.format(node_type), 'urls': urls})
+    return _render_list(request, table, '{}s'.format(node_type), page)
 
 
 def _cable_end(end):
@@ -124,23 +186,21 @@ def _cable_table(wrapped_cable):
 def list_cables(request):
     # MK: not 100% sure this gives the correct end+port pairs
     # Due to the <-[:Has*1..10]
-    q = """
-        MATCH (cable:Cable)
+    tail = """
         OPTIONAL MATCH (cable)-[r:Connected_to]->(port:Port)
         OPTIONAL MATCH (port)<-[:Has*1..10]-(end)
         WHERE NOT((end)<-[:Has]-())
         RETURN cable, collect({equipment: {name: end.name, handle_id: end.handle_id}, port: {name: port.name, handle_id: port.handle_id}}) as end order by cable.name
         """
-    cable_list = nc.query_to_list(nc.graphdb.manager, q)
-    cable_list = _filter_expired(cable_list, request, select=lambda n: n.get('cable'))
-    urls = get_node_urls(cable_list)
+    cable_list = QueryList('MATCH (cable:Cable)', 'cable', 'cable.name', tail)
+    _filter_expired(cable_list, request)
+    page = _paginate(request, cable_list)
 
     table = Table('Name', 'Cable type', 'End equipment', 'Port')
-    table.rows = [_cable_table(item) for item in cable_list]
+    table.rows = [_cable_table(item) for item in page]
     _set_filters_expired(table, request)
 
-    return render(request, 'noclook/list/list_generic.html',
-                  {'table': table, 'name': 'Cables', 'urls': urls})
+    return _render_list(request, table, 'Cables', page)
 
 
 def _port_row(wrapped_port):
@@ -153,21 +213,19 @@ def _port_row(wrapped_port):
 
 @login_required
 def list_ports(request):
-    q = """
-        MATCH (port:Port)
+    tail = """
         OPTIONAL MATCH (port)<-[:Has]-(parent:Node)
         RETURN port, collect(parent) as parent order by toLower(toString(port.name))
         """
-    port_list = nc.query_to_list(nc.graphdb.manager, q)
-    port_list = _filter_expired(port_list, request, select=lambda n: n.get('port'))
-    urls = get_node_urls(port_list)
+    port_list = QueryList('MATCH (port:Port)', 'port', 'toLower(toString(port.name))', tail)
+    _filter_expired(port_list, request)
+    page = _paginate(request, port_list)
 
     table = Table('Name', 'Description', 'Equipment')
-    table.rows = [_port_row(item) for item in port_list]
+    table.rows = [_port_row(item) for item in page]
     _set_filters_expired(table, request)
 
-    return render(request, 'noclook/list/list_generic.html',
-                  {'table': table, 'name': 'Ports', 'urls': urls})
+    return _render_list(request, table, 'Ports', page)
 
 
 def _customer_table(wrapped_customer):
@@ -177,20 +235,14 @@ def _customer_table(wrapped_customer):
 
 @login_required
 def list_customers(request):
-    q = """
-        MATCH (customer:Customer)
-        RETURN customer
-        ORDER BY customer.name
-        """
-    customer_list = nc.query_to_list(nc.graphdb.manager, q)
-    urls = get_node_urls(customer_list)
+    customer_list = QueryList('MATCH (customer:Customer)', 'customer', 'customer.name')
+    page = _paginate(request, customer_list)
 
     table = Table('Name', 'Description')
-    table.rows = [_customer_table(customer) for customer in customer_list]
+    table.rows = [_customer_table(customer) for customer in page]
     table.no_badges = True
 
-    return render(request, 'noclook/list/list_generic.html',
-                  {'table': table, 'name': 'Customers', 'urls': urls})
+    return _render_list(request, table, 'Customers', page)
 
 
 def _host_table(host, users):
@@ -205,25 +257,22 @@ def _host_table(host, users):
 
 @login_required
 def list_hosts(request):
-    q = """
-        MATCH (host:Host)
+    tail = """
         OPTIONAL MATCH (host)<-[:Owns|Uses]-(user)
         RETURN host, collect(user) as users
         ORDER BY host.name
         """
-
-    host_list = nc.query_to_list(nc.graphdb.manager, q)
-    host_list = _filter_expired(host_list, request, select=lambda n: n.get('host'))
-    host_list = _filter_operational_state(host_list, request, select=lambda n: n.get('host'))
-    urls = get_node_urls(host_list)
+    host_list = QueryList('MATCH (host:Host)', 'host', 'host.name', tail)
+    _filter_expired(host_list, request)
+    _filter_operational_state(host_list, request)
+    page = _paginate(request, host_list)
 
     table = Table('Host', 'Address', 'OS', 'OS version', 'User')
-    table.rows = [_host_table(item['host'], item['users']) for item in host_list]
+    table.rows = [_host_table(item['host'], item['users']) for item in page]
     _set_filters_expired(table, request)
     _set_filters_operational_state(table, request)
 
-    return render(request, 'noclook/list/list_generic.html',
-                  {'table': table, 'name': 'Hosts', 'urls': urls})
+    return _render_list(request, table, 'Hosts', page)
 
 
 def _switch_table(switch, users):
@@ -236,44 +285,38 @@ def _switch_table(switch, users):
 
 @login_required
 def list_switches(request):
-    q = """
-        MATCH (switch:Switch)
+    tail = """
         OPTIONAL MATCH (switch)<-[:Owns|Uses]-(user)
         RETURN switch, collect(user) as users
         ORDER BY switch.name
         """
-
-    switch_list = nc.query_to_list(nc.graphdb.manager, q)
-    switch_list = _filter_expired(switch_list, request, select=lambda n: n.get('switch'))
-    urls = get_node_urls(switch_list)
+    switch_list = QueryList('MATCH (switch:Switch)', 'switch', 'switch.name', tail)
+    _filter_expired(switch_list, request)
+    page = _paginate(request, switch_list)
 
     table = Table('Switch', 'Model', 'Address', 'User', 'Operational state')
-    table.rows = [_switch_table(item['switch'], item['users']) for item in switch_list]
+    table.rows = [_switch_table(item['switch'], item['users']) for item in page]
     _set_filters_expired(table, request)
 
-    return render(request, 'noclook/list/list_generic.html',
-                  {'name': 'Switches', 'table': table, 'urls': urls})
+    return _render_list(request, table, 'Switches', page)
 
 
 @login_required
 def list_firewalls(request):
-    q = """
-        MATCH (firewall:Firewall)
+    tail = """
         OPTIONAL MATCH (firewall)<-[:Owns|Uses]-(user)
         RETURN firewall, collect(user) as users
         ORDER BY firewall.name
         """
-
-    firewall_list = nc.query_to_list(nc.graphdb.manager, q)
-    firewall_list = _filter_expired(firewall_list, request, select=lambda n: n.get('firewall'))
-    urls = get_node_urls(firewall_list)
+    firewall_list = QueryList('MATCH (firewall:Firewall)', 'firewall', 'firewall.name', tail)
+    _filter_expired(firewall_list, request)
+    page = _paginate(request, firewall_list)
 
     table = Table('Firewall', 'Model', 'Address', 'User')
-    table.rows = [_switch_table(item['firewall'], item['users']) for item in firewall_list]
+    table.rows = [_switch_table(item['firewall'], item['users']) for item in page]
     _set_filters_expired(table, request)
 
-    return render(request, 'noclook/list/list_generic.html',
-                  {'name': 'Firewalls', 'table': table, 'urls': urls})
+    return _render_list(request, table, 'Firewalls', page)
 
 
 def _odf_table(item):
@@ -288,29 +331,18 @@ def _odf_table(item):
 @login_required
 def list_odfs(request):
 
-    # TODO: check if size(nodes(p))/size(path) in neo4j>=4.4 is equivalent to length(nodes(p))/length(path) in neo4j==3.5
-    q = """
-        MATCH (odf:ODF)
-        OPTIONAL MATCH (odf)-[:Located_in]->(r)
-        OPTIONAL MATCH p=()-[:Has*0..20]->(r)
-        WITH COLLECT(nodes(p)) as paths, MAX(size(nodes(p))) AS maxLength, odf
-        WITH [path IN paths WHERE size(path)=maxLength] AS longestPaths, odf AS odf
-        UNWIND CASE WHEN longestPaths = [] THEN [null] ELSE longestPaths END as location_path
-        RETURN odf, location_path
-        ORDER BY odf.name
-        """
-    odf_list = nc.query_to_list(nc.graphdb.manager, q)
-    odf_list = _filter_operational_state(odf_list, request, select=lambda n: n.get('odf'))
-    urls = get_node_urls(odf_list)
-
+    tail = _path_tail('odf')
+    odf_list = QueryList('MATCH (odf:ODF)', 'odf', 'odf.name', tail)
+    _filter_operational_state(odf_list, request)
+    page = _paginate(request, odf_list)
 
     table = Table("Name", "Location")
-    table.rows = [_odf_table(item) for item in odf_list]
+    table.rows = [_odf_table(item) for item in page]
     # Filter out
     _set_filters_operational_state(table, request)
 
-    return render(request, 'noclook/list/list_generic.html',
-                  {'table': table, 'name': 'ODFs', 'urls': urls})
+    return _render_list(request, table, 'ODFs', page)
+
 
 def _outlet_table(item):
     outlet = item.get('outlet')
@@ -324,29 +356,17 @@ def _outlet_table(item):
 @login_required
 def list_outlet(request):
 
-    # TODO: check if size(nodes(p))/size(path) in neo4j>=4.4 is equivalent to length(nodes(p))/length(path) in neo4j==3.5
-    q = """
-        MATCH (outlet:Outlet)
-        OPTIONAL MATCH (outlet)-[:Located_in]->(r)
-        OPTIONAL MATCH p=()-[:Has*0..20]->(r)
-        WITH COLLECT(nodes(p)) as paths, MAX(size(nodes(p))) AS maxLength, outlet
-        WITH [path IN paths WHERE size(path)=maxLength] AS longestPaths, outlet
-        UNWIND CASE WHEN longestPaths = [] THEN [null] ELSE longestPaths END as location_path
-        RETURN outlet, location_path
-        ORDER BY outlet.name
-        """
-    outlet_list = nc.query_to_list(nc.graphdb.manager, q)
-    outlet_list = _filter_operational_state(outlet_list, request, select=lambda n: n.get('outlet'))
-    urls = get_node_urls(outlet_list)
-
+    tail = _path_tail('outlet')
+    outlet_list = QueryList('MATCH (outlet:Outlet)', 'outlet', 'outlet.name', tail)
+    _filter_operational_state(outlet_list, request)
+    page = _paginate(request, outlet_list)
 
     table = Table("Name", "Location" )
-    table.rows = [_outlet_table(item) for item in outlet_list]
+    table.rows = [_outlet_table(item) for item in page]
     # Filter out
     _set_filters_operational_state(table, request)
 
-    return render(request, 'noclook/list/list_generic.html',
-                  {'table': table, 'name': 'Outlets', 'urls': urls})
+    return _render_list(request, table, 'Outlets', page)
 
 
 def _patch_panel_table(item):
@@ -360,29 +380,17 @@ def _patch_panel_table(item):
 
 @login_required
 def list_patch_panels(request):
-    # TODO: check if size(nodes(p))/size(path) in neo4j>=4.4 is equivalent to length(nodes(p))/length(path) in neo4j==3.5
-    q = """
-        MATCH (patch_panel:Patch_Panel)
-        OPTIONAL MATCH (patch_panel)-[:Located_in]->(r)
-        OPTIONAL MATCH p=()-[:Has*0..20]->(r)
-        WITH COLLECT(nodes(p)) as paths, MAX(size(nodes(p))) AS maxLength, patch_panel
-        WITH [path IN paths WHERE size(path)=maxLength] AS longestPaths, patch_panel AS patch_panel
-        UNWIND CASE WHEN longestPaths = [] THEN [null] ELSE longestPaths END as location_path
-        RETURN patch_panel, location_path
-        ORDER BY patch_panel.name
-        """
-    patch_panel_list = nc.query_to_list(nc.graphdb.manager, q)
-    patch_panel_list = _filter_operational_state(patch_panel_list, request, select=lambda n: n.get('patch_panel'))
-    urls = get_node_urls(patch_panel_list)
-
+    tail = _path_tail('patch_panel')
+    patch_panel_list = QueryList('MATCH (patch_panel:Patch_Panel)', 'patch_panel', 'patch_panel.name', tail)
+    _filter_operational_state(patch_panel_list, request)
+    page = _paginate(request, patch_panel_list)
 
     table = Table("Name", "Location" )
-    table.rows = [_patch_panel_table(item) for item in patch_panel_list]
+    table.rows = [_patch_panel_table(item) for item in page]
     # Filter out
     _set_filters_operational_state(table, request)
 
-    return render(request, 'noclook/list/list_generic.html',
-                  {'table': table, 'name': 'Patch Panels', 'urls': urls})
+    return _render_list(request, table, 'Patch Panels', page)
 
 
 def _optical_link_table(link, dependencies):
@@ -404,21 +412,21 @@ def _optical_link_table(link, dependencies):
 def list_optical_links(request):
     # TODO: returns [None,None] and [node, None]
     #   tried to use [:Has *0-1] path matching but that gave "duplicate paths"
-    q = """
-        MATCH (link:Optical_Link)
+    tail = """
         OPTIONAL MATCH (link)-[:Depends_on]->(node)
         OPTIONAL MATCH p=(node)<-[:Has]-(parent)
         RETURN link as link, collect([node, parent]) as dependencies
+        ORDER BY link.name
         """
-    optical_link_list = nc.query_to_list(nc.graphdb.manager, q)
-    optical_link_list = _filter_operational_state(optical_link_list, request, select=lambda n: n.get('link'))
+    optical_link_list = QueryList('MATCH (link:Optical_Link)', 'link', 'link.name', tail)
+    _filter_operational_state(optical_link_list, request)
+    page = _paginate(request, optical_link_list)
+
     table = Table('Optical Link', 'Type', 'Description', 'Depends on')
-    table.rows = [_optical_link_table(item['link'], item['dependencies']) for item in optical_link_list]
+    table.rows = [_optical_link_table(item['link'], item['dependencies']) for item in page]
     _set_filters_operational_state(table, request)
 
-    urls = get_node_urls(optical_link_list)
-    return render(request, 'noclook/list/list_generic.html',
-                  {'table': table, 'name': 'Optical Links', 'urls': urls})
+    return _render_list(request, table, 'Optical Links', page)
 
 
 def _oms_table(oms, dependencies):
@@ -430,23 +438,20 @@ def _oms_table(oms, dependencies):
 
 @login_required
 def list_optical_multiplex_section(request):
-    q = """
-        MATCH (oms:Optical_Multiplex_Section)
+    tail = """
         OPTIONAL MATCH (oms)-[r:Depends_on]->(dep)
         RETURN oms, collect(dep) as dependencies
+        ORDER BY oms.name
         """
-
-    oms_list = nc.query_to_list(nc.graphdb.manager, q)
-    oms_list = _filter_operational_state(oms_list, request, select=lambda n: n.get('oms'))
-
-    urls = get_node_urls(oms_list)
+    oms_list = QueryList('MATCH (oms:Optical_Multiplex_Section)', 'oms', 'oms.name', tail)
+    _filter_operational_state(oms_list, request)
+    page = _paginate(request, oms_list)
 
     table = Table("Optical Multiplex Section", "Description", "Depends on")
-    table.rows = [_oms_table(item['oms'], item['dependencies']) for item in oms_list]
+    table.rows = [_oms_table(item['oms'], item['dependencies']) for item in page]
     _set_filters_operational_state(table, request)
 
-    return render(request, 'noclook/list/list_generic.html',
-                  {'table': table, 'name': 'Optical Multiplex Sections', 'urls': urls})
+    return _render_list(request, table, 'Optical Multiplex Sections', page)
 
 
 def _optical_nodes_table(node):
@@ -457,21 +462,15 @@ def _optical_nodes_table(node):
 
 @login_required
 def list_optical_nodes(request):
-    q = """
-        MATCH (node:Optical_Node)
-        RETURN node
-        ORDER BY node.name
-        """
-
-    optical_node_list = nc.query_to_list(nc.graphdb.manager, q)
-    optical_node_list = _filter_operational_state(optical_node_list, request, select=lambda n: n.get('node'))
-    urls = get_node_urls(optical_node_list)
+    optical_node_list = QueryList('MATCH (node:Optical_Node)', 'node', 'node.name')
+    _filter_operational_state(optical_node_list, request)
+    page = _paginate(request, optical_node_list)
 
     table = Table('Name', 'Type', 'Link', 'OTS')
-    table.rows = [_optical_nodes_table(item['node']) for item in optical_node_list]
+    table.rows = [_optical_nodes_table(item['node']) for item in page]
     _set_filters_operational_state(table, request)
-    return render(request, 'noclook/list/list_generic.html',
-                  {'table': table, 'name': 'Optical Nodes', 'urls': urls})
+
+    return _render_list(request, table, 'Optical Nodes', page)
 
 
 def _optical_path_table(path):
@@ -488,22 +487,15 @@ def _optical_path_table(path):
 
 @login_required
 def list_optical_paths(request):
-    q = """
-        MATCH (path:Optical_Path)
-        RETURN path
-        ORDER BY path.name
-        """
-
-    optical_path_list = nc.query_to_list(nc.graphdb.manager, q)
-    optical_path_list = _filter_operational_state(optical_path_list, request, select=lambda n: n.get('path'))
-    urls = get_node_urls(optical_path_list)
+    optical_path_list = QueryList('MATCH (path:Optical_Path)', 'path', 'path.name')
+    _filter_operational_state(optical_path_list, request)
+    page = _paginate(request, optical_path_list)
 
     table = Table('Optical Path', 'Framing', 'Capacity', 'Wavelength', 'Description', 'ENRs')
-    table.rows = [_optical_path_table(item['path']) for item in optical_path_list]
+    table.rows = [_optical_path_table(item['path']) for item in page]
     _set_filters_operational_state(table, request)
 
-    return render(request, 'noclook/list/list_generic.html',
-                  {'table': table, 'name': 'Optical Paths', 'urls': urls})
+    return _render_list(request, table, 'Optical Paths', page)
 
 
 def _peering_partner_table(peer, peering_groups):
@@ -514,78 +506,52 @@ def _peering_partner_table(peer, peering_groups):
 
 @login_required
 def list_peering_partners(request):
-    q = """
-        MATCH (peer:Peering_Partner)
+    tail = """
         OPTIONAL MATCH (peer)-[:Uses]->(peering_group)
         WITH distinct peer, peering_group
         RETURN peer, collect(peering_group) as peering_groups
         ORDER BY peer.name
         """
-
-    partner_list = nc.query_to_list(nc.graphdb.manager, q)
-    partner_list = _filter_expired(partner_list, request, select=lambda n: n.get('peer'))
-    urls = get_node_urls(partner_list)
+    partner_list = QueryList('MATCH (peer:Peering_Partner)', 'peer', 'peer.name', tail)
+    _filter_expired(partner_list, request)
+    page = _paginate(request, partner_list)
 
     table = Table('Peering Partner', 'AS Number', 'Peering Groups')
-    table.rows = [_peering_partner_table(item['peer'], item['peering_groups']) for item in partner_list]
+    table.rows = [_peering_partner_table(item['peer'], item['peering_groups']) for item in page]
     _set_filters_expired(table, request)
 
-    return render(request, 'noclook/list/list_generic.html',
-                  {'table': table, 'name': 'Peering Partners', 'urls': urls})
+    return _render_list(request, table, 'Peering Partners', page)
 
 
 @login_required
 def list_racks(request):
-    # TODO: check if size(nodes(p))/size(path) in neo4j>=4.4 is equivalent to length(nodes(p))/length(path) in neo4j==3.5
-    q = """
-        MATCH (rack:Rack)
-        OPTIONAL MATCH (rack)<-[:Has]-(loc)
-        OPTIONAL MATCH p=(loc)<-[:Has*0..20]-()
-        WITH COLLECT(nodes(p)) as paths, MAX(size(nodes(p))) AS maxLength, rack AS rack
-        WITH [path IN paths WHERE size(path)=maxLength] AS longestPaths, rack AS rack
-        UNWIND CASE WHEN longestPaths = [] THEN [null] ELSE longestPaths END as location_path
-        RETURN rack, reverse(location_path) as location_path
-        ORDER BY rack.name
-        """
-
-    rack_list = nc.query_to_list(nc.graphdb.manager, q)
-    urls = get_node_urls(rack_list)
+    tail = _path_tail('rack', nc.PLACEMENT_PATH)
+    rack_list = QueryList('MATCH (rack:Rack)', 'rack', 'rack.name', tail)
+    page = _paginate(request, rack_list)
 
     table = Table('Name', 'Location')
     table.no_badges = True
 
-    for item in rack_list:
+    for item in page:
         rack = item.get('rack')
         location_path = item.get('location_path')
         table.rows.append(TableRow(rack, location_path))
 
-    return render(request, 'noclook/list/list_generic.html',
-                  {'table': table, 'name': 'Racks', 'urls': urls})
+    return _render_list(request, table, 'Racks', page)
 
 
 @login_required
 def list_rooms(request):
-    q = """
-        MATCH (room:Room)
-        RETURN room
-        ORDER BY room.name
-        """
-
-    room_list = nc.query_to_list(nc.graphdb.manager, q)
-    urls = get_node_urls(room_list)
+    room_list = QueryList('MATCH (room:Room)', 'room', 'room.name', _path_tail('room', nc.PLACEMENT_PATH))
+    page = _paginate(request, room_list)
 
     table = Table('Name', 'Location')
-    for item in room_list:
-        room = item.get('room')
-        nh = get_object_or_404(NodeHandle, pk=room.get('handle_id'))
-        node = nh.get_node()
-        location_path = node.get_location_path()
-        table.rows.append(TableRow(item['room'], location_path.get('location_path')))
+    for item in page:
+        table.rows.append(TableRow(item['room'], item['location_path']))
 
     table.no_badges = True
 
-    return render(request, 'noclook/list/list_generic.html',
-                  {'table': table, 'name': 'Rooms', 'urls': urls})
+    return _render_list(request, table, 'Rooms', page)
 
 
 def _router_table(router):
@@ -596,22 +562,15 @@ def _router_table(router):
 
 @login_required
 def list_routers(request):
-    q = """
-        MATCH (router:Router)
-        RETURN router
-        ORDER BY router.name
-        """
-
-    router_list = nc.query_to_list(nc.graphdb.manager, q)
-    router_list = _filter_expired(router_list, request, select=lambda n: n.get('router'))
-    urls = get_node_urls(router_list)
+    router_list = QueryList('MATCH (router:Router)', 'router', 'router.name')
+    _filter_expired(router_list, request)
+    page = _paginate(request, router_list)
 
     table = Table('Router', 'Model', 'JUNOS version', 'Operational state')
-    table.rows = [_router_table(item['router']) for item in router_list]
+    table.rows = [_router_table(item['router']) for item in page]
     _set_filters_expired(table, request)
 
-    return render(request, 'noclook/list/list_generic.html',
-                  {'table': table, 'name': 'Routers', 'urls': urls})
+    return _render_list(request, table, 'Routers', page)
 
 
 def _service_table(service, customers, end_users):
@@ -627,24 +586,20 @@ def _service_table(service, customers, end_users):
 
 @login_required
 def list_services(request, service_class=None):
-    where_statement = ''
-    name = 'Services'
-    if service_class:
-        where_statement = 'WHERE service.service_class = "%s"' % service_class
-        name = '{} Services'.format(service_class)
-    q = """
-        MATCH (service:Service)
-        %s
+    tail = """
         OPTIONAL MATCH (service)<-[:Uses]-(customer:Customer)
         WITH service, COLLECT(customer) as customers
         OPTIONAL MATCH (service)<-[:Uses]-(end_user:End_User)
         RETURN service, customers, COLLECT(end_user) as end_users
         ORDER BY service.name
-        """ % where_statement
-
-    service_list = nc.query_to_list(nc.graphdb.manager, q)
-    service_list = _filter_operational_state(service_list, request, select=lambda n: n.get('service'))
-    urls = get_node_urls(service_list)
+        """
+    service_list = QueryList('MATCH (service:Service)', 'service', 'service.name', tail)
+    name = 'Services'
+    if service_class:
+        service_list.filter('service.service_class = $service_class', service_class=service_class)
+        name = '{} Services'.format(service_class)
+    _filter_operational_state(service_list, request)
+    page = _paginate(request, service_list)
 
     table = Table('Service',
                   'Service Class',
@@ -652,12 +607,11 @@ def list_services(request, service_class=None):
                   'Description',
                   'Customers',
                   'End Users')
-    table.rows = [_service_table(item['service'], item['customers'], item['end_users']) for item in service_list]
+    table.rows = [_service_table(item['service'], item['customers'], item['end_users']) for item in page]
 
     _set_filters_operational_state(table, request)
 
-    return render(request, 'noclook/list/list_generic.html',
-                  {'table': table, 'name': name, 'urls': urls})
+    return _render_list(request, table, name, page)
 
 
 def _site_table(site, owner):
@@ -673,22 +627,19 @@ def _site_table(site, owner):
 
 @login_required
 def list_sites(request):
-    q = """
-        MATCH (site:Site)
+    tail = """
         OPTIONAL MATCH (site)<-[:Responsible_for]-(owner:Site_Owner)
         RETURN site, owner
         ORDER BY site.country_code, site.name
         """
-
-    site_list = nc.query_to_list(nc.graphdb.manager, q)
-    urls = get_node_urls(site_list)
+    site_list = QueryList('MATCH (site:Site)', 'site', 'site.country_code, site.name', tail)
+    page = _paginate(request, site_list)
 
     table = Table('Country', 'Site name', 'Area', 'Responsible', 'Site owner ID')
-    table.rows = [_site_table(item['site'], item['owner']) for item in site_list]
+    table.rows = [_site_table(item['site'], item['owner']) for item in page]
     table.no_badges = True
 
-    return render(request, 'noclook/list/list_generic.html',
-                  {'table': table, 'name': 'Sites', 'urls': urls})
+    return _render_list(request, table, 'Sites', page)
 
 
 def _pdu_table(pdu):
@@ -699,24 +650,17 @@ def _pdu_table(pdu):
 
 @login_required
 def list_pdu(request):
-    q = """
-        MATCH (pdu:PDU)
-        RETURN pdu
-        ORDER BY pdu.name
-        """
-
-    pdu_list = nc.query_to_list(nc.graphdb.manager, q)
-    pdu_list = _filter_expired(pdu_list, request, select=lambda n: n.get('pdu'))
-    pdu_list = _filter_operational_state(pdu_list, request, select=lambda n: n.get('pdu'))
-    urls = get_node_urls(pdu_list)
+    pdu_list = QueryList('MATCH (pdu:PDU)', 'pdu', 'pdu.name')
+    _filter_expired(pdu_list, request)
+    _filter_operational_state(pdu_list, request)
+    page = _paginate(request, pdu_list)
 
     table = Table('Name', 'Type', 'Description')
-    table.rows = [_pdu_table(item['pdu']) for item in pdu_list]
+    table.rows = [_pdu_table(item['pdu']) for item in page]
     _set_filters_expired(table, request)
     _set_filters_operational_state(table, request)
 
-    return render(request, 'noclook/list/list_generic.html',
-                  {'table': table, 'name': 'PDUs', 'urls': urls})
+    return _render_list(request, table, 'PDUs', page)
 
 
 def _external_equipment_table(equipment, owner):
@@ -727,21 +671,18 @@ def _external_equipment_table(equipment, owner):
 
 @login_required
 def list_external_equipment(request):
-    q = """
-        MATCH (equipment:External_Equipment)
+    tail = """
         OPTIONAL MATCH (equipment)<-[:Owns]-(owner:Node)
         RETURN equipment, owner
         ORDER BY equipment.name
         """
-    equipment_list = nc.query_to_list(nc.graphdb.manager, q)
-
-    urls = get_node_urls(equipment_list)
+    equipment_list = QueryList('MATCH (equipment:External_Equipment)', 'equipment', 'equipment.name', tail)
+    page = _paginate(request, equipment_list)
 
     table = Table('Name', 'Description', 'Owner')
-    table.rows = [_external_equipment_table(item['equipment'], item['owner']) for item in equipment_list]
+    table.rows = [_external_equipment_table(item['equipment'], item['owner']) for item in page]
 
-    return render(request, 'noclook/list/list_generic.html',
-                  {'table': table, 'name': 'External Equipment', 'urls': urls})
+    return _render_list(request, table, 'External Equipment', page)
 
 
 def _docker_image_table(image):
@@ -751,17 +692,10 @@ def _docker_image_table(image):
 
 @login_required
 def list_docker_images(request):
-    q = """
-        MATCH (image:Docker_Image)
-        RETURN image
-        ORDER BY image.name
-        """
-
-    docker_image_list = nc.query_to_list(nc.graphdb.manager, q)
-    urls = get_node_urls(docker_image_list)
+    docker_image_list = QueryList('MATCH (image:Docker_Image)', 'image', 'image.name')
+    page = _paginate(request, docker_image_list)
 
     table = Table('Docker Image', 'Tags', 'Description')
-    table.rows = [_docker_image_table(item['image']) for item in docker_image_list]
+    table.rows = [_docker_image_table(item['image']) for item in page]
 
-    return render(request, 'noclook/list/list_generic.html',
-                  {'name': 'Docker Images', 'table': table, 'urls': urls})
+    return _render_list(request, table, 'Docker Images', page)
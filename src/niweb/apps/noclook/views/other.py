@@ -7,12 +7,11 @@ from django.contrib.auth import logout
 from django.http import HttpResponse, Http404
 from django.shortcuts import get_object_or_404, render, redirect
 from django.conf import settings
-from re import escape as re_escape
 import json
 
 from apps.noclook.models import NodeHandle, NodeType
 from apps.noclook import arborgraph
-from apps.noclook import helpers
+from apps.noclook import helpers, report_cache
 import graphdb as nc
 
 
@@ -83,29 +82,16 @@ def search(request, value='', form=None):
         value = request.POST.get('q', '')
         posted = True
     if value:
-        query = u'(?i).*{}.*'.format(re_escape(value))
-        # nodes = nc.search_nodes_by_value(nc.graphdb.manager, query)
-        # TODO: when search uses the above go back to that
-        q = """
-            match (n:Node) 
-            with n, toLower(coalesce(n.name, "")) as title, toLower($search_value) as search
-            where any(prop in keys(n) where n[prop] =~ $search) 
-            with n, case 
-                when title = search then 3
-                when title starts with search then 2
-                when title contains search then 1
-                else 0 
-                end as title_match
-            return n order by title_match desc, n.name
-            """
-        nodes = nc.query_to_list(nc.graphdb.manager, q, search=query, search_value=value)
+        # Exports get every match, the result page is limited to SEARCH_LIMIT nodes
+        limit = None if form in ('csv', 'xls') else nc.SEARCH_LIMIT
+        nodes = nc.fulltext_search(nc.graphdb.manager, value, limit=limit)
         if form == 'csv':
-            return helpers.dicts_to_csv_response([n['n'] for n in nodes])
+            return helpers.dicts_to_csv_response(nodes)
         elif form == 'xls':
-            return helpers.dicts_to_xls_response([n['n'] for n in nodes])
+            return helpers.dicts_to_xls_response(nodes)
         for node in nodes:
-            nh = get_object_or_404(NodeHandle, pk=node['n']['handle_id'])
-            item = {'node': node['n'], 'nh': nh}
+            nh = get_object_or_404(NodeHandle, pk=node['handle_id'])
+            item = {'node': node, 'nh': nh}
             result.append(item)
         if len(result) == 1:
             return redirect(result[0]['nh'].get_absolute_url())
@@ -138,10 +124,18 @@ def search_autocomplete(request):
     return False
 
 
-def regex_escape(_in):
-    if type(_in) is list:
-        return map(regex_escape, _in)
-    return re_escape(_in)
+def _typeahead_limit(request):
+    try:
+        return int(request.GET.get('limit', nc.TYPEAHEAD_LIMIT))
+    except ValueError:
+        return nc.TYPEAHEAD_LIMIT
+
+
+def _type_suffix(result):
+    for r in result:
+        _type = [lab for lab in r['labels'] if lab not in ['Node', 'Physical', 'Logical', 'Relation']]
+        if _type:
+            r['name'] = u'{} [{}]'.format(r['name'], _type[0])
 
 
 @login_required
@@ -150,28 +144,10 @@ def search_port_typeahead(request):
     to_find = request.GET.get('query', None)
     result = []
     if to_find:
-        # split for search
-        match_q = regex_escape(to_find.split())
-        try:
-            # TODO: check if size(nodes(p))/size(path) in neo4j>=4.4 is equivalent to length(nodes(p))/length(path) in neo4j==3.5
-            q = """
-                MATCH (port:Port)<-[:Has]-(n:Node)
-                OPTIONAL MATCH (n)-[:Located_in]->(n2:Node)
-                OPTIONAL MATCH p = () - [:Has * 0..20]->(n2)
-                WITH COLLECT(nodes(p)) as paths, MAX(size(nodes(p))) AS maxLength,
-                 port.handle_id AS handle_id, n.handle_id AS parent_id,
-                 port.name AS port_name, n.name AS node_name
-                WITH [path IN paths WHERE size(path) = maxLength] AS longestPaths,
-                 handle_id AS handle_id, parent_id AS parent_id, port_name AS port_name, node_name AS node_name
-                UNWIND(longestPaths) AS location_path
-                WITH REDUCE(s = "", n IN location_path | s + n.name + " ") + node_name + " " + port_name AS name, handle_id, parent_id
-                WHERE name =~ $name_re
-                RETURN name, handle_id, parent_id
-                """
-            name_re = '(?i).*{}.*'.format('.*'.join(match_q))
-            result = nc.query_to_list(nc.graphdb.manager, q, name_re=name_re)
-        except Exception as e:
-            raise e
+        # Ports are named by the longest location path, the parent name and the port name
+        matches = nc.typeahead_search(nc.graphdb.manager, to_find, prop=nc.TYPEAHEAD_PATH, labels=['Port'],
+                                      limit=_typeahead_limit(request))
+        result = [{'name': r['name'], 'handle_id': r['handle_id'], 'parent_id': r['parent_id']} for r in matches]
     json.dump(result, response)
     return response
 
@@ -182,23 +158,10 @@ def search_location_typeahead(request):
     to_find = request.GET.get('query', None)
     result = []
     if to_find:
-        # split for search
-        match_q = regex_escape(to_find.split())
-        try:
-            # find all has relations to the top
-            q = """
-                MATCH p = (:Location) - [:Has * 0..20]-> (l:Location)
-                WITH COLLECT(nodes(p)) as paths, MAX(size(nodes(p))) AS maxLength, l.handle_id as handle_id
-                WITH [path IN paths WHERE size(path) = maxLength | path ] AS longestPaths, handle_id as handle_id
-                UNWIND(longestPaths) AS location_path
-                WITH REDUCE(s = "", n IN location_path | s + n.name + " ") AS name, handle_id
-                WHERE name =~ $name_re
-                RETURN name, handle_id
-                """
-            name_re = '(?i).*{}.*'.format('.*'.join(match_q))
-            result = nc.query_to_list(nc.graphdb.manager, q, name_re=name_re)
-        except Exception as e:
-            raise e
+        # Locations are named by the longest Has path from the top location
+        matches = nc.typeahead_search(nc.graphdb.manager, to_find, prop=nc.TYPEAHEAD_PATH, labels=['Location'],
+                                      limit=_typeahead_limit(request))
+        result = [{'name': r['name'], 'handle_id': r['handle_id']} for r in matches]
     json.dump(result, response)
     return response
 
@@ -209,29 +172,10 @@ def search_non_location_typeahead(request):
     to_find = request.GET.get('query', None)
     result = []
     if to_find:
-        # split for search
-        match_q = regex_escape(to_find.split())
-        try:
-            q = """
-                MATCH (n:Node)
-                WHERE not n:Location
-                OPTIONAL MATCH (n)<-[:Has]-(e:Node)
-                WITH n.handle_id as handle_id,
-                     coalesce(e.name, "") + " "+ n.name as name,
-                     labels(n) as labels
-                WHERE name =~ $name_re
-                RETURN handle_id, trim(name) as name, labels ORDER BY name
-                """
-            name_re = '(?i).*{}.*'.format('.*'.join(match_q))
-
-            result = nc.query_to_list(nc.graphdb.manager, q, name_re=name_re)
-        except Exception as e:
-            raise e
-    for r in result:
-        _type = [l for l in r['labels'] if l not in ['Node', 'Physical', 'Logical', 'Relation']]
-        if _type:
-            r['name'] = u'{} [{}]'.format(r['name'], _type[0])
-    # TODO: do stuff with labels
+        matches = nc.typeahead_search(nc.graphdb.manager, to_find, exclude_labels=['Location'],
+                                      limit=_typeahead_limit(request))
+        result = [{'handle_id': r['handle_id'], 'name': r['name'], 'labels': r['labels']} for r in matches]
+    _type_suffix(result)
     json.dump(result, response)
     return response
 
@@ -242,30 +186,11 @@ def typeahead_slugs(request, slug='Node'):
     to_find = request.GET.get('query', None)
     result = []
     if to_find:
-        # split for search
-        match_q = regex_escape(to_find.split())
         labels = [helpers.slug_to_node_type(s).get_label() for s in slug.split('+')]
-        try:
-            q = """
-                MATCH (n:Node)
-                WHERE any(label in labels(n) where label in $labels)
-                OPTIONAL MATCH (n)<-[:Has]-(e:Node)
-                WITH n.handle_id as handle_id,
-                     coalesce(e.name, "") + " "+ n.name as name,
-                     labels(n) as labels
-                WHERE name =~ $name_re
-                RETURN handle_id, trim(name) as name, labels ORDER BY name
-                """
-            name_re = '(?i).*{}.*'.format('.*'.join(match_q))
-            result = nc.query_to_list(nc.graphdb.manager, q, labels=labels, name_re=name_re)
-        except Exception as e:
-            raise e
+        matches = nc.typeahead_search(nc.graphdb.manager, to_find, labels=labels, limit=_typeahead_limit(request))
+        result = [{'handle_id': r['handle_id'], 'name': r['name'], 'labels': r['labels']} for r in matches]
     if '+' in slug:
-        for r in result:
-            _type = [lab for lab in r['labels'] if lab not in ['Node', 'Physical', 'Logical', 'Relation']]
-            if _type:
-                r['name'] = u'{} [{}]'.format(r['name'], _type[0])
-
+        _type_suffix(result)
     json.dump(result, response)
     return response
 
@@ -343,6 +268,13 @@ def gmaps_sites(request):
         edges: []
     }
     """
+    data = report_cache.cached('gmaps_sites', ['site'], _gmaps_sites)
+    response = HttpResponse(content_type='application/json')
+    json.dump(data, response)
+    return response
+
+
+def _gmaps_sites():
     sites = nc.get_nodes_by_type(nc.graphdb.manager, 'Site')
     site_list = []
     for site in sites:
@@ -356,9 +288,7 @@ def gmaps_sites(request):
         except KeyError:
             continue
         site_list.append(site)
-    response = HttpResponse(content_type='application/json')
-    json.dump({'nodes': site_list, 'edges': []}, response)
-    return response
+    return {'nodes': site_list, 'edges': []}
 
 
 @login_required
@@ -382,6 +312,13 @@ def gmaps_optical_nodes(request):
         }
     ]
     """
+    data = report_cache.cached('gmaps_optical_nodes', ['cable', 'optical-node', 'port', 'site'], _gmaps_optical_nodes)
+    response = HttpResponse(content_type='application/json')
+    json.dump(data, response)
+    return response
+
+
+def _gmaps_optical_nodes():
     # Cypher query to get all cables with cable type fiber that are connected
     # to two optical node.
     q = """
@@ -420,9 +357,7 @@ def gmaps_optical_nodes(request):
             edges[item['cable']['name']]['end_points'].append(coords)
         else:
             edges[item['cable']['name']] = edge
-    response = HttpResponse(content_type='application/json')
-    json.dump({'nodes': list(nodes.values()), 'edges': list(edges.values())}, response)
-    return response
+    return {'nodes': list(nodes.values()), 'edges': list(edges.values())}
 
 
 @login_required
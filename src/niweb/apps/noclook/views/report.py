@@ -14,9 +14,12 @@ from django.http import Http404
 from apps.noclook.forms import get_node_type_tuples, SearchIdForm
 from apps.noclook.forms.reports import HostReportForm
 from apps.noclook.models import NordunetUniqueId, NodeHandle
-from apps.noclook import helpers
+from apps.noclook import helpers, report_cache
 import graphdb as nc
 
+# NodeType slugs read by the host users report
+HOST_USERS_TYPES = ['host', 'host-user']
+
 
 @login_required
 def host_reports(request):
@@ -82,7 +85,7 @@ def host_users(request, host_user_name=None):
             {where}
             RETURN host_user, collect(DISTINCT {data: host, type: [x in labels(host) where not x in ['Node', 'Host']]}) as hosts
             """.replace("{where}", form.to_where())
-        hosts = nc.query_to_list(nc.graphdb.manager, q, handle_id=host_user_id)
+        hosts = report_cache.query_to_list(HOST_USERS_TYPES, q, handle_id=host_user_id)
     elif host_user_name == "Missing":
         q = """
             MATCH (host:Host)
@@ -91,14 +94,14 @@ def host_users(request, host_user_name=None):
           """.replace(
             "{where}", form.to_where(additional="NOT (host)<-[:Uses|Owns]-()")
         )
-        hosts = nc.query_to_list(nc.graphdb.manager, q)
+        hosts = report_cache.query_to_list(HOST_USERS_TYPES, q)
     elif host_user_name == "All" or host_user_name is None:
         q = """
             MATCH (host_user:Host_User)-[:Uses|Owns]->(host:Host) 
             {where}
             RETURN host_user, collect(DISTINCT {data: host, type: [x in labels(host) where not x in ['Node', 'Host']]}) as hosts
             """.replace("{where}", form.to_where())
-        hosts = nc.query_to_list(nc.graphdb.manager, q)
+        hosts = report_cache.query_to_list(HOST_USERS_TYPES, q)
     num_of_hosts = 0
     for item in hosts:
         num_of_hosts += len(item["hosts"])
@@ -136,7 +139,7 @@ def host_security_class(request, status=None, form=None):
             """
         % where_statement
     )
-    hosts = nc.query_to_list(nc.graphdb.manager, q)
+    hosts = report_cache.query_to_list(['host'], q)
     urls = helpers.get_node_urls(hosts)
     return render(
         request,
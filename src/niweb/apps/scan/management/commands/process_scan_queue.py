@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+
+import multiprocessing
+import os
+import socket
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+import graphdb as nc
+from apps.scan import worker
+
+
+def _run_worker(name, options):
+    # Forked processes must not share the parent's database connections or Neo4j driver
+    nc.graphdb.manager = nc.init_db()
+    worker.run(name, once=options['once'], poll_interval=options['poll_interval'], lease=options['lease'],
+               max_attempts=options['max_attempts'], backoff=options['backoff'])
+
+
+class Command(BaseCommand):
+    help = 'Processes the scan queue with a pool of worker processes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4, help='Number of worker processes')
+        parser.add_argument('--once', action='store_true', help='Exit when no items are due instead of polling')
+        parser.add_argument('--poll-interval', type=float, default=5, help='Seconds between polls of an empty queue')
+        parser.add_argument('--lease', type=int, default=worker.LEASE_SECONDS,
+                            help='Seconds before an unfinished item can be claimed by another worker')
+        parser.add_argument('--max-attempts', type=int, default=worker.MAX_ATTEMPTS,
+                            help='Times an item is tried before it is failed')
+        parser.add_argument('--backoff', type=int, default=worker.BACKOFF_SECONDS,
+                            help='Seconds before a failed item is retried, doubled for every attempt')
+
+    def handle(self, *args, **options):
+        prefix = '{}-{}'.format(socket.gethostname(), os.getpid())
+        if options['workers'] < 2:
+            claimed = worker.run(prefix, once=options['once'], poll_interval=options['poll_interval'],
+                                 lease=options['lease'], max_attempts=options['max_attempts'],
+                                 backoff=options['backoff'])
+            self.stdout.write('Processed {} queue items.'.format(claimed))
+            return
+        connections.close_all()
+        context = multiprocessing.get_context('fork')
+        processes = [context.Process(target=_run_worker, args=('{}-{}'.format(prefix, i), options))
+                     for i in range(options['workers'])]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+        failed = [process for process in processes if process.exitcode != 0]
+        if failed:
+            self.stderr.write('{} of {} workers failed.'.format(len(failed), len(processes)))
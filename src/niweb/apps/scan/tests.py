@@ -1,3 +1,107 @@
-from django.test import TestCase
+import json
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from . import worker
+from .models import QueueItem
+
+
+@override_settings(SCAN_COMMANDS={})
+class WorkerTest(TestCase):
+
+    def test_claim(self):
+        first = QueueItem.objects.create(type='Host', data='host1.test.dev')
+        QueueItem.objects.create(type='Host', data='host2.test.dev', run_after=timezone.now() + timedelta(hours=1))
+        item = worker.claim('worker-1')
+        self.assertEqual(first.pk, item.pk)
+        self.assertEqual('PROCESSING', item.status)
+        self.assertEqual(1, item.attempts)
+        # Claimed and not yet due items are skipped
+        self.assertIsNone(worker.claim('worker-2'))
+
+    def test_expired_lease(self):
+        QueueItem.objects.create(type='Host', data='host1.test.dev')
+        worker.claim('worker-1', lease=-1)
+        item = worker.claim('worker-2')
+        self.assertEqual('worker-2', item.worker)
+        self.assertEqual(2, item.attempts)
+
+        QueueItem.objects.filter(pk=item.pk).update(lease_expires=timezone.now() - timedelta(seconds=1))
+        self.assertIsNone(worker.claim('worker-3', max_attempts=2))
+        self.assertEqual('FAILED', QueueItem.objects.get(pk=item.pk).status)
+
+    def test_retry(self):
+        QueueItem.objects.create(type='Host', data='host1.test.dev')
+        item = worker.claim('worker-1')
+        self.assertFalse(worker.process(item, max_attempts=2, backoff=60))
+        item.refresh_from_db()
+        self.assertEqual('QUEUED', item.status)
+        self.assertIn('No scan command', item.error)
+        self.assertGreater(item.run_after, timezone.now())
+
+        QueueItem.objects.filter(pk=item.pk).update(run_after=None)
+        item = worker.claim('worker-1')
+        worker.process(item, max_attempts=2)
+        self.assertEqual('FAILED', QueueItem.objects.get(pk=item.pk).status)
+
+    @override_settings(SCAN_COMMANDS={'Host': 'scan-host --json'})
+    def test_process(self):
+        nerds = {'host': {'name': 'host1.test.dev', 'nmap_services_py': {}}}
+        QueueItem.objects.create(type='Host', data='host1.test.dev')
+        with mock.patch.object(worker.subprocess, 'run') as run, \
+                mock.patch.object(worker, 'get_consumer') as get_consumer:
+            run.return_value.stdout = json.dumps(nerds).encode('utf-8')
+            self.assertEqual(1, worker.run('worker-1', once=True))
+        self.assertEqual(['scan-host', '--json', '--', 'host1.test.dev'], run.call_args[0][0])
+        self.assertLess(run.call_args[1]['timeout'], worker.LEASE_SECONDS)
+        get_consumer.assert_called_once_with(nerds)
+        item = QueueItem.objects.get()
+        self.assertEqual('DONE', item.status)
+        self.assertIsNotNone(item.duration)
+
+    @override_settings(SCAN_COMMANDS={'Host': 'scan-host', 'Router': 'scan-router'})
+    def test_invalid_target(self):
+        nerds = {'host': {'name': 'host1.test.dev', 'nmap_services_py': {}}}
+        QueueItem.objects.create(type='Host', data=json.dumps(nerds))
+        QueueItem.objects.create(type='Router', data=json.dumps({'target': '-oX /tmp/out'}))
+        with mock.patch.object(worker.subprocess, 'run') as run, \
+                mock.patch.object(worker, 'get_consumer') as get_consumer:
+            self.assertEqual(2, worker.run('worker-1', once=True, max_attempts=1))
+        run.assert_not_called()
+        get_consumer.assert_not_called()
+        for item in QueueItem.objects.all():
+            self.assertEqual('FAILED', item.status)
+            self.assertIn('not a host name', item.error)
+
+    @override_settings(SCAN_COMMANDS={'Host': 'scan-host'})
+    def test_lost_lease(self):
+        QueueItem.objects.create(type='Host', data='host1.test.dev')
+        item = worker.claim('worker-1', lease=-1)
+        worker.claim('worker-2')
+        with mock.patch.object(worker.subprocess, 'run') as run, \
+                mock.patch.object(worker, 'get_consumer') as get_consumer:
+            run.return_value.stdout = b'{"host": {}}'
+            self.assertFalse(worker.process(item))
+        get_consumer.assert_not_called()
+        item = QueueItem.objects.get()
+        self.assertEqual('PROCESSING', item.status)
+        self.assertEqual('worker-2', item.worker)
+
+
+class ViewsTest(TestCase):
+
+    def test_login_required(self):
+        self.client.post(reverse('scan:host'), {'data': 'host1.test.dev'})
+        self.assertFalse(QueueItem.objects.exists())
+
+    def test_invalid_target(self):
+        user = User.objects.create_user('scanner', password='secret')
+        self.client.force_login(user)
+        self.client.post(reverse('scan:host'), {'data': '--script=evil host1.test.dev'})
+        self.client.post(reverse('scan:router'), {'target': 'rtr1.test.dev'})
+        self.assertEqual(['Router'], [item.type for item in QueueItem.objects.all()])
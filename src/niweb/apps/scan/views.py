@@ -5,8 +5,10 @@ from django.views import generic
 from django.urls import reverse
 from django.http import HttpResponseRedirect
 from django.contrib import messages
+from django.contrib.auth.decorators import login_required
 
 from .models import QueueItem
+from .worker import is_valid_target
 
 # Create your views here.
 
@@ -19,10 +21,13 @@ class QueueIndexView(generic.ListView):
         return QueueItem.objects.order_by("-created_at")[:10]
 
 
+@login_required
 def host(request):
     if request.POST:
-        if request.POST["data"]:
-            hostname = request.POST["data"]
+        hostname = request.POST.get("data", "").strip()
+        if hostname and not is_valid_target(hostname):
+            messages.error(request, "{0} is not a host name or IP address".format(hostname))
+        elif hostname:
             item = QueueItem(type="Host", data=hostname)
             item.save()
             # Do stuff with hostname
@@ -32,10 +37,13 @@ def host(request):
     return HttpResponseRedirect(reverse("scan:queue"))
 
 
+@login_required
 def router(request):
     if request.POST:
         target = request.POST.get("target", "").strip()
-        if target:
+        if target and not is_valid_target(target):
+            messages.error(request, "{} is not a host name or IP address".format(target))
+        elif target:
             item = QueueItem(type="Router", data=json.dumps({"target": target}))
             item.save()
             messages.success(request, "Added {} to the router scan queue".format(target))
@@ -47,10 +55,14 @@ def router(request):
     return HttpResponseRedirect(reverse("scan:queue"))
 
 
+@login_required
 def rescan(request, pk):
     if request.POST:
         item = get_object_or_404(QueueItem, pk=pk)
         item.status = "QUEUED"
+        item.attempts = 0
+        item.run_after = None
+        item.error = ""
         item.save()
         messages.info(request, "Rescanning {0} {1}".format(item.type, item.data))
     return HttpResponseRedirect(reverse("scan:queue"))
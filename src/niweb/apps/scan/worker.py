@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+"""
+Claims and processes scan QueueItems. Several workers, in one or more processes, can share the queue, each item is
+claimed with SELECT ... FOR UPDATE SKIP LOCKED and leased to one worker. Items whose lease runs out, because the
+worker died, are claimed again by the next worker.
+"""
+
+import ipaddress
+import json
+import logging
+import re
+import shlex
+import subprocess
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from apps.nerds.nerds import get_consumer
+from .models import QueueItem
+
+logger = logging.getLogger(__name__)
+
+LEASE_SECONDS = 600
+MAX_ATTEMPTS = 5
+BACKOFF_SECONDS = 60
+
+_HOSTNAME = re.compile(r'^(?=.{1,253}$)[A-Za-z0-9](?:[A-Za-z0-9-]{0,61}[A-Za-z0-9])?'
+                       r'(?:\.[A-Za-z0-9](?:[A-Za-z0-9-]{0,61}[A-Za-z0-9])?)*\.?$')
+
+
+class LeaseExpired(Exception):
+    pass
+
+
+def is_valid_target(target):
+    """
+    :return: True if target is a host name or an IP address
+    :rtype: bool
+    """
+    try:
+        ipaddress.ip_address(target)
+        return True
+    except ValueError:
+        return bool(_HOSTNAME.match(target))
+
+
+def claim(worker, lease=LEASE_SECONDS, max_attempts=MAX_ATTEMPTS):
+    """
+    Claims the oldest queued item that is due, or a processing item with an expired lease. Items with expired leases
+    that have been tried max_attempts times are failed instead.
+
+    :param worker: Name of the worker
+    :param lease: Seconds the item is leased to the worker
+    :param max_attempts: Number of times an item is tried
+    :return: QueueItem or None
+    """
+    now = timezone.now()
+    due = Q(status='QUEUED') & (Q(run_after__isnull=True) | Q(run_after__lte=now))
+    stale = Q(status='PROCESSING', lease_expires__lt=now)
+    QueueItem.objects.filter(stale, attempts__gte=max_attempts).update(
+        status='FAILED', error='Lease expired', lease_expires=None, updated_at=now)
+    with transaction.atomic():
+        item = QueueItem.objects.select_for_update(skip_locked=True).filter(due | stale).order_by('created_at').first()
+        if item is None:
+            return None
+        if item.status == 'PROCESSING':
+            logger.warning('Lease of %s held by %s expired, reclaiming it.', item, item.worker)
+        item.status = 'PROCESSING'
+        item.worker = worker
+        item.lease_expires = now + timedelta(seconds=lease)
+        item.attempts += 1
+        item.save(update_fields=['status', 'worker', 'lease_expires', 'attempts', 'updated_at'])
+    return item
+
+
+def renew(item, lease=LEASE_SECONDS):
+    """
+    Extends the lease of a claimed item.
+
+    :return: False if the worker no longer holds the item
+    :rtype: bool
+    """
+    now = timezone.now()
+    return QueueItem.objects.filter(pk=item.pk, worker=item.worker, status='PROCESSING').update(
+        lease_expires=now + timedelta(seconds=lease), updated_at=now) == 1
+
+
+def get_target(item):
+    """
+    Returns the host name or router of an item. Host items hold the name, router items a JSON object with target.
+    """
+    try:
+        data = json.loads(item.data)
+    except ValueError:
+        data = None
+    target = data.get('target', '') if isinstance(data, dict) else item.data
+    target = str(target).strip()
+    if not is_valid_target(target):
+        raise ValueError('{!r} is not a host name or IP address'.format(target[:100]))
+    return target
+
+
+def get_nerds(item, timeout=LEASE_SECONDS / 2):
+    """
+    Runs the SCAN_COMMANDS command for the item type with the target as last argument, after --, and returns the
+    NERDS document it prints. Documents are never taken from the queued data, anyone allowed to queue items could
+    write anything to the database that way.
+    """
+    target = get_target(item)
+    command = getattr(settings, 'SCAN_COMMANDS', {}).get(item.type)
+    if not command:
+        raise ValueError('No scan command configured for {} items'.format(item.type))
+    args = shlex.split(command) + ['--', target]
+    output = subprocess.run(args, check=True, capture_output=True, timeout=timeout).stdout
+    return json.loads(output)
+
+
+def process(item, max_attempts=MAX_ATTEMPTS, backoff=BACKOFF_SECONDS, lease=LEASE_SECONDS):
+    """
+    Scans a claimed item and runs the NERDS consumer for the result. Failed items are queued again after
+    backoff * 2 ** (attempts - 1) seconds until they have been tried max_attempts times.
+
+    The scan may use half of the lease, the lease is renewed before the result is consumed. The result is only
+    recorded if the worker still holds the item, an item whose lease expired belongs to the worker that claimed it
+    again.
+
+    :return: True if the item was processed
+    :rtype: bool
+    """
+    start = time.monotonic()
+    try:
+        nerds = get_nerds(item, timeout=lease / 2)
+        if not renew(item, lease):
+            raise LeaseExpired()
+        consumer = get_consumer(nerds)
+        if consumer is None:
+            raise ValueError('No NERDS consumer matches the scan result')
+        consumer.process()
+    except LeaseExpired:
+        logger.warning('Lease of %s expired before %s consumed the scan result.', item, item.worker)
+        return False
+    except Exception as e:
+        logger.exception('Scan of %s failed.', item)
+        item.error = '{}: {}'.format(type(e).__name__, e)
+        if item.attempts < max_attempts:
+            item.status = 'QUEUED'
+            item.run_after = timezone.now() + timedelta(seconds=backoff * 2 ** (item.attempts - 1))
+        else:
+            item.status = 'FAILED'
+        processed = False
+    else:
+        item.status = 'DONE'
+        item.error = ''
+        processed = True
+    item.duration = time.monotonic() - start
+    item.lease_expires = None
+    finished = QueueItem.objects.filter(pk=item.pk, worker=item.worker, status='PROCESSING').update(
+        status=item.status, run_after=item.run_after, error=item.error, duration=item.duration, lease_expires=None,
+        updated_at=timezone.now())
+    if not finished:
+        logger.warning('Lease of %s expired before %s finished it, the result is dropped.', item, item.worker)
+        return False
+    logger.info('Queue item %s %s in %.1f seconds.', item.pk, item.status, item.duration)
+    return processed
+
+
+def run(worker, once=False, poll_interval=5, lease=LEASE_SECONDS, max_attempts=MAX_ATTEMPTS,
+        backoff=BACKOFF_SECONDS):
+    """
+    Processes items until the queue is empty if once is set, otherwise polls the queue forever.
+
+    :return: Number of items claimed
+    :rtype: int
+    """
+    claimed = 0
+    while True:
+        item = claim(worker, lease, max_attempts)
+        if item is None:
+            if once:
+                return claimed
+            time.sleep(poll_interval)
+            continue
+        claimed += 1
+        process(item, max_attempts, backoff, lease)
@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+
+import threading
+import time
+from collections import OrderedDict
+from copy import deepcopy
+
+__author__ = 'lundberg'
+
+
+class NodeBundleCache(object):
+    """
+    Bounded per-process LRU cache of node bundles keyed by handle_id. Entries expire after ttl seconds, which also
+    bounds how stale a node can get when it is changed by another process or by Cypher that does not go through
+    graphdb.core.
+
+    Bundles are copied in and out so callers can modify node data without affecting the cache.
+    """
+
+    def __init__(self, max_size=1000, ttl=60):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @property
+    def enabled(self):
+        return self.max_size > 0 and self.ttl > 0
+
+    def get(self, handle_id):
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._entries.get(handle_id)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._entries[handle_id]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(handle_id)
+            self.hits += 1
+            bundle = entry[1]
+        return deepcopy(bundle)
+
+    def set(self, handle_id, bundle):
+        if not self.enabled:
+            return
+        bundle = deepcopy(bundle)
+        with self._lock:
+            self._entries[handle_id] = (time.monotonic() + self.ttl, bundle)
+            self._entries.move_to_end(handle_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, *handle_ids):
+        with self._lock:
+            for handle_id in handle_ids:
+                if self._entries.pop(handle_id, None) is not None:
+                    self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+            }
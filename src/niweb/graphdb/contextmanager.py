@@ -1,7 +1,9 @@
 # -*- coding: utf-8 -*-
 
+import threading
 from contextlib import contextmanager
-from .core import get_db_driver
+from .core import get_db_driver, node_cache, nodes_written, query_stats
+from .instrumentation import InstrumentedSession
 
 __author__ = 'lundberg'
 
@@ -15,20 +17,50 @@ class Neo4jDBSessionManager:
     Neo4jDBSessionManager.session()
 
     Neo4jDBSessionManager.transaction()
+
+    Neo4jDBSessionManager.unit_of_work()
+
+    Inside a unit of work session and transaction return the transaction bound to the current thread, so everything
+    run through the manager (including all of graphdb.core) is committed once when the unit of work ends or rolled
+    back if it raises.
+
+    Statements run through the sessions and transactions handed out are recorded in graphdb.core.query_stats.
     """
 
     def __init__(self, uri, username=None, password=None, encrypted=True, max_pool_size=50):
         self.uri = uri
         self.driver = get_db_driver(uri, username, password, encrypted, max_pool_size)
+        self._local = threading.local()
+
+    @property
+    def bound_transaction(self):
+        return getattr(self._local, 'transaction', None)
+
+    def invalidate_nodes(self, *handle_ids):
+        """
+        Removes the nodes from graphdb.core.node_cache, call it after writing them. Inside a unit of work they are
+        removed again when it ends, other threads could have cached the last committed state in the meantime. The
+        graphdb.core.write_listeners are called now or when the unit of work ends.
+        """
+        node_cache.invalidate(*handle_ids)
+        if self.bound_transaction is not None:
+            self._local.written.update(handle_ids)
+        else:
+            nodes_written(handle_ids)
 
     @contextmanager
     def _session(self):
+        if self.bound_transaction is not None:
+            yield self.bound_transaction
+            return
         session = self.driver.session()
+        instrumented = InstrumentedSession(session, query_stats)
         try:
-            yield session
+            yield instrumented
         except Exception as e:
             raise e
         finally:
+            instrumented.finish()
             try:
                 session.close()
             except Exception:
@@ -37,18 +69,59 @@ class Neo4jDBSessionManager:
 
     @contextmanager
     def _transaction(self):
+        if self.bound_transaction is not None:
+            yield self.bound_transaction
+            return
         session = self.driver.session()
         transaction = session.begin_transaction()
+        instrumented = InstrumentedSession(transaction, query_stats)
         try:
-            yield transaction
+            yield instrumented
         except Exception as e:
             transaction.success = False
             raise e
         else:
             transaction.success = True
         finally:
+            instrumented.finish()
             try:
                 session.close()
             except Exception:
                 pass
     transaction = property(_transaction)
+
+    @contextmanager
+    def unit_of_work(self):
+        """
+        Binds a session and transaction to the current thread for the duration of the with block. Nested units of
+        work join the outermost one.
+        """
+        if self.bound_transaction is not None:
+            yield self.bound_transaction
+            return
+        session = self.driver.session()
+        transaction = session.begin_transaction()
+        instrumented = InstrumentedSession(transaction, query_stats)
+        self._local.transaction = instrumented
+        self._local.written = set()
+        try:
+            yield instrumented
+        except Exception as e:
+            transaction.success = False
+            raise e
+        else:
+            transaction.success = True
+        finally:
+            self._local.transaction = None
+            instrumented.finish()
+            try:
+                transaction.close()  # Commits or rolls back depending on success
+            finally:
+                written, self._local.written = self._local.written, set()
+                node_cache.invalidate(*written)
+                if written:
+                    nodes_written(written)
+                try:
+                    session.close()
+                except Exception:
+                    pass
@@ -22,14 +22,26 @@ from neo4j.v1 import GraphDatabase, basic_auth
 from neo4j.exceptions import ProtocolError, ClientError
 from . import exceptions
 from . import models
+from .cache import NodeBundleCache
+from .instrumentation import QueryStats
 
+from datetime import datetime
+import ipaddress
+import json
 import logging
+import re
+import time
 logger = logging.getLogger(__name__)
 
 # Load Django settings
 NEO4J_URI, NEO4J_USERNAME, NEO4J_PASSWORD = None, None, None
 MAX_POOL_SIZE = 50
 ENCRYPTED = False
+NODE_CACHE_SIZE = 1000
+NODE_CACHE_TTL = 60
+IMPACT_CACHE_TTL = 3600
+SLOW_QUERY_MS = 1000
+QUERY_STATS_DIR = None
 try:
     from django.conf import settings as django_settings
     try:
@@ -48,6 +60,26 @@ try:
         ENCRYPTED = django_settings.NEO4J_ENCRYPTED
     except AttributeError:
         pass
+    try:
+        NODE_CACHE_SIZE = int(django_settings.NEO4J_NODE_CACHE_SIZE)
+    except AttributeError:
+        pass
+    try:
+        NODE_CACHE_TTL = int(django_settings.NEO4J_NODE_CACHE_TTL)
+    except AttributeError:
+        pass
+    try:
+        IMPACT_CACHE_TTL = int(django_settings.NEO4J_IMPACT_CACHE_TTL)
+    except AttributeError:
+        pass
+    try:
+        SLOW_QUERY_MS = int(django_settings.NEO4J_SLOW_QUERY_MS)
+    except AttributeError:
+        pass
+    try:
+        QUERY_STATS_DIR = django_settings.NEO4J_QUERY_STATS_DIR
+    except AttributeError:
+        pass
 except ImportError:
     logger.info('Starting up without a Django environment.')
     logger.info('Initial: graphdb.neo4jdb == None.')
@@ -56,6 +88,58 @@ except ImportError:
 
 META_TYPES = ['Physical', 'Logical', 'Relation', 'Location']
 
+# Full-text search index over a denormalized text property maintained on every node
+SEARCH_INDEX = 'node_search'
+SEARCH_PROPERTY = 'search_text'
+SEARCH_LIMIT = 1000
+# Normalized addresses separated by spaces, full-text indexes only cover string properties
+IP_INDEX = 'node_ip_addresses'
+IP_PROPERTY = 'ip_keys'
+TYPEAHEAD_INDEX = 'node_typeahead'
+TYPEAHEAD_NAME = 'typeahead_name'
+TYPEAHEAD_PATH = 'typeahead_path'
+TYPEAHEAD_LIMIT = 50
+# Display names computed from the names of the node and its parents, kept when node properties are replaced
+TYPEAHEAD_PROPERTIES = (TYPEAHEAD_NAME, TYPEAHEAD_PATH)
+# handle_ids of the Has ancestors and of the location path of Physical and Location nodes, top down
+PLACEMENT_PATH = 'placement_path'
+LOCATION_PATH = 'location_path'
+PATH_PROPERTIES = (PLACEMENT_PATH, LOCATION_PATH)
+# Impact summaries, handle_ids per category as JSON, removed when the dependency graph around the node changes and
+# computed again after IMPACT_CACHE_TTL seconds
+DEPENDENTS_CACHE = 'impact_dependents'
+DEPENDENCIES_CACHE = 'impact_dependencies'
+# Bumped on every node whose summaries are invalidated, a computed summary is only stored if it did not change
+IMPACT_GENERATION = 'impact_generation'
+IMPACT_PROPERTIES = (DEPENDENTS_CACHE, DEPENDENCIES_CACHE, IMPACT_GENERATION)
+IMPACT_RELATIONSHIPS = ('Depends_on', 'Part_of', 'Connected_to', 'Has')
+# Longest Part_of, Depends_on and Has paths and longest Connected_to paths followed by the impact queries
+IMPACT_DEPTH = 20
+IMPACT_CONNECTED_DEPTH = 50
+# Properties derived from the other node properties or the surrounding graph, only used for lookups
+INDEX_PROPERTIES = (SEARCH_PROPERTY, IP_PROPERTY) + TYPEAHEAD_PROPERTIES + PATH_PROPERTIES + IMPACT_PROPERTIES
+
+# Node bundles fetched by handle_id, invalidated by the write functions in this module
+node_cache = NodeBundleCache(max_size=NODE_CACHE_SIZE, ttl=NODE_CACHE_TTL)
+# Latency and row counts of every statement run through a Neo4jDBSessionManager
+query_stats = QueryStats(slow_query_ms=SLOW_QUERY_MS, dump_dir=QUERY_STATS_DIR)
+# Functions called with the handle_ids of the nodes written by the functions in this module, once the unit of work
+# that wrote them has ended
+write_listeners = []
+
+
+def nodes_written(handle_ids):
+    """
+    Calls the write_listeners, a failing listener is logged and does not fail the write.
+
+    :param handle_ids: handle_ids of the written nodes
+    """
+    for listener in write_listeners:
+        try:
+            listener(handle_ids)
+        except Exception:
+            logger.exception('Write listener %r failed.', listener)
+
 
 class GraphDB(object):
 
@@ -115,6 +199,19 @@ def init_db(uri=NEO4J_URI, username=NEO4J_USERNAME, password=NEO4J_PASSWORD, enc
             except Exception as e:
                 logger.error('Could not create index for Neo4j database: {!s}'.format(uri))
                 raise e
+            try:
+                create_fulltext_index(manager)
+                create_fulltext_index(manager, IP_INDEX, IP_PROPERTY, analyzer='whitespace')
+                create_fulltext_index(manager, TYPEAHEAD_INDEX, TYPEAHEAD_PROPERTIES)
+            except ClientError as e:
+                if e.title == 'EquivalentSchemaRuleAlreadyExists':
+                    logger.info('Full-text index already exists')
+                else:
+                    logger.error('Could not create full-text index for Neo4j database: {!s}'.format(uri))
+                    raise e
+            except Exception as e:
+                logger.error('Could not create full-text index for Neo4j database: {!s}'.format(uri))
+                raise e
             return manager
         except ProtocolError as e:
             logger.warning('Could not connect to Neo4j database: {!s}'.format(uri))
@@ -175,7 +272,84 @@ def query_to_iterator(manager, query, **kwargs):
 
 
 def neo4j_entity_to_dict(node):
-    return {k: v for k, v in node.items()}
+    return {k: v for k, v in node.items() if k not in INDEX_PROPERTIES}
+
+
+def node_search_text(properties):
+    """
+    Returns the text that is indexed for full-text search, all string values of the node
+    properties (including strings in lists) separated by newlines.
+
+    :param properties: Node properties
+    :type properties: dict
+
+    :rtype: str
+    """
+    values = []
+    for key, value in properties.items():
+        if key in INDEX_PROPERTIES:
+            continue
+        if isinstance(value, (list, tuple)):
+            values.extend([v for v in value if isinstance(v, str)])
+        elif isinstance(value, str):
+            values.append(value)
+    return '\n'.join(values)
+
+
+def normalize_ip(address):
+    """
+    Returns the address without prefix length in its compressed form, '10.0.0.1/24' -> '10.0.0.1' and
+    'FE80:0::1/64' -> 'fe80::1'. Raises ValueError for invalid addresses.
+
+    :type address: str
+    :rtype: str
+    """
+    return str(ipaddress.ip_address(address.split('/')[0].strip()))
+
+
+def node_ip_keys(properties):
+    """
+    Returns the normalized addresses of the ip_addresses and ip_address node properties, invalid addresses are
+    skipped.
+
+    :param properties: Node properties
+    :type properties: dict
+
+    :rtype: list
+    """
+    addresses = list(properties.get('ip_addresses') or [])
+    if properties.get('ip_address'):
+        addresses.append(properties['ip_address'])
+    keys = []
+    for address in addresses:
+        try:
+            key = normalize_ip(address)
+        except (ValueError, AttributeError):
+            continue
+        if key not in keys:
+            keys.append(key)
+    return keys
+
+
+def node_index_properties(properties):
+    """
+    Returns the values of INDEX_PROPERTIES for the node properties. Properties that should be removed are None.
+
+    :param properties: Node properties
+    :type properties: dict
+
+    :rtype: dict
+    """
+    return {
+        SEARCH_PROPERTY: node_search_text(properties),
+        IP_PROPERTY: ' '.join(node_ip_keys(properties)) or None,
+    }
+
+
+def _with_index_properties(properties):
+    props = dict(properties)
+    props.update({k: v for k, v in node_index_properties(properties).items() if v is not None})
+    return props
 
 
 def create_node(manager, name, meta_type_label, type_label, handle_id):
@@ -198,12 +372,49 @@ def create_node(manager, name, meta_type_label, type_label, handle_id):
     """
     if meta_type_label not in META_TYPES:
         raise exceptions.MetaLabelNamingError(meta_type_label)
+    # A new node has no parents, its typeahead names are its name
     q = """
-        CREATE (n:Node:%s:%s { name: $name, handle_id: $handle_id})
+        CREATE (n:Node:%s:%s { name: $name, handle_id: $handle_id, %s: $search_text, %s: $name})
+        SET n.%s = CASE WHEN n:Location THEN $name END
         RETURN n
-        """ % (meta_type_label, type_label)
+        """ % (meta_type_label, type_label, SEARCH_PROPERTY, TYPEAHEAD_NAME, TYPEAHEAD_PATH)
+    search_text = node_search_text({'name': name})
     with manager.session as s:
-        return neo4j_entity_to_dict(s.run(q, {'name': name, 'handle_id': handle_id}).single()['n'])
+        node = s.run(q, {'name': name, 'handle_id': handle_id, 'search_text': search_text}).single()['n']
+    manager.invalidate_nodes(handle_id)
+    return neo4j_entity_to_dict(node)
+
+
+def create_nodes(manager, nodes, meta_type_label, type_label):
+    """
+    Bulk version of create_node, creates all nodes with one UNWIND statement.
+
+    :param manager: Manager to handle sessions and transactions
+    :param nodes: Dicts with the keys name and handle_id
+    :param meta_type_label: Node meta type
+    :param type_label: Node label
+
+    :type manager: graphdb.contextmanager.Neo4jDBSessionManager
+    :type nodes: list
+    :type meta_type_label: str|unicode
+    :type type_label: str|unicode
+
+    :rtype: list
+    """
+    if meta_type_label not in META_TYPES:
+        raise exceptions.MetaLabelNamingError(meta_type_label)
+    q = """
+        UNWIND $nodes AS node
+        CREATE (n:Node:%s:%s { name: node.name, handle_id: node.handle_id, %s: node.search_text, %s: node.name})
+        SET n.%s = CASE WHEN n:Location THEN node.name END
+        RETURN n
+        """ % (meta_type_label, type_label, SEARCH_PROPERTY, TYPEAHEAD_NAME, TYPEAHEAD_PATH)
+    nodes = [{'name': node['name'], 'handle_id': node['handle_id'],
+              'search_text': node_search_text({'name': node['name']})} for node in nodes]
+    with manager.session as s:
+        created = [neo4j_entity_to_dict(record['n']) for record in s.run(q, {'nodes': nodes})]
+    manager.invalidate_nodes(*[node['handle_id'] for node in nodes])
+    return created
 
 
 def get_node(manager, handle_id):
@@ -216,13 +427,7 @@ def get_node(manager, handle_id):
 
     :rtype: dict|neo4j.v1.types.Node
     """
-    q = 'MATCH (n:Node { handle_id: $handle_id }) RETURN n'
-
-    with manager.session as s:
-        result = s.run(q, {'handle_id': handle_id}).single()
-        if result:
-            return neo4j_entity_to_dict(result['n'])
-    raise exceptions.NodeNotFound(manager, handle_id)
+    return get_node_bundle(manager, handle_id)['data']
 
 
 def get_node_bundle(manager, handle_id=None, node=None):
@@ -234,6 +439,12 @@ def get_node_bundle(manager, handle_id=None, node=None):
     :type node: neo4j.v1.types.Node
     :return: dict
     """
+    # Data read inside a unit of work might be rolled back, bypass the cache
+    cache = not node and getattr(manager, 'bound_transaction', None) is None
+    if cache:
+        d = node_cache.get(handle_id)
+        if d is not None:
+            return d
     if not node:
         q = 'MATCH (n:Node { handle_id: $handle_id }) RETURN n'
         with manager.session as s:
@@ -251,6 +462,8 @@ def get_node_bundle(manager, handle_id=None, node=None):
             d['meta_type'] = label
             labels.remove(label)
     d['labels'] = labels
+    if cache:
+        node_cache.set(handle_id, d)
     return d
 
 
@@ -265,14 +478,71 @@ def delete_node(manager, handle_id):
     """
     q = """
         MATCH (n:Node {handle_id: $handle_id})
+        OPTIONAL MATCH (n)-[:Has]->(child:Node)
+        WITH n, collect(child.handle_id) AS children
+        OPTIONAL MATCH (n)<-[:Located_in]-(located:Node)
+        WITH n, children + collect(located.handle_id) AS affected
+        OPTIONAL MATCH (n)-[:%s]-(neighbour:Node)
+        WITH n, affected, collect(DISTINCT neighbour.handle_id) AS neighbours
         OPTIONAL MATCH (n)-[r]-()
         DELETE n,r
-        """
+        RETURN DISTINCT affected, neighbours
+        """ % '|'.join(IMPACT_RELATIONSHIPS)
     with manager.session as s:
-        s.run(q, {'handle_id': handle_id})
+        record = s.run(q, {'handle_id': handle_id}).single()
+    manager.invalidate_nodes(handle_id)
+    if record and record['affected']:
+        update_typeahead(manager, record['affected'])
+        update_location_paths(manager, record['affected'])
+    if record and record['neighbours']:
+        invalidate_impact(manager, record['neighbours'])
     return True
 
 
+def delete_nodes(manager, handle_ids, batch_size=1000):
+    """
+    Bulk version of delete_node, deletes the nodes and all their relationships with one statement per batch.
+
+    :param manager: Neo4jDBSessionManager
+    :param handle_ids: Unique ids
+    :param batch_size: Nodes deleted per statement
+
+    :return: Number of deleted nodes
+    :rtype: int
+    """
+    q = """
+        UNWIND $handle_ids AS handle_id
+        MATCH (n:Node {handle_id: handle_id})
+        OPTIONAL MATCH (n)-[:Has]->(child:Node)
+        WITH n, collect(child.handle_id) AS children
+        OPTIONAL MATCH (n)<-[:Located_in]-(located:Node)
+        WITH n, children + collect(located.handle_id) AS affected
+        OPTIONAL MATCH (n)-[:%s]-(neighbour:Node)
+        WITH n, affected, collect(DISTINCT neighbour.handle_id) AS neighbours
+        DETACH DELETE n
+        RETURN affected, neighbours
+        """ % '|'.join(IMPACT_RELATIONSHIPS)
+    handle_ids = list(handle_ids)
+    deleted, affected, neighbours = 0, set(), set()
+    for i in range(0, len(handle_ids), batch_size):
+        batch = handle_ids[i:i + batch_size]
+        with manager.session as s:
+            records = list(s.run(q, {'handle_ids': batch}))
+        manager.invalidate_nodes(*batch)
+        deleted += len(records)
+        for record in records:
+            affected.update(record['affected'])
+            neighbours.update(record['neighbours'])
+    # Nodes deleted in a later batch are simply not found
+    affected, neighbours = list(affected - set(handle_ids)), list(neighbours - set(handle_ids))
+    if affected:
+        update_typeahead(manager, affected)
+        update_location_paths(manager, affected)
+    if neighbours:
+        invalidate_impact(manager, neighbours)
+    return deleted
+
+
 def get_relationship(manager, relationship_id):
     """
     :param manager: Manager to handle sessions and transactions
@@ -324,6 +594,40 @@ def get_relationship_bundle(manager, relationship_id=None):
     }
 
 
+def get_nodes_with_relationships(manager, handle_ids, rel_type=None):
+    """
+    Returns the node data and all relationships of many nodes in one query. The relationship bundles
+    have the same keys as get_relationship_bundle but start and end only hold the handle_id.
+
+    :param manager: Neo4jDBSessionManager
+    :param handle_ids: Node handle_ids
+    :param rel_type: Only return relationships of this type
+
+    :type manager: Neo4jDBSessionManager
+    :type handle_ids: list
+    :type rel_type: str|None
+
+    :return: handle_id -> {'data': node data, 'relationships': list of relationship bundles}
+    :rtype: dict
+    """
+    q = """
+        UNWIND $handle_ids AS handle_id
+        MATCH (n:Node {handle_id: handle_id})
+        OPTIONAL MATCH (n)-[r]-()
+        WHERE $rel_type IS NULL OR type(r) = $rel_type
+        RETURN n, collect(CASE WHEN r IS NOT NULL THEN {id: id(r), type: type(r), data: properties(r),
+                                                          start: startNode(r).handle_id, end: endNode(r).handle_id}
+                              END) AS relationships
+        """
+    result = {}
+    for record in query_to_list(manager, q, handle_ids=list(handle_ids), rel_type=rel_type):
+        node = neo4j_entity_to_dict(record['n'])
+        relationships = [dict(r, start={'handle_id': r['start']}, end={'handle_id': r['end']})
+                         for r in record['relationships']]
+        result[node['handle_id']] = {'data': node, 'relationships': relationships}
+    return result
+
+
 def delete_relationship(manager, relationship_id):
     """
     Deletes the relationship.
@@ -333,15 +637,52 @@ def delete_relationship(manager, relationship_id):
     :return: bool
     """
     q = """
-        MATCH ()-[r]->()
+        MATCH (start)-[r]->(end)
         WHERE ID(r) = $relationship_id
+        WITH start, end, r, type(r) AS type
         DELETE r
+        RETURN start.handle_id AS start, end.handle_id AS end, type
         """
     with manager.session as s:
-        s.run(q, {'relationship_id': int(relationship_id)})
+        record = s.run(q, {'relationship_id': int(relationship_id)}).single()
+    if record:
+        manager.invalidate_nodes(record['start'], record['end'])
+        relationships_changed(manager, [(record['start'], record['end'], record['type'])])
     return True
 
 
+def delete_relationships(manager, relationship_ids, batch_size=1000):
+    """
+    Bulk version of delete_relationship.
+
+    :param manager: Neo4jDBSessionManager
+    :param relationship_ids: Internal Neo4j relationship ids
+    :param batch_size: Relationships deleted per statement
+
+    :return: The deleted relationships as dicts with id, type, data, start and end handle_ids
+    :rtype: list
+    """
+    q = """
+        UNWIND $relationship_ids AS relationship_id
+        MATCH (start)-[r]->(end)
+        WHERE ID(r) = relationship_id
+        WITH start, end, r, {id: relationship_id, type: type(r), data: properties(r), start: start.handle_id,
+                             end: end.handle_id} AS relationship
+        DELETE r
+        RETURN relationship
+        """
+    relationship_ids = [int(i) for i in relationship_ids]
+    deleted = []
+    for i in range(0, len(relationship_ids), batch_size):
+        with manager.session as s:
+            deleted += [record['relationship'] for record in
+                        s.run(q, {'relationship_ids': relationship_ids[i:i + batch_size]})]
+    if deleted:
+        manager.invalidate_nodes(*set(r['start'] for r in deleted) | set(r['end'] for r in deleted))
+        relationships_changed(manager, [(r['start'], r['end'], r['type']) for r in deleted])
+    return deleted
+
+
 def get_node_meta_type(manager, handle_id):
     """
     Returns the meta type of the supplied node as a string.
@@ -395,8 +736,8 @@ def get_node_by_type(manager, node_type):
 
 def search_nodes_by_value(manager, value, prop=None, node_type='Node'):
     """
-    Traverses all nodes or nodes of specified label and fuzzy compares the property/properties of the node
-    with the supplied string.
+    Searches all nodes or nodes of specified label and fuzzy compares the property/properties of the node
+    with the supplied string using the full-text index.
 
     :param manager: Neo4jDBSessionManager
     :param value: Value to search for
@@ -408,35 +749,31 @@ def search_nodes_by_value(manager, value, prop=None, node_type='Node'):
     :type node_type: str
     :return: dicts
     """
-    if prop:
-        q = """
-            MATCH (n:{label})
-            WHERE n.{prop} =~ "(?i).*{value}.*" OR any(x IN n.{prop} WHERE x =~ "(?i).*{value}.*")
-            RETURN distinct n
-            """.format(label=node_type, prop=prop, value=value)
-    else:
-        q = """
-            MATCH (n:{label})
-            WITH n, keys(n) as props
-            WHERE any(prop in props WHERE n[prop] =~ "(?i).*{value}.*") OR
-              any(prop in props WHERE any(x IN n[prop] WHERE x =~ "(?i).*{value}.*"))
-            RETURN distinct n
-            """.format(label=node_type, value=value)
-
-    with manager.session as s:
-        for result in s.run(q):
-            yield result['n']
+    for node in fulltext_search(manager, value, node_type=node_type, limit=None, prop=prop):
+        yield node
 
 
 # TODO: Try out elasticsearch
 def get_nodes_by_type(manager, node_type):
+    """
+    Yields the properties of every node with the label, without the index properties (INDEX_PROPERTIES).
+
+    :param manager: Neo4jDBSessionManager
+    :param node_type: Label
+
+    :type manager: Neo4jDBSessionManager
+    :type node_type: str
+
+    :return: Node property dicts
+    :rtype: generator
+    """
     q = """
         MATCH (n:{label})
         RETURN n
         """.format(label=node_type)
     with manager.session as s:
         for result in s.run(q):
-            yield result['n']
+            yield neo4j_entity_to_dict(result['n'])
 
 
 # TODO: Try out elasticsearch
@@ -464,6 +801,666 @@ def create_index(manager, prop, node_type='Node'):
         s.run('CREATE INDEX ON :{node_type}({prop})'.format(node_type=node_type, prop=prop))
 
 
+def create_fulltext_index(manager, name=SEARCH_INDEX, prop=SEARCH_PROPERTY, node_type='Node', analyzer=None):
+    """
+    Creates the full-text index unless an index with the name exists. Uses db.index.fulltext.createNodeIndex, which
+    is available on Neo4j 3.5 and 4.x.
+
+    :param manager: Neo4jDBSessionManager
+    :param name: Index name
+    :param prop: Property or properties to index
+    :param node_type: Label to create index on
+    :param analyzer: Lucene analyzer, defaults to the Neo4j default
+
+    :type manager: Neo4jDBSessionManager
+    :type name: str
+    :type prop: str|tuple
+    :type node_type: str
+    :type analyzer: str|None
+    """
+    props = [prop] if isinstance(prop, str) else prop
+    if fulltext_index_exists(manager, name):
+        return
+    config = {'analyzer': analyzer} if analyzer else {}
+    try:
+        with manager.session as s:
+            s.run('CALL db.index.fulltext.createNodeIndex($name, [$label], $props, $config)',
+                  {'name': name, 'label': node_type, 'props': list(props), 'config': config})
+    except ClientError:
+        # Another process created it between the check and the call
+        if not fulltext_index_exists(manager, name):
+            raise
+
+
+def fulltext_index_exists(manager, name):
+    """
+    :param manager: Neo4jDBSessionManager
+    :param name: Index name
+
+    :type manager: Neo4jDBSessionManager
+    :type name: str
+
+    :rtype: bool
+    """
+    with manager.session as s:
+        for record in s.run('CALL db.indexes()'):
+            index = dict(record.items())
+            # Neo4j 3.5 calls the column indexName, 4.x name
+            if index.get('name', index.get('indexName')) == name:
+                return True
+    return False
+
+
+def get_nodes_by_ip(manager, address, node_type=None):
+    """
+    Returns the nodes that have the address in ip_addresses or ip_address, with or without prefix length.
+    Uses the IP index, the address is normalized with normalize_ip.
+
+    :param manager: Neo4jDBSessionManager
+    :param address: IP address
+    :param node_type: Optional label to filter on
+
+    :type manager: Neo4jDBSessionManager
+    :type address: str
+    :type node_type: str|None
+
+    :return: Node models
+    :rtype: list
+    """
+    key = normalize_ip(address)
+    q = """
+        CALL db.index.fulltext.queryNodes($index, $query) YIELD node AS n
+        WHERE $key IN split(n.{ip_property}, ' ') AND ($label IS NULL OR $label IN labels(n))
+        RETURN n ORDER BY n.handle_id
+        """.format(ip_property=IP_PROPERTY)
+    params = {'index': IP_INDEX, 'query': '"{}"'.format(key), 'key': key, 'label': node_type}
+    with manager.session as s:
+        nodes = [record['n'] for record in s.run(q, params)]
+    return get_node_models(manager, nodes)
+
+
+# Properties computed from the surrounding graph, kept when the node properties are replaced
+_DERIVED_MAP = ', '.join('{0}: n.{0}'.format(prop)
+                         for prop in TYPEAHEAD_PROPERTIES + PATH_PROPERTIES + (IMPACT_GENERATION,))
+
+
+def update_typeahead(manager, handle_ids):
+    """
+    Recalculates the typeahead names of the nodes and of every node whose names include them, their Has
+    descendants and the ports of equipment located in them.
+
+    typeahead_name is the name of the Has parent followed by the node name. typeahead_path is the longest Has
+    path of location names for locations, and the location path of the parent followed by the parent name and
+    the port name for ports whose parent has a location.
+
+    :param manager: Neo4jDBSessionManager
+    :param handle_ids: Changed nodes
+    :type handle_ids: list
+
+    :return: Number of updated nodes
+    :rtype: int
+    """
+    affected_q = """
+        MATCH (x:Node) WHERE x.handle_id IN $handle_ids
+        OPTIONAL MATCH (x)-[:Has*1..20]->(d:Node)
+        WITH x, collect(DISTINCT d.handle_id) AS descendants
+        OPTIONAL MATCH (x)-[:Has*0..20]->(:Location)<-[:Located_in]-(:Node)-[:Has]->(p:Port)
+        WITH x, descendants, collect(DISTINCT p.handle_id) AS ports
+        UNWIND [x.handle_id] + descendants + ports AS handle_id
+        RETURN collect(DISTINCT handle_id) AS handle_ids
+        """
+    with manager.session as s:
+        affected = s.run(affected_q, {'handle_ids': list(handle_ids)}).single()['handle_ids']
+    _set_typeahead(manager, affected)
+    return len(affected)
+
+
+def _set_typeahead(manager, handle_ids):
+    # Location paths first, port paths are built from them
+    location_q = """
+        UNWIND $handle_ids AS handle_id
+        MATCH (l:Node {handle_id: handle_id})
+        WHERE l:Location
+        MATCH p = (:Location)-[:Has*0..20]->(l)
+        WITH l, p ORDER BY length(p) DESC
+        WITH l, head(collect(p)) AS p
+        SET l.%(path)s = trim(reduce(s = "", n IN nodes(p) | s + " " + coalesce(n.name, "")))
+        """ % {'path': TYPEAHEAD_PATH}
+    node_q = """
+        UNWIND $handle_ids AS handle_id
+        MATCH (n:Node {handle_id: handle_id})
+        OPTIONAL MATCH (n)<-[:Has]-(e:Node)
+        WITH n, head(collect(e)) AS e
+        OPTIONAL MATCH (e)-[:Located_in]->(l:Location)
+        WITH n, e, head(collect(l)) AS l
+        SET n.%(name)s = trim(coalesce(e.name, "") + " " + coalesce(n.name, "")),
+            n.%(path)s = CASE
+                WHEN n:Location THEN n.%(path)s
+                WHEN n:Port AND l IS NOT NULL
+                THEN trim(coalesce(l.%(path)s, "") + " " + coalesce(e.name, "") + " " + coalesce(n.name, ""))
+                END
+        """ % {'name': TYPEAHEAD_NAME, 'path': TYPEAHEAD_PATH}
+    with manager.session as s:
+        s.run(location_q, {'handle_ids': handle_ids})
+        s.run(node_q, {'handle_ids': handle_ids})
+
+
+def update_hierarchy(manager, relationships):
+    """
+    Updates the typeahead names and location paths after Has or Located_in relationships were created or deleted.
+
+    :param manager: Neo4jDBSessionManager
+    :param relationships: (start handle_id, end handle_id, relationship type) triples
+    """
+    handle_ids = set()
+    for start, end, rel_type in relationships:
+        if rel_type == 'Has':
+            handle_ids.add(end)
+        elif rel_type == 'Located_in':
+            handle_ids.add(start)
+    if handle_ids:
+        update_typeahead(manager, list(handle_ids))
+        update_location_paths(manager, list(handle_ids))
+
+
+def relationships_changed(manager, relationships):
+    """
+    Updates everything derived from the surrounding graph after relationships were created or deleted.
+
+    :param manager: Neo4jDBSessionManager
+    :param relationships: (start handle_id, end handle_id, relationship type) triples
+    """
+    update_hierarchy(manager, relationships)
+    impact_relationships_changed(manager, relationships)
+
+
+def rebuild_typeahead(manager, batch_size=500):
+    """
+    Recalculates the typeahead names of all nodes.
+
+    :param manager: Neo4jDBSessionManager
+    :param batch_size: Number of nodes updated per transaction
+
+    :return: Number of updated nodes
+    :rtype: int
+    """
+    read_q = """
+        MATCH (n:Node)
+        WHERE n.handle_id > $last_handle_id AND (n:Location) = $location
+        RETURN n.handle_id AS handle_id
+        ORDER BY n.handle_id
+        LIMIT $batch_size
+        """
+    updated = 0
+    # Locations before the other nodes, port paths are built from location paths
+    for location in [True, False]:
+        last_handle_id = -1
+        while True:
+            handle_ids = [record['handle_id'] for record in query_to_list(
+                manager, read_q, last_handle_id=last_handle_id, location=location, batch_size=batch_size)]
+            if not handle_ids:
+                break
+            _set_typeahead(manager, handle_ids)
+            updated += len(handle_ids)
+            last_handle_id = handle_ids[-1]
+    return updated
+
+
+def update_location_paths(manager, handle_ids):
+    """
+    Recalculates the placement and location paths of the nodes, their Has descendants and everything
+    located in them.
+
+    placement_path holds the handle_ids of the longest Has chain above the node. location_path holds the
+    handle_ids of the longest path from the top location, through the location the node or its closest Has
+    ancestor is located in, down to the parent of the node.
+
+    :param manager: Neo4jDBSessionManager
+    :param handle_ids: Nodes that got a new parent or location
+    :type handle_ids: list
+
+    :return: Number of updated nodes
+    :rtype: int
+    """
+    affected_q = """
+        MATCH (x:Node) WHERE x.handle_id IN $handle_ids
+        OPTIONAL MATCH (x)-[:Has*0..20]->(d:Node)
+        OPTIONAL MATCH (d)<-[:Located_in]-(:Node)-[:Has*0..20]->(e:Node)
+        WITH collect(DISTINCT d.handle_id) + collect(DISTINCT e.handle_id) AS handle_ids
+        UNWIND handle_ids AS handle_id
+        RETURN collect(DISTINCT handle_id) AS handle_ids
+        """
+    with manager.session as s:
+        affected = s.run(affected_q, {'handle_ids': list(handle_ids)}).single()['handle_ids']
+    _set_location_paths(manager, affected)
+    return len(affected)
+
+
+def _set_location_paths(manager, handle_ids):
+    q = """
+        UNWIND $handle_ids AS handle_id
+        MATCH (n:Node {handle_id: handle_id})
+        WHERE n:Physical OR n:Location
+        OPTIONAL MATCH p = (:Node)-[:Has*1..20]->(n)
+        WITH n, p ORDER BY length(p) DESC
+        WITH n, head(collect(p)) AS p
+        OPTIONAL MATCH l = (:Node)-[:Has*0..20]->(:Node)<-[:Located_in]-(:Node)-[:Has*0..20]->(n)
+        WITH n, p, l ORDER BY length(l) DESC
+        WITH n, p, head(collect(l)) AS l
+        SET n.%(placement)s = CASE WHEN p IS NULL THEN [] ELSE [x IN nodes(p)[..-1] | x.handle_id] END,
+            n.%(location)s = CASE WHEN l IS NULL THEN [] ELSE [x IN nodes(l)[..-1] | x.handle_id] END
+        """ % {'placement': PLACEMENT_PATH, 'location': LOCATION_PATH}
+    with manager.session as s:
+        s.run(q, {'handle_ids': handle_ids})
+
+
+def rebuild_location_paths(manager, batch_size=500):
+    """
+    Recalculates the placement and location paths of all Physical and Location nodes.
+
+    :param manager: Neo4jDBSessionManager
+    :param batch_size: Number of nodes updated per transaction
+
+    :return: Number of updated nodes
+    :rtype: int
+    """
+    read_q = """
+        MATCH (n:Node)
+        WHERE n.handle_id > $last_handle_id AND (n:Physical OR n:Location)
+        RETURN n.handle_id AS handle_id
+        ORDER BY n.handle_id
+        LIMIT $batch_size
+        """
+    updated = 0
+    last_handle_id = -1
+    while True:
+        handle_ids = [record['handle_id'] for record in query_to_list(
+            manager, read_q, last_handle_id=last_handle_id, batch_size=batch_size)]
+        if not handle_ids:
+            break
+        _set_location_paths(manager, handle_ids)
+        updated += len(handle_ids)
+        last_handle_id = handle_ids[-1]
+    return updated
+
+
+def get_path_nodes(manager, handle_id, prop=LOCATION_PATH, include_self=False):
+    """
+    Returns the nodes of a stored placement or location path, top down.
+
+    :param manager: Neo4jDBSessionManager
+    :param handle_id: Node to read the path of
+    :param prop: PLACEMENT_PATH or LOCATION_PATH
+    :param include_self: Add the node itself to the end of the path
+
+    :rtype: list
+    """
+    q = """
+        MATCH (n:Node {handle_id: $handle_id})
+        WITH n, coalesce(n.%s, []) AS path
+        WITH CASE WHEN $include_self THEN path + n.handle_id ELSE path END AS path
+        UNWIND range(0, size(path) - 1) AS i
+        MATCH (p:Node {handle_id: path[i]})
+        RETURN p
+        ORDER BY i
+        """ % prop
+    return [record['p'] for record in query_to_list(manager, q, handle_id=handle_id, include_self=include_self)]
+
+
+def impact_relationships_changed(manager, relationships):
+    """
+    Removes the impact summaries that can change with the created or deleted relationships. A Has relationship only
+    changes the dependents of the Has ancestors, the other IMPACT_RELATIONSHIPS need invalidate_impact.
+
+    :param manager: Neo4jDBSessionManager
+    :param relationships: (start handle_id, end handle_id, relationship type) triples
+    """
+    handle_ids, has_handle_ids = set(), set()
+    for start, end, rel_type in relationships:
+        if rel_type == 'Has':
+            has_handle_ids.update([start, end])
+        elif rel_type in IMPACT_RELATIONSHIPS:
+            handle_ids.update([start, end])
+    if handle_ids:
+        invalidate_impact(manager, list(handle_ids))
+    if has_handle_ids:
+        q = """
+            MATCH (x:Node) WHERE x.handle_id IN $handle_ids
+            MATCH (x)<-[:Has*0..%(depth)d]-(n:Node)
+            WITH DISTINCT n
+            SET n.%(generation)s = coalesce(n.%(generation)s, 0) + 1
+            REMOVE n.%(dependents)s
+            """ % {'depth': IMPACT_DEPTH, 'dependents': DEPENDENTS_CACHE, 'generation': IMPACT_GENERATION}
+        with manager.session as s:
+            s.run(q, {'handle_ids': list(has_handle_ids)})
+
+
+def invalidate_impact(manager, handle_ids):
+    """
+    Removes the impact summaries that can include the nodes after a Depends_on, Part_of or Connected_to
+    relationship of theirs changed. The dependents of everything the nodes depend on, of what is connected to
+    that and of its Has ancestors change, as do the dependencies of everything depending on any of them.
+    The paths are followed as far as the impact queries follow them. The impact generation of all those nodes is
+    bumped, so summaries computed before the change are not stored.
+
+    :param manager: Neo4jDBSessionManager
+    :param handle_ids: Nodes at either end of the changed relationships
+    :type handle_ids: list
+
+    :return: Number of removed summaries
+    :rtype: int
+    """
+    q = """
+        MATCH (x:Node) WHERE x.handle_id IN $handle_ids
+        OPTIONAL MATCH (x)-[:Part_of|Depends_on*0..%(depth)d]->(down:Node)
+        WITH DISTINCT down
+        OPTIONAL MATCH (down)-[:Connected_to*0..%(connected_depth)d]-(linked:Node)
+        WITH DISTINCT linked
+        OPTIONAL MATCH (linked)<-[:Has*0..%(depth)d]-(ancestor:Node)
+        WITH linked, collect(ancestor) AS ancestors
+        OPTIONAL MATCH (linked)<-[:Depends_on*0..%(depth)d]-(up:Node)
+        WITH ancestors + collect(up) AS nodes
+        UNWIND nodes AS n
+        WITH DISTINCT n
+        WITH n, n.%(dependents)s IS NOT NULL OR n.%(dependencies)s IS NOT NULL AS stored
+        SET n.%(generation)s = coalesce(n.%(generation)s, 0) + 1
+        REMOVE n.%(dependents)s, n.%(dependencies)s
+        RETURN sum(CASE WHEN stored THEN 1 ELSE 0 END) AS removed
+        """ % {'dependents': DEPENDENTS_CACHE, 'dependencies': DEPENDENCIES_CACHE, 'generation': IMPACT_GENERATION,
+               'depth': IMPACT_DEPTH, 'connected_depth': IMPACT_CONNECTED_DEPTH}
+    with manager.session as s:
+        return s.run(q, {'handle_ids': list(handle_ids)}).single()['removed']
+
+
+def clear_impact(manager):
+    """
+    Removes all stored impact summaries, for changes made without going through this module.
+
+    :param manager: Neo4jDBSessionManager
+
+    :return: Number of removed summaries
+    :rtype: int
+    """
+    q = """
+        MATCH (n:Node)
+        WHERE n.%(dependents)s IS NOT NULL OR n.%(dependencies)s IS NOT NULL
+        SET n.%(generation)s = coalesce(n.%(generation)s, 0) + 1
+        REMOVE n.%(dependents)s, n.%(dependencies)s
+        RETURN count(n) AS removed
+        """ % {'dependents': DEPENDENTS_CACHE, 'dependencies': DEPENDENCIES_CACHE, 'generation': IMPACT_GENERATION}
+    with manager.session as s:
+        return s.run(q).single()['removed']
+
+
+def _hydrate_impact(manager, summaries):
+    # One lookup for the nodes of all summaries, nodes shared between them are fetched once
+    handle_ids = list({hid for summary in summaries for hids in summary.values() for hid in hids})
+    q = """
+        MATCH (n:Node) WHERE n.handle_id IN $handle_ids
+        RETURN n
+        """
+    nodes = {record['n']['handle_id']: record['n'] for record in query_to_list(manager, q, handle_ids=handle_ids)}
+    return [{key: [nodes[hid] for hid in hids if hid in nodes] for key, hids in summary.items()}
+            for summary in summaries]
+
+
+def _load_impact(stored):
+    # Expired summaries and summaries stored without an expiry time are computed again
+    if stored is None:
+        return None
+    stored = json.loads(stored)
+    if not isinstance(stored, dict) or stored.get('expires', 0) < time.time():
+        return None
+    return stored['nodes']
+
+
+def _dump_impact(summary):
+    return json.dumps({'expires': time.time() + IMPACT_CACHE_TTL, 'nodes': summary})
+
+
+def _store_impacts(manager, prop, rows):
+    """
+    Stores the summaries of the nodes whose impact generation is still the one read before they were computed, a
+    summary computed while its node was invalidated is dropped. The REMOVE takes the write lock of the node before
+    the generation is compared, so an invalidation can not commit between the comparison and the SET.
+
+    :param rows: dicts with handle_id, generation and summary, the summary as handle_ids per category
+    """
+    if not rows:
+        return
+    q = """
+        UNWIND $rows AS row
+        MATCH (n:Node {handle_id: row.handle_id})
+        REMOVE n._impact_lock
+        WITH n, row
+        WHERE coalesce(n.%(generation)s, 0) = row.generation
+        SET n.%(prop)s = row.summary
+        """ % {'generation': IMPACT_GENERATION, 'prop': prop}
+    rows = [dict(row, summary=_dump_impact(row['summary'])) for row in rows]
+    with manager.session as s:
+        s.run(q, {'rows': rows})
+
+
+def get_impact(manager, handle_id, prop, compute):
+    """
+    Returns the impact summary of the node, dicts of lists of nodes like the result of get_dependent_as_types
+    or get_dependencies_as_types. The handle_ids are stored on the node the first time, later calls only
+    fetch the listed nodes.
+
+    :param manager: Neo4jDBSessionManager
+    :param handle_id: Node handle_id
+    :param prop: DEPENDENTS_CACHE or DEPENDENCIES_CACHE
+    :param compute: Function returning the summary when it is not stored
+
+    :rtype: dict
+    """
+    q = """
+        MATCH (n:Node {handle_id: $handle_id})
+        RETURN n.%(prop)s AS summary, coalesce(n.%(generation)s, 0) AS generation
+        """ % {'prop': prop, 'generation': IMPACT_GENERATION}
+    record = query_to_dict(manager, q, handle_id=handle_id)
+    stored = _load_impact(record.get('summary'))
+    if stored is not None:
+        return _hydrate_impact(manager, [stored])[0]
+    result = compute()
+    if record:
+        summary = {key: [node['handle_id'] for node in nodes] for key, nodes in result.items()}
+        _store_impacts(manager, prop, [{'handle_id': handle_id, 'generation': record['generation'],
+                                        'summary': summary}])
+    return result
+
+
+def get_dependents_bulk(manager, handle_ids):
+    """
+    Returns the get_dependent_as_types result for many nodes. Stored summaries are read in one query and
+    the nodes of all summaries are fetched in one more. The missing summaries are computed with one query per
+    node model and stored with one more statement.
+
+    :param manager: Neo4jDBSessionManager
+    :param handle_ids: Node handle_ids
+    :type handle_ids: list
+
+    :return: handle_id -> dict of lists of nodes, nodes that do not exist are left out
+    :rtype: dict
+    """
+    q = """
+        MATCH (n:Node) WHERE n.handle_id IN $handle_ids
+        RETURN n, n.%(dependents)s AS summary, coalesce(n.%(generation)s, 0) AS generation
+        """ % {'dependents': DEPENDENTS_CACHE, 'generation': IMPACT_GENERATION}
+    summaries = {}
+    missing = []
+    generations = {}
+    for record in query_to_list(manager, q, handle_ids=list(handle_ids)):
+        summary = _load_impact(record['summary'])
+        if summary is None:
+            missing.append(record['n'])
+            generations[record['n']['handle_id']] = record['generation']
+        else:
+            summaries[record['n']['handle_id']] = summary
+    if missing:
+        by_model = {}
+        for node in get_node_models(manager, missing):
+            by_model.setdefault(type(node), []).append(node.handle_id)
+        stored = []
+        for model, model_handle_ids in by_model.items():
+            results = model.get_dependents_bulk(manager, model_handle_ids)
+            for handle_id in model_handle_ids:
+                summary = {key: [node['handle_id'] for node in nodes]
+                           for key, nodes in results.get(handle_id, {}).items()}
+                summaries[handle_id] = summary
+                stored.append({'handle_id': handle_id, 'generation': generations[handle_id], 'summary': summary})
+        _store_impacts(manager, DEPENDENTS_CACHE, stored)
+    keys = list(summaries.keys())
+    return dict(zip(keys, _hydrate_impact(manager, [summaries[key] for key in keys])))
+
+
+def typeahead_search(manager, value, prop=TYPEAHEAD_NAME, labels=None, exclude_labels=None, limit=TYPEAHEAD_LIMIT):
+    """
+    Returns the nodes where the words of value appear, in order, in the typeahead name prop. Candidates
+    come from the typeahead full-text index.
+
+    :param manager: Neo4jDBSessionManager
+    :param value: Search string
+    :param prop: TYPEAHEAD_NAME or TYPEAHEAD_PATH
+    :param labels: Only return nodes with any of these labels
+    :param exclude_labels: Do not return nodes with any of these labels
+    :param limit: Maximum number of results
+
+    :return: Dicts with handle_id, name, labels and parent_id (the handle_id of the Has parent), ordered by name
+    :rtype: list
+    """
+    words = value.split()
+    terms = re.findall(r'\w+', value.lower())
+    if not terms:
+        return []
+    query = ' AND '.join(['{}:*{}*'.format(prop, term) for term in terms])
+    q = """
+        CALL db.index.fulltext.queryNodes($index, $query) YIELD node AS n
+        WITH n, n.{prop} AS name
+        WHERE name =~ $name_re
+          AND ($labels IS NULL OR any(label IN labels(n) WHERE label IN $labels))
+          AND NOT any(label IN labels(n) WHERE label IN $exclude_labels)
+        WITH n, name ORDER BY name LIMIT $limit
+        OPTIONAL MATCH (n)<-[:Has]-(parent:Node)
+        RETURN n.handle_id AS handle_id, name, labels(n) AS labels, head(collect(parent.handle_id)) AS parent_id
+        ORDER BY name
+        """.format(prop=prop)
+    params = {
+        'index': TYPEAHEAD_INDEX,
+        'query': query,
+        # Java regex, \\Q...\\E quotes the words
+        'name_re': '(?i).*{}.*'.format('.*'.join(['\\Q{}\\E'.format(word.replace('\\E', '')) for word in words])),
+        'labels': labels,
+        'exclude_labels': exclude_labels or [],
+        'limit': limit,
+    }
+    return query_to_list(manager, q, **params)
+
+
+def _fulltext_query(value):
+    """
+    Builds a Lucene query that matches index terms containing every word in value. Only word
+    characters are used so the query never needs escaping.
+    """
+    words = re.findall(r'\w+', value.lower())
+    return ' AND '.join(['*{}*'.format(word) for word in words])
+
+
+def fulltext_search(manager, value, node_type=None, limit=SEARCH_LIMIT, prop=None):
+    """
+    Case insensitive substring search over all string properties of the nodes, using the
+    full-text index to find candidates. Results are ordered by how well the node name matches,
+    exact name first, then names starting with value, names containing value and the rest.
+
+    :param manager: Neo4jDBSessionManager
+    :param value: Value to search for
+    :param node_type: Only return nodes with this label
+    :param limit: Maximum number of nodes returned, None for all
+    :param prop: Only match value in this property
+
+    :type manager: Neo4jDBSessionManager
+    :type value: str
+    :type node_type: str
+    :type limit: int
+    :type prop: str
+
+    :return: Node dicts
+    :rtype: list
+    """
+    query = _fulltext_query(value)
+    if not query:
+        return []
+    if node_type == 'Node':
+        node_type = None
+    q = """
+        CALL db.index.fulltext.queryNodes($index, $query) YIELD node AS n
+        WITH n, toLower($value) AS search
+        WHERE ($label IS NULL OR $label IN labels(n)) AND toLower(n.{search_property}) CONTAINS search
+        WITH n, search, toLower(coalesce(n.name, "")) AS title
+        WITH n, CASE
+            WHEN title = search THEN 3
+            WHEN title STARTS WITH search THEN 2
+            WHEN title CONTAINS search THEN 1
+            ELSE 0
+            END AS title_match
+        RETURN n ORDER BY title_match DESC, n.name
+        """.format(search_property=SEARCH_PROPERTY)
+    if limit is not None and not prop:
+        q += ' LIMIT {:d}'.format(limit)
+    params = {'index': SEARCH_INDEX, 'query': query, 'value': value, 'label': node_type}
+    nodes = []
+    with manager.session as s:
+        for record in s.run(q, params):
+            node = neo4j_entity_to_dict(record['n'])
+            if prop and value.lower() not in node_search_text({prop: node.get(prop)}).lower():
+                continue
+            nodes.append(node)
+            if limit is not None and len(nodes) >= limit:
+                break
+    return nodes
+
+
+def rebuild_search_text(manager, batch_size=500):
+    """
+    Recalculates the full-text search and IP index properties for all nodes, needed for nodes
+    created before the indexes were introduced.
+
+    :param manager: Neo4jDBSessionManager
+    :param batch_size: Number of nodes updated per transaction
+
+    :type manager: Neo4jDBSessionManager
+    :type batch_size: int
+
+    :return: Number of updated nodes
+    :rtype: int
+    """
+    read_q = """
+        MATCH (n:Node)
+        WHERE n.handle_id > $last_handle_id
+        RETURN n.handle_id AS handle_id, properties(n) AS props
+        ORDER BY n.handle_id
+        LIMIT $batch_size
+        """
+    write_q = """
+        UNWIND $items AS item
+        MATCH (n:Node {handle_id: item.handle_id})
+        SET n += item.props
+        """
+    last_handle_id = -1
+    updated = 0
+    while True:
+        batch = query_to_list(manager, read_q, last_handle_id=last_handle_id, batch_size=batch_size)
+        if not batch:
+            break
+        items = [{'handle_id': item['handle_id'], 'props': node_index_properties(item['props'])}
+                 for item in batch]
+        with manager.session as s:
+            s.run(write_q, {'items': items})
+        updated += len(items)
+        last_handle_id = batch[-1]['handle_id']
+    return updated
+
+
 def get_indexed_node(manager, prop, value, node_type='Node', lookup_func='CONTAINS'):
     """
     :param manager: Neo4jDBSessionManager
@@ -516,15 +1513,69 @@ def get_unique_node_by_name(manager, node_name, node_type):
     return None
 
 
-def _create_relationship(manager, handle_id, other_handle_id, rel_type):
+# Allowed relationships as (start meta type, relationship type, end meta type)
+RELATIONSHIP_RULES = [
+    ('Location', 'Has', 'Location'),
+    ('Logical', 'Depends_on', 'Logical'),
+    ('Logical', 'Depends_on', 'Physical'),
+    ('Logical', 'Part_of', 'Physical'),
+    ('Relation', 'Uses', 'Logical'),
+    ('Relation', 'Provides', 'Logical'),
+    ('Relation', 'Responsible_for', 'Location'),
+    ('Relation', 'Owns', 'Physical'),
+    ('Relation', 'Provides', 'Physical'),
+    ('Physical', 'Has', 'Physical'),
+    ('Physical', 'Connected_to', 'Physical'),
+    ('Physical', 'Located_in', 'Location'),
+]
+
+
+def _allowed_meta_types(rel_type, meta_type=None):
+    return [[start, end] for start, rel, end in RELATIONSHIP_RULES
+            if rel == rel_type and (meta_type is None or start == meta_type)]
+
+
+def _no_relationship_possible(manager, handle_id, other_handle_id, rel_type, meta_type=None):
+    # Only used when creation failed, raises NodeNotFound if any of the nodes is missing
+    if meta_type is None:
+        meta_type = get_node_meta_type(manager, handle_id)
+    other_meta_type = get_node_meta_type(manager, other_handle_id)
+    return exceptions.NoRelationshipPossible(handle_id, meta_type, other_handle_id, other_meta_type, rel_type)
+
+
+def _create_relationship(manager, handle_id, other_handle_id, rel_type, meta_type=None):
+    """
+    Matches both nodes, checks their meta types against RELATIONSHIP_RULES and creates the relationship
+    in one statement.
+
+    :param meta_type: Meta type to validate the start node as, defaults to the label of the start node
+    :return: Relationship id
+    """
     q = """
-        MATCH (a:Node {handle_id: $start}),(b:Node {handle_id: $end})
+        MATCH (a:Node {handle_id: $start}), (b:Node {handle_id: $end})
+        WITH a, b, coalesce($meta_type, [l IN labels(a) WHERE l IN $meta_types][0]) AS a_meta,
+             [l IN labels(b) WHERE l IN $meta_types][0] AS b_meta
+        WHERE [a_meta, b_meta] IN $allowed
         CREATE (a)-[r:%s]->(b)
-        RETURN r
+        RETURN ID(r) AS id
         """ % rel_type
-
+    allowed = _allowed_meta_types(rel_type, meta_type)
+    if not allowed:
+        raise _no_relationship_possible(manager, handle_id, other_handle_id, rel_type, meta_type)
+    params = {
+        'start': handle_id,
+        'end': other_handle_id,
+        'meta_type': meta_type,
+        'meta_types': META_TYPES,
+        'allowed': allowed,
+    }
     with manager.session as s:
-        return s.run(q, {'start': handle_id, 'end': other_handle_id}).single()['r'].id
+        record = s.run(q, params).single()
+    if record is None:
+        raise _no_relationship_possible(manager, handle_id, other_handle_id, rel_type, meta_type)
+    manager.invalidate_nodes(handle_id, other_handle_id)
+    relationships_changed(manager, [(handle_id, other_handle_id, rel_type)])
+    return record['id']
 
 
 def create_location_relationship(manager, location_handle_id, other_handle_id, rel_type):
@@ -532,10 +1583,7 @@ def create_location_relationship(manager, location_handle_id, other_handle_id, r
     Makes relationship between the two nodes and returns the relationship.
     If a relationship is not possible NoRelationshipPossible exception is raised.
     """
-    other_meta_type = get_node_meta_type(manager, other_handle_id)
-    if other_meta_type == 'Location' and rel_type == 'Has':
-        return _create_relationship(manager, location_handle_id, other_handle_id, rel_type)
-    raise exceptions.NoRelationshipPossible(location_handle_id, 'Location', other_handle_id, other_meta_type, rel_type)
+    return _create_relationship(manager, location_handle_id, other_handle_id, rel_type, 'Location')
 
 
 def create_logical_relationship(manager, logical_handle_id, other_handle_id, rel_type):
@@ -543,14 +1591,7 @@ def create_logical_relationship(manager, logical_handle_id, other_handle_id, rel
     Makes relationship between the two nodes and returns the relationship.
     If a relationship is not possible NoRelationshipPossible exception is raised.
     """
-    other_meta_type = get_node_meta_type(manager, other_handle_id)
-    if rel_type == 'Depends_on':
-        if other_meta_type == 'Logical' or other_meta_type == 'Physical':
-            return _create_relationship(manager, logical_handle_id, other_handle_id, rel_type)
-    elif rel_type == 'Part_of':
-        if other_meta_type == 'Physical':
-            return _create_relationship(manager, logical_handle_id, other_handle_id, rel_type)
-    raise exceptions.NoRelationshipPossible(logical_handle_id, 'Logical', other_handle_id, other_meta_type, rel_type)
+    return _create_relationship(manager, logical_handle_id, other_handle_id, rel_type, 'Logical')
 
 
 def create_relation_relationship(manager, relation_handle_id, other_handle_id, rel_type):
@@ -558,16 +1599,7 @@ def create_relation_relationship(manager, relation_handle_id, other_handle_id, r
     Makes relationship between the two nodes and returns the relationship.
     If a relationship is not possible NoRelationshipPossible exception is raised.
     """
-    other_meta_type = get_node_meta_type(manager, other_handle_id)
-    if other_meta_type == 'Logical':
-        if rel_type in ['Uses', 'Provides']:
-            return _create_relationship(manager, relation_handle_id, other_handle_id, rel_type)
-    elif other_meta_type == 'Location' and rel_type == 'Responsible_for':
-        return _create_relationship(manager, relation_handle_id, other_handle_id, rel_type)
-    elif other_meta_type == 'Physical':
-        if rel_type in ['Owns', 'Provides']:
-            return _create_relationship(manager, relation_handle_id, other_handle_id, rel_type)
-    raise exceptions.NoRelationshipPossible(relation_handle_id, 'Relation', other_handle_id, other_meta_type, rel_type)
+    return _create_relationship(manager, relation_handle_id, other_handle_id, rel_type, 'Relation')
 
 
 def create_physical_relationship(manager, physical_handle_id, other_handle_id, rel_type):
@@ -575,13 +1607,7 @@ def create_physical_relationship(manager, physical_handle_id, other_handle_id, r
     Makes relationship between the two nodes and returns the relationship.
     If a relationship is not possible NoRelationshipPossible exception is raised.
     """
-    other_meta_type = get_node_meta_type(manager, other_handle_id)
-    if other_meta_type == 'Physical':
-        if rel_type == 'Has' or rel_type == 'Connected_to':
-            return _create_relationship(manager, physical_handle_id, other_handle_id, rel_type)
-    elif other_meta_type == 'Location' and rel_type == 'Located_in':
-        return _create_relationship(manager, physical_handle_id, other_handle_id, rel_type)
-    raise exceptions.NoRelationshipPossible(physical_handle_id, 'Physical', other_handle_id, other_meta_type, rel_type)
+    return _create_relationship(manager, physical_handle_id, other_handle_id, rel_type, 'Physical')
 
 
 def create_relationship(manager, handle_id, other_handle_id, rel_type):
@@ -590,17 +1616,98 @@ def create_relationship(manager, handle_id, other_handle_id, rel_type):
     meta_type the nodes are. Returns the relationship or raises
     NoRelationshipPossible exception.
     """
-    meta_type = get_node_meta_type(manager, handle_id)
-    if meta_type == 'Location':
-        return create_location_relationship(manager, handle_id, other_handle_id, rel_type)
-    elif meta_type == 'Logical':
-        return create_logical_relationship(manager, handle_id, other_handle_id, rel_type)
-    elif meta_type == 'Relation':
-        return create_relation_relationship(manager, handle_id, other_handle_id, rel_type)
-    elif meta_type == 'Physical':
-        return create_physical_relationship(manager, handle_id, other_handle_id, rel_type)
-    other_meta_type = get_node_meta_type(manager, other_handle_id)
-    raise exceptions.NoRelationshipPossible(handle_id, meta_type, other_handle_id, other_meta_type, rel_type)
+    return _create_relationship(manager, handle_id, other_handle_id, rel_type)
+
+
+def _write_relationships(manager, relationships, merge):
+    """
+    Validates and creates or merges the relationships with one UNWIND statement per relationship type in a single
+    transaction.
+
+    :return: Records with created, r, a and b in the same order as relationships
+    :rtype: list
+    """
+    by_type = {}
+    for index, (handle_id, other_handle_id, rel_type) in enumerate(relationships):
+        if not _allowed_meta_types(rel_type):
+            raise _no_relationship_possible(manager, handle_id, other_handle_id, rel_type)
+        by_type.setdefault(rel_type, []).append({'index': index, 'start': handle_id, 'end': other_handle_id})
+
+    records = [None] * len(relationships)
+    with manager.transaction as t:
+        for rel_type, rels in by_type.items():
+            q = """
+                UNWIND $rels AS rel
+                MATCH (a:Node {handle_id: rel.start}), (b:Node {handle_id: rel.end})
+                WITH rel, a, b, [l IN labels(a) WHERE l IN $meta_types][0] AS a_meta,
+                     [l IN labels(b) WHERE l IN $meta_types][0] AS b_meta
+                WHERE [a_meta, b_meta] IN $allowed
+                WITH rel, a, b, %(created)s AS created
+                %(verb)s (a)-[r:%(rel_type)s]->(b)
+                RETURN rel.index AS index, created, r, a, b
+                """ % {
+                    'created': 'NOT EXISTS((a)-[:%s]->(b))' % rel_type if merge else 'true',
+                    'verb': 'MERGE' if merge else 'CREATE',
+                    'rel_type': rel_type,
+                }
+            params = {'rels': rels, 'meta_types': META_TYPES, 'allowed': _allowed_meta_types(rel_type)}
+            for record in t.run(q, params):
+                records[record['index']] = record
+        for index, record in enumerate(records):
+            if record is None:
+                handle_id, other_handle_id, rel_type = relationships[index]
+                raise _no_relationship_possible(manager, handle_id, other_handle_id, rel_type)
+    for handle_id, other_handle_id, rel_type in relationships:
+        manager.invalidate_nodes(handle_id, other_handle_id)
+    relationships_changed(manager, [relationship for relationship, record in zip(relationships, records)
+                                    if record['created']])
+    return records
+
+
+def create_relationships(manager, relationships):
+    """
+    Bulk version of create_relationship. Relationships are created with one UNWIND statement per relationship
+    type in a single transaction. If any of them is not possible nothing is created and NoRelationshipPossible
+    (or NodeNotFound) is raised for the first failing one.
+
+    :param manager: Neo4jDBSessionManager
+    :param relationships: (handle_id, other_handle_id, rel_type) triples
+
+    :type manager: Neo4jDBSessionManager
+    :type relationships: list
+
+    :return: Relationship ids in the same order as relationships
+    :rtype: list
+    """
+    return [record['r'].id for record in _write_relationships(manager, relationships, merge=False)]
+
+
+def merge_relationships(manager, relationships):
+    """
+    Same as create_relationships but relationships that already exist are reused, like the set_* methods of the
+    node models.
+
+    :param manager: Neo4jDBSessionManager
+    :param relationships: (handle_id, other_handle_id, rel_type) triples
+
+    :type manager: Neo4jDBSessionManager
+    :type relationships: list
+
+    :return: (relationship bundle, created) tuples in the same order as relationships
+    :rtype: list
+    """
+    result = []
+    for record in _write_relationships(manager, relationships, merge=True):
+        relationship = record['r']
+        bundle = {
+            'type': relationship.type,
+            'id': relationship.id,
+            'data': neo4j_entity_to_dict(relationship),
+            'start': neo4j_entity_to_dict(record['a']),
+            'end': neo4j_entity_to_dict(record['b']),
+        }
+        result.append((bundle, record['created']))
+    return result
 
 
 def get_relationships(manager, handle_id1, handle_id2, rel_type=None):
@@ -624,26 +1731,288 @@ def get_relationships(manager, handle_id1, handle_id2, rel_type=None):
 
 def set_node_properties(manager, handle_id, new_properties):
     new_properties['handle_id'] = handle_id  # Make sure the handle_id can't be changed
+    props = _with_index_properties(new_properties)  # Keep the full-text and IP indexes current
 
     q = """
         MATCH (n:Node {handle_id: $props.handle_id})
+        WITH n, n.name AS old_name, {%s} AS derived
         SET n = $props
-        RETURN n
+        SET n += derived
+        RETURN n, old_name
+        """ % _DERIVED_MAP
+    with manager.session as s:
+        record = s.run(q, {'handle_id': handle_id, 'props': props}).single()
+    manager.invalidate_nodes(handle_id)
+    if record['old_name'] != props.get('name'):
+        update_typeahead(manager, [handle_id])
+    return neo4j_entity_to_dict(record['n'])
+
+
+def set_nodes_properties(manager, new_properties):
+    """
+    Bulk version of set_node_properties, replaces the properties of all nodes with one UNWIND statement.
+
+    :param manager: Neo4jDBSessionManager
+    :param new_properties: handle_id -> properties
+    :type new_properties: dict
+
+    :rtype: int
+    """
+    rows = []
+    for handle_id, properties in new_properties.items():
+        # Make sure the handle_id can't be changed
+        rows.append(_with_index_properties(dict(properties, handle_id=handle_id)))
+    if not rows:
+        return 0
+    q = """
+        UNWIND $rows AS props
+        MATCH (n:Node {handle_id: props.handle_id})
+        WITH n, props, n.name AS old_name, {%s} AS derived
+        SET n = props
+        SET n += derived
+        RETURN n.handle_id AS handle_id, old_name <> coalesce(props.name, '') AS renamed
+        """ % _DERIVED_MAP
+    with manager.session as s:
+        records = list(s.run(q, {'rows': rows}))
+    manager.invalidate_nodes(*new_properties.keys())
+    renamed = [record['handle_id'] for record in records if record['renamed']]
+    if renamed:
+        update_typeahead(manager, renamed)
+    return len(records)
+
+
+def _property_changes(set_properties, remove):
+    changes = {k: v for k, v in (set_properties or {}).items() if k != 'handle_id' and k not in INDEX_PROPERTIES}
+    # SET n += {key: null} removes the key
+    changes.update({k: None for k in remove or [] if k not in changes and k != 'handle_id'})
+    return changes
+
+
+def update_node_properties(manager, handle_id, set=None, remove=None):
+    """
+    Sets and removes node properties, all other properties are left as they are. Unlike set_node_properties only the
+    changed keys are sent, so updates of different keys made at the same time do not overwrite each other.
+
+    :param manager: Neo4jDBSessionManager
+    :param handle_id: Unique id
+    :param set: Properties to set
+    :param remove: Property keys to remove
+
+    :type manager: Neo4jDBSessionManager
+    :type handle_id: str|unicode
+    :type set: dict
+    :type remove: list
+
+    :return: Node properties after the update
+    :rtype: dict
+    """
+    changes = _property_changes(set, remove)
+    q = """
+        MATCH (n:Node {handle_id: $handle_id})
+        WITH n, n.name AS old_name
+        SET n += $changes
+        RETURN n, old_name
+        """
+    with manager.transaction as t:
+        record = t.run(q, {'handle_id': handle_id, 'changes': changes}).single()
+        if record is None:
+            raise exceptions.NodeNotFound(manager, handle_id)
+        properties = neo4j_entity_to_dict(record['n'])
+        # Only string values and IP addresses are indexed
+        if any(v is None or isinstance(v, (str, list, tuple)) for v in changes.values()):
+            q = """
+                MATCH (n:Node {handle_id: $handle_id})
+                SET n += $index_properties
+                """
+            t.run(q, {'handle_id': handle_id, 'index_properties': node_index_properties(properties)})
+    manager.invalidate_nodes(handle_id)
+    if record['old_name'] != properties.get('name'):
+        update_typeahead(manager, [handle_id])
+    return properties
+
+
+def update_nodes_properties(manager, changes):
+    """
+    Bulk version of update_node_properties, sets and removes the given keys of all nodes with one UNWIND statement.
+    The other properties are left as they are.
+
+    :param manager: Neo4jDBSessionManager
+    :param changes: handle_id -> properties to set, keys with None values are removed
+    :type changes: dict
+
+    :return: Number of updated nodes
+    :rtype: int
+    """
+    rows = [{'handle_id': handle_id, 'changes': _property_changes(properties, None)}
+            for handle_id, properties in changes.items()]
+    if not rows:
+        return 0
+    q = """
+        UNWIND $rows AS row
+        MATCH (n:Node {handle_id: row.handle_id})
+        WITH n, row, n.name AS old_name
+        SET n += row.changes
+        RETURN n, old_name
+        """
+    with manager.transaction as t:
+        records = list(t.run(q, {'rows': rows}))
+        # Only string values and IP addresses are indexed
+        indexed = {row['handle_id'] for row in rows
+                   if any(v is None or isinstance(v, (str, list, tuple)) for v in row['changes'].values())}
+        index_rows = []
+        renamed = []
+        for record in records:
+            properties = neo4j_entity_to_dict(record['n'])
+            if properties['handle_id'] in indexed:
+                index_rows.append({'handle_id': properties['handle_id'],
+                                   'index_properties': node_index_properties(properties)})
+            if record['old_name'] != properties.get('name'):
+                renamed.append(properties['handle_id'])
+        if index_rows:
+            q = """
+                UNWIND $rows AS row
+                MATCH (n:Node {handle_id: row.handle_id})
+                SET n += row.index_properties
+                """
+            t.run(q, {'rows': index_rows})
+    manager.invalidate_nodes(*changes.keys())
+    if renamed:
+        update_typeahead(manager, renamed)
+    return len(records)
+
+
+def update_relationship_properties(manager, relationship_id, set=None, remove=None):
+    """
+    Relationship version of update_node_properties.
+
+    :param manager: Neo4jDBSessionManager
+    :param relationship_id: Internal relationship id
+    :param set: Properties to set
+    :param remove: Property keys to remove
+
+    :type manager: Neo4jDBSessionManager
+    :type relationship_id: int
+    :type set: dict
+    :type remove: list
+
+    :return: Relationship properties after the update
+    :rtype: dict
+    """
+    q = """
+        MATCH (start)-[r]->(end)
+        WHERE ID(r) = $relationship_id
+        SET r += $changes
+        RETURN r, start.handle_id AS start, end.handle_id AS end
         """
     with manager.session as s:
-        return neo4j_entity_to_dict(s.run(q, {'handle_id': handle_id, 'props': new_properties}).single()['n'])
+        record = s.run(q, {'relationship_id': int(relationship_id), 'changes': _property_changes(set, remove)}).single()
+    if record is None:
+        raise exceptions.RelationshipNotFound(manager, relationship_id)
+    manager.invalidate_nodes(record['start'], record['end'])
+    return dict(record['r'].items())
+
+
+def touch_auto_managed(manager, handle_ids=(), relationship_ids=(), auto_manage=True, last_seen=None,
+                       keep_disabled=False, batch_size=1000):
+    """
+    Sets noclook_auto_manage and noclook_last_seen on many nodes and relationships with one UNWIND statement per
+    batch. The search text of the nodes is updated in the same statement.
+
+    :param manager: Neo4jDBSessionManager
+    :param handle_ids: Node handle_ids
+    :param relationship_ids: Internal relationship ids
+    :param auto_manage: Value of noclook_auto_manage
+    :param last_seen: ISO formatted timestamp, defaults to now
+    :param keep_disabled: Leave nodes and relationships with noclook_auto_manage false as they are
+    :param batch_size: Nodes or relationships per statement
+
+    :type manager: Neo4jDBSessionManager
+    :type handle_ids: list
+    :type relationship_ids: list
+    :type auto_manage: bool
+    :type last_seen: str
+    :type keep_disabled: bool
+    :type batch_size: int
+
+    :return: Number of nodes and relationships updated
+    :rtype: int
+    """
+    if last_seen is None:
+        last_seen = datetime.now().isoformat()
+    params = {'auto_manage': auto_manage, 'last_seen': last_seen, 'keep_disabled': keep_disabled}
+    # The old timestamp is replaced in the search text before the property is set
+    node_q = """
+        UNWIND $ids AS handle_id
+        MATCH (n:Node {handle_id: handle_id})
+        WHERE NOT $keep_disabled OR coalesce(n.noclook_auto_manage, true)
+        SET n.%s = CASE WHEN n.noclook_last_seen IS NULL THEN coalesce(n.%s + '\n', '') + $last_seen
+                        ELSE replace(n.%s, n.noclook_last_seen, $last_seen) END,
+            n.noclook_auto_manage = $auto_manage,
+            n.noclook_last_seen = $last_seen
+        RETURN n.handle_id AS handle_id
+        """ % (SEARCH_PROPERTY, SEARCH_PROPERTY, SEARCH_PROPERTY)
+    relationship_q = """
+        UNWIND $ids AS relationship_id
+        MATCH (start)-[r]->(end)
+        WHERE id(r) = relationship_id AND (NOT $keep_disabled OR coalesce(r.noclook_auto_manage, true))
+        SET r.noclook_auto_manage = $auto_manage, r.noclook_last_seen = $last_seen
+        RETURN start.handle_id AS start, end.handle_id AS end
+        """
+    handle_ids, relationship_ids = list(handle_ids), [int(i) for i in relationship_ids]
+    touched = 0
+    for q, ids in [(node_q, handle_ids), (relationship_q, relationship_ids)]:
+        for i in range(0, len(ids), batch_size):
+            with manager.session as s:
+                records = list(s.run(q, dict(params, ids=ids[i:i + batch_size])))
+            for record in records:
+                manager.invalidate_nodes(*record.values())
+            touched += len(records)
+    return touched
 
 
 def set_relationship_properties(manager, relationship_id, new_properties):
 
     q = """
-        MATCH ()-[r]->()
+        MATCH (start)-[r]->(end)
         WHERE ID(r) = $relationship_id
         SET r = $props
-        RETURN r
+        RETURN r, start.handle_id AS start, end.handle_id AS end
         """
     with manager.session as s:
-        return s.run(q, {'relationship_id': int(relationship_id), 'props': new_properties}).single()
+        record = s.run(q, {'relationship_id': int(relationship_id), 'props': new_properties}).single()
+    if record:
+        manager.invalidate_nodes(record['start'], record['end'])
+    return record
+
+
+# Node model class lookup tables, class name -> class and (meta type, labels) -> class
+NODE_MODEL_CLASSES = {name: cls for name, cls in vars(models).items()
+                      if isinstance(cls, type) and issubclass(cls, models.BaseNodeModel)}
+_node_model_class_cache = {}
+
+
+def get_node_model_class(meta_type, labels):
+    """
+    Returns the most specific node model class for a meta type and a list of labels. Tries
+    {meta_type}{label}Model, {label}Model and {meta_type}Model in that order.
+
+    :param meta_type: Node meta type
+    :type meta_type: str|None
+    :param labels: Node labels, excluding Node and the meta type
+    :type labels: list
+    :rtype: type
+    """
+    key = (meta_type, tuple(labels))
+    cls = _node_model_class_cache.get(key)
+    if cls is None:
+        candidates = ['{meta_type}{base}Model'.format(meta_type=meta_type, base=label).replace('_', '')
+                      for label in labels]
+        candidates += ['{base}Model'.format(base=label).replace('_', '') for label in labels]
+        candidates.append('{base}Model'.format(base=meta_type))
+        cls = next((NODE_MODEL_CLASSES[name] for name in candidates if name in NODE_MODEL_CLASSES),
+                   models.BaseNodeModel)
+        _node_model_class_cache[key] = cls
+    return cls
 
 
 def get_node_model(manager, handle_id=None, node=None):
@@ -658,23 +2027,35 @@ def get_node_model(manager, handle_id=None, node=None):
     :rtype: models.BaseNodeModel or sub class of models.BaseNodeModel
     """
     bundle = get_node_bundle(manager, handle_id, node)
-    for label in bundle.get('labels'):
-        try:
-            classname = '{meta_type}{base}Model'.format(meta_type=bundle.get('meta_type'), base=label).replace('_', '')
-            return getattr(models, classname)(manager).load(bundle)
-        except AttributeError:
-            pass
-    for label in bundle.get('labels'):
-        try:
-            classname = '{base}Model'.format(base=label).replace('_', '')
-            return getattr(models, classname)(manager).load(bundle)
-        except AttributeError:
-            pass
-    try:
-        classname = '{base}Model'.format(base=bundle.get('meta_type'))
-        return getattr(models, classname)(manager).load(bundle)
-    except AttributeError:
-        return models.BaseNodeModel(manager).load(bundle)
+    return get_node_model_class(bundle.get('meta_type'), bundle.get('labels'))(manager).load(bundle)
+
+
+def get_node_models(manager, nodes):
+    """
+    Bulk version of get_node_model for already fetched nodes.
+
+    :param manager: Context manager to handle transactions
+    :type manager: Neo4jDBSessionManager
+    :param nodes: Node objects
+    :type nodes: list
+    :return: Node models in the same order as nodes
+    :rtype: list
+    """
+    label_sets = {}
+    node_models = []
+    for node in nodes:
+        label_set = frozenset(node.labels)
+        if label_set not in label_sets:
+            meta_types = [label for label in label_set if label in META_TYPES]
+            meta_type = meta_types[0] if meta_types else None
+            labels = [label for label in node.labels if label != 'Node' and label != meta_type]
+            label_sets[label_set] = (meta_type, labels, get_node_model_class(meta_type, labels))
+        meta_type, labels, cls = label_sets[label_set]
+        bundle = {'data': neo4j_entity_to_dict(node), 'labels': list(labels)}
+        if meta_type:
+            bundle['meta_type'] = meta_type
+        node_models.append(cls(manager).load(bundle))
+    return node_models
 
 
 def get_relationship_model(manager, relationship_id):
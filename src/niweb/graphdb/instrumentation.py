@@ -0,0 +1,213 @@
+# -*- coding: utf-8 -*-
+
+import json
+import logging
+import os
+import re
+import threading
+import time
+
+__author__ = 'lundberg'
+
+slow_query_logger = logging.getLogger('graphdb.slow_queries')
+
+# Upper bounds in milliseconds of the latency histogram buckets, the last bucket counts everything slower
+LATENCY_BUCKETS = (1, 5, 10, 50, 100, 500, 1000, 5000)
+
+_STRING_LITERAL = re.compile(r"'(?:[^'\\]|\\.)*'|\"(?:[^\"\\]|\\.)*\"")
+_NUMBER_LITERAL = re.compile(r'(?<![\w$])-?\d+(?:\.\d+)?\b')
+_WHITESPACE = re.compile(r'\s+')
+
+
+def fingerprint(query):
+    """
+    Returns the query with literals replaced by ? and whitespace collapsed, so statements that only differ in
+    inlined values are counted together.
+
+    :type query: str
+    :rtype: str
+    """
+    query = _STRING_LITERAL.sub('?', query)
+    query = _NUMBER_LITERAL.sub('?', query)
+    return _WHITESPACE.sub(' ', query).strip()
+
+
+def _bucket(duration_ms):
+    for i, bound in enumerate(LATENCY_BUCKETS):
+        if duration_ms <= bound:
+            return i
+    return len(LATENCY_BUCKETS)
+
+
+class QueryStats(object):
+    """
+    Per-process latency and row count statistics of Cypher statements grouped by fingerprint. Statements slower than
+    slow_query_ms are logged to the graphdb.slow_queries logger.
+
+    With dump_dir set the statistics are written to a JSON file per process in that directory at most every
+    dump_interval seconds, so they can be collected with load_dumps.
+    """
+
+    def __init__(self, slow_query_ms=1000, dump_dir=None, dump_interval=60):
+        self.slow_query_ms = slow_query_ms
+        self.dump_dir = dump_dir
+        self.dump_interval = dump_interval
+        self._fingerprints = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._last_dump = time.monotonic()
+
+    def record(self, query, duration, rows):
+        """
+        :param query: Cypher statement
+        :param duration: Seconds
+        :param rows: Number of rows returned
+        """
+        duration_ms = duration * 1000
+        key = fingerprint(query)
+        with self._lock:
+            entry = self._fingerprints.get(key)
+            if entry is None:
+                entry = self._fingerprints[key] = {
+                    'count': 0, 'total_ms': 0.0, 'max_ms': 0.0, 'rows': 0,
+                    'histogram': [0] * (len(LATENCY_BUCKETS) + 1),
+                }
+            entry['count'] += 1
+            entry['total_ms'] += duration_ms
+            entry['max_ms'] = max(entry['max_ms'], duration_ms)
+            entry['rows'] += rows
+            entry['histogram'][_bucket(duration_ms)] += 1
+        request = getattr(self._local, 'request', None)
+        if request is not None:
+            request['queries'] += 1
+            request['time_ms'] += duration_ms
+            request['rows'] += rows
+        if self.slow_query_ms and duration_ms >= self.slow_query_ms:
+            slow_query_logger.warning('%.1f ms, %d rows: %s', duration_ms, rows, key)
+        if self.dump_dir and time.monotonic() - self._last_dump > self.dump_interval:
+            self.dump()
+
+    def begin_request(self):
+        """
+        Starts counting the statements run by the current thread.
+        """
+        self._local.request = {'queries': 0, 'time_ms': 0.0, 'rows': 0}
+
+    def end_request(self):
+        """
+        :return: Number of statements, their total time and rows since begin_request or None
+        :rtype: dict|None
+        """
+        request, self._local.request = getattr(self._local, 'request', None), None
+        return request
+
+    def stats(self, order_by='total_ms', limit=None):
+        """
+        :return: Statistics per fingerprint, highest order_by first
+        :rtype: list
+        """
+        with self._lock:
+            entries = [dict(entry, fingerprint=key, histogram=list(entry['histogram']))
+                       for key, entry in self._fingerprints.items()]
+        return sorted(entries, key=lambda entry: entry[order_by], reverse=True)[:limit]
+
+    def reset(self):
+        with self._lock:
+            self._fingerprints.clear()
+
+    def dump(self):
+        self._last_dump = time.monotonic()
+        path = os.path.join(self.dump_dir, 'query-stats-{}.json'.format(os.getpid()))
+        try:
+            with open(path + '.tmp', 'w') as f:
+                json.dump(self.stats(), f)
+            os.replace(path + '.tmp', path)
+        except OSError as e:
+            slow_query_logger.error('Could not write query statistics to %s: %s', path, e)
+
+
+def load_dumps(dump_dir, order_by='total_ms', limit=None):
+    """
+    Merges the statistics dumped by all processes to dump_dir.
+
+    :rtype: list
+    """
+    merged = {}
+    for name in os.listdir(dump_dir):
+        if not (name.startswith('query-stats-') and name.endswith('.json')):
+            continue
+        with open(os.path.join(dump_dir, name)) as f:
+            for entry in json.load(f):
+                current = merged.get(entry['fingerprint'])
+                if current is None:
+                    merged[entry['fingerprint']] = entry
+                    continue
+                for key in ('count', 'total_ms', 'rows'):
+                    current[key] += entry[key]
+                current['max_ms'] = max(current['max_ms'], entry['max_ms'])
+                current['histogram'] = [a + b for a, b in zip(current['histogram'], entry['histogram'])]
+    return sorted(merged.values(), key=lambda entry: entry[order_by], reverse=True)[:limit]
+
+
+class InstrumentedResult(object):
+    """
+    Wraps a statement result and records the statement when its records have been read, or when the session ends.
+    The duration is measured from start, the time.monotonic() before the statement was sent.
+    """
+
+    def __init__(self, result, query, stats, start):
+        self._result = result
+        self._query = query
+        self._stats = stats
+        self._start = start
+        self._rows = 0
+        self._recorded = False
+
+    def __iter__(self):
+        for record in self._result:
+            self._rows += 1
+            yield record
+        self.finish()
+
+    def single(self):
+        record = self._result.single()
+        self._rows = 0 if record is None else 1
+        self.finish()
+        return record
+
+    def __getattr__(self, name):
+        return getattr(self._result, name)
+
+    def finish(self):
+        if not self._recorded:
+            self._recorded = True
+            self._stats.record(self._query, time.monotonic() - self._start, self._rows)
+
+
+class InstrumentedSession(object):
+    """
+    Wraps a session or transaction so every statement run through it is recorded in stats.
+    """
+
+    def __init__(self, session, stats):
+        self._session = session
+        self._stats = stats
+        self._results = []
+
+    def run(self, statement, parameters=None, **kwparameters):
+        start = time.monotonic()
+        result = InstrumentedResult(self._session.run(statement, parameters, **kwparameters), statement, self._stats,
+                                    start)
+        self._results.append(result)
+        return result
+
+    def __getattr__(self, name):
+        return getattr(self._session, name)
+
+    def finish(self):
+        """
+        Records the statements whose results were not read to the end.
+        """
+        results, self._results = self._results, []
+        for result in results:
+            result.finish()
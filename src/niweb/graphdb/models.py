@@ -102,18 +102,18 @@ class BaseNodeModel(object):
         d = defaultdict(list)
         with self.manager.session as s:
             kwargs['handle_id'] = self.handle_id
-            result = s.run(query, kwargs)
-            for record in result:
-                relationship = record['r']
-                node = record['node']
-                key = relationship.type
-                if 'key' in record.keys():
-                    key = record['key']
-                d[key].append({
-                    'relationship_id': relationship.id,
-                    'relationship': relationship,
-                    'node': core.get_node_model(self.manager, node=node)
-                })
+            records = list(s.run(query, kwargs))
+        nodes = core.get_node_models(self.manager, [record['node'] for record in records])
+        for record, node in zip(records, nodes):
+            relationship = record['r']
+            key = relationship.type
+            if 'key' in record.keys():
+                key = record['key']
+            d[key].append({
+                'relationship_id': relationship.id,
+                'relationship': relationship,
+                'node': node
+            })
         d.default_factory = None
         return d
 
@@ -121,20 +121,22 @@ class BaseNodeModel(object):
         d = defaultdict(list)
         with self.manager.session as s:
             kwargs['handle_id'] = self.handle_id
-            result = s.run(query, kwargs)
-            for record in result:
-                created = record['created']
-                relationship = record['r']
-                node = record['node']
-                key = relationship.type
-                if 'key' in record.keys():
-                    key = record['key']
-                d[key].append({
-                    'created': created,
-                    'relationship_id': relationship.id,
-                    'relationship': relationship,
-                    'node': core.get_node_model(self.manager, node=node)
-                })
+            records = list(s.run(query, kwargs))
+        nodes = core.get_node_models(self.manager, [record['node'] for record in records])
+        self.manager.invalidate_nodes(self.handle_id, *[node.handle_id for node in nodes])
+        core.impact_relationships_changed(self.manager, [(self.handle_id, node.handle_id, record['r'].type)
+                                                         for record, node in zip(records, nodes) if record['created']])
+        for record, node in zip(records, nodes):
+            relationship = record['r']
+            key = relationship.type
+            if 'key' in record.keys():
+                key = record['key']
+            d[key].append({
+                'created': record['created'],
+                'relationship_id': relationship.id,
+                'relationship': relationship,
+                'node': node
+            })
         d.default_factory = None
         return d
 
@@ -152,6 +154,7 @@ class BaseNodeModel(object):
             """.format(label=label)
         with self.manager.session as s:
             node = s.run(q, {'handle_id': self.handle_id}).single()['n']
+        self.manager.invalidate_nodes(self.handle_id)
         return self.reload(node=node)
 
     def remove_label(self, label):
@@ -162,6 +165,7 @@ class BaseNodeModel(object):
             """.format(label=label)
         with self.manager.session as s:
             node = s.run(q, {'handle_id': self.handle_id}).single()['n']
+        self.manager.invalidate_nodes(self.handle_id)
         return self.reload(node=node)
 
     def change_meta_type(self, meta_type):
@@ -231,22 +235,42 @@ class CommonQueries(BaseNodeModel):
         return self._basic_read_query_to_dict(q)
 
     def get_dependent_as_types(self):
-        q = """
-            MATCH (node:Node {handle_id: $handle_id})
-            OPTIONAL MATCH (node)<-[:Depends_on]-(d)
-            WITH node, collect(DISTINCT d) as direct
-            OPTIONAL MATCH (node)<-[:Part_of|Depends_on*1..20]-(dep)
-            OPTIONAL MATCH (node)-[:Depends_on]->(p:Port)<-[:Part_of|Depends_on*1..20]-(port_deps)
-            WITH direct, collect(DISTINCT dep) + collect(DISTINCT port_deps) as deps
-            WITH direct, deps, [n in deps WHERE n:Service] as services
-            WITH direct, deps, services, [n in deps WHERE n:Optical_Path] as paths
-            WITH direct, deps, services, paths, [n in deps WHERE n:Optical_Multiplex_Section] as oms
-            WITH direct, deps, services, paths, oms, [n in deps WHERE n:Optical_Link] as links
-            RETURN direct, services, paths, oms, links
-            """
-        return core.query_to_dict(self.manager, q, handle_id=self.handle_id)
+        return core.get_impact(self.manager, self.handle_id, core.DEPENDENTS_CACHE, self._get_dependent_as_types)
 
     def get_dependencies_as_types(self):
+        return core.get_impact(self.manager, self.handle_id, core.DEPENDENCIES_CACHE, self._get_dependencies_as_types)
+
+    # Dependents of the nodes with the handle_ids in $handle_ids, one row per node
+    _dependents_query = """
+        UNWIND $handle_ids AS handle_id
+        MATCH (node:Node {handle_id: handle_id})
+        OPTIONAL MATCH (node)<-[:Depends_on]-(d)
+        WITH node, collect(DISTINCT d) as direct
+        OPTIONAL MATCH (node)<-[:Part_of|Depends_on*1..20]-(dep)
+        OPTIONAL MATCH (node)-[:Depends_on]->(p:Port)<-[:Part_of|Depends_on*1..20]-(port_deps)
+        WITH node, direct, collect(DISTINCT dep) + collect(DISTINCT port_deps) as deps
+        RETURN node.handle_id AS handle_id, direct, [n in deps WHERE n:Service] as services,
+               [n in deps WHERE n:Optical_Path] as paths, [n in deps WHERE n:Optical_Multiplex_Section] as oms,
+               [n in deps WHERE n:Optical_Link] as links
+        """
+
+    @classmethod
+    def get_dependents_bulk(cls, manager, handle_ids):
+        """
+        Computes get_dependent_as_types for many nodes of this model with one query.
+
+        :return: handle_id -> dict of lists of nodes, nodes without a result are left out
+        :rtype: dict
+        """
+        result = {}
+        for record in core.query_to_list(manager, cls._dependents_query, handle_ids=list(handle_ids)):
+            result[record.pop('handle_id')] = record
+        return result
+
+    def _get_dependent_as_types(self):
+        return self.get_dependents_bulk(self.manager, [self.handle_id]).get(self.handle_id, {})
+
+    def _get_dependencies_as_types(self):
         q = """
             MATCH (node:Node {handle_id: $handle_id})
             OPTIONAL MATCH (node)-[:Depends_on]->(d)
@@ -327,28 +351,10 @@ class PhysicalModel(CommonQueries):
         return self._basic_read_query_to_dict(q)
 
     def get_location_path(self):
-        # TODO: check if size(nodes(p))/size(path) in neo4j>=4.4 is equivalent to length(nodes(p))/length(path) in neo4j==3.5
-        q = """
-            MATCH (n:Node {handle_id: $handle_id})-[:Located_in]->(r)
-            MATCH p=()-[:Has*0..20]->(r)
-            WITH COLLECT(nodes(p)) as paths, MAX(size(nodes(p))) AS maxLength
-            WITH [path IN paths WHERE size(path)=maxLength] AS longestPaths
-            UNWIND(longestPaths) as location_path
-            RETURN location_path
-            """
-        return core.query_to_dict(self.manager, q, handle_id=self.handle_id)
+        return {'location_path': core.get_path_nodes(self.manager, self.handle_id, core.LOCATION_PATH)}
 
     def get_placement_path(self):
-        # TODO: check if size(nodes(p))/size(path) in neo4j>=4.4 is equivalent to length(nodes(p))/length(path) in neo4j==3.5
-        q = """
-            MATCH (n:Node {handle_id: $handle_id})<-[:Has]-(parent)
-            OPTIONAL MATCH p=()-[:Has*0..20]->(parent)
-            WITH COLLECT(nodes(p)) as paths, MAX(size(nodes(p))) AS maxLength
-            WITH [path IN paths WHERE size(path)=maxLength] AS longestPaths
-            UNWIND(longestPaths) as placement_path
-            RETURN placement_path
-            """
-        return core.query_to_dict(self.manager, q, handle_id=self.handle_id)
+        return {'placement_path': core.get_path_nodes(self.manager, self.handle_id, core.PLACEMENT_PATH)}
 
     def set_owner(self, owner_handle_id):
         q = """
@@ -375,7 +381,10 @@ class PhysicalModel(CommonQueries):
             MERGE (n)-[r:Located_in]->(location)
             RETURN created, r, location as node
             """
-        return self._basic_write_query_to_dict(q, location_handle_id=location_handle_id)
+        result = self._basic_write_query_to_dict(q, location_handle_id=location_handle_id)
+        if result['Located_in'][0]['created']:
+            core.update_hierarchy(self.manager, [(self.handle_id, location_handle_id, 'Located_in')])
+        return result
 
     def get_has(self):
         q = """
@@ -391,7 +400,10 @@ class PhysicalModel(CommonQueries):
             MERGE (n)-[r:Has]->(part)
             RETURN created, r, part as node
             """
-        return self._basic_write_query_to_dict(q, has_handle_id=has_handle_id)
+        result = self._basic_write_query_to_dict(q, has_handle_id=has_handle_id)
+        if result['Has'][0]['created']:
+            core.update_hierarchy(self.manager, [(self.handle_id, has_handle_id, 'Has')])
+        return result
 
     def get_part_of(self):
         q = """
@@ -422,16 +434,8 @@ class PhysicalModel(CommonQueries):
 class LocationModel(CommonQueries):
 
     def get_location_path(self):
-        # TODO: check if size(nodes(p))/size(path) in neo4j>=4.4 is equivalent to length(nodes(p))/length(path) in neo4j==3.5
-        q = """
-            MATCH (n:Node {handle_id: $handle_id})<-[:Has]-(r)
-            MATCH p=()-[:Has*0..20]->(r)
-            WITH COLLECT(nodes(p)) as paths, MAX(size(nodes(p))) AS maxLength
-            WITH [path IN paths WHERE size(path)=maxLength] AS longestPaths
-            UNWIND(longestPaths) as location_path
-            RETURN location_path
-            """
-        return core.query_to_dict(self.manager, q, handle_id=self.handle_id)
+        # Locations are placed in other locations, their location path is the placement path
+        return {'location_path': core.get_path_nodes(self.manager, self.handle_id, core.PLACEMENT_PATH)}
 
     def get_parent(self):
         q = """
@@ -461,7 +465,10 @@ class LocationModel(CommonQueries):
             MERGE (n)-[r:Has]->(part)
             RETURN created, r, part as node
             """
-        return self._basic_write_query_to_dict(q, has_handle_id=has_handle_id)
+        result = self._basic_write_query_to_dict(q, has_handle_id=has_handle_id)
+        if result['Has'][0]['created']:
+            core.update_hierarchy(self.manager, [(self.handle_id, has_handle_id, 'Has')])
+        return result
 
     def set_responsible_for(self, owner_handle_id):
         q = """
@@ -529,24 +536,21 @@ class EquipmentModel(PhysicalModel):
             """
         return self._basic_read_query_to_dict(q, port_name=port_name)
 
-    def get_dependent_as_types(self):
-        # The + [null] is to handle both dep lists being emtpy since UNWIND gives 0 rows on unwind
-        q = """
-            MATCH (node:Node {handle_id: $handle_id})
-            OPTIONAL MATCH (node)<-[:Depends_on]-(d)
-            WITH node, collect(DISTINCT d) as direct
-            OPTIONAL MATCH (node)-[:Has*1..20]->()<-[:Part_of|Depends_on*1..20]-(dep)
-            OPTIONAL MATCH (node)-[:Has*1..20]->()<-[:Connected_to]-()-[:Connected_to]->()<-[:Depends_on*1..20]-(cable_dep)
-            WITH direct, collect(DISTINCT dep) + collect(DISTINCT cable_dep) + direct as coll
-            UNWIND coll AS x
-            WITH direct, collect(DISTINCT x) as deps
-            WITH direct, deps, [n in deps WHERE n:Service] as services
-            WITH direct, deps, services, [n in deps WHERE n:Optical_Path] as paths
-            WITH direct, deps, services, paths, [n in deps WHERE n:Optical_Multiplex_Section] as oms
-            WITH direct, deps, services, paths, oms, [n in deps WHERE n:Optical_Link] as links
-            RETURN direct, services, paths, oms, links
-            """
-        return core.query_to_dict(self.manager, q, handle_id=self.handle_id)
+    # Rows without any dependents are dropped by the UNWIND
+    _dependents_query = """
+        UNWIND $handle_ids AS handle_id
+        MATCH (node:Node {handle_id: handle_id})
+        OPTIONAL MATCH (node)<-[:Depends_on]-(d)
+        WITH node, collect(DISTINCT d) as direct
+        OPTIONAL MATCH (node)-[:Has*1..20]->()<-[:Part_of|Depends_on*1..20]-(dep)
+        OPTIONAL MATCH (node)-[:Has*1..20]->()<-[:Connected_to]-()-[:Connected_to]->()<-[:Depends_on*1..20]-(cable_dep)
+        WITH node, direct, collect(DISTINCT dep) + collect(DISTINCT cable_dep) + direct as coll
+        UNWIND coll AS x
+        WITH node, direct, collect(DISTINCT x) as deps
+        RETURN node.handle_id AS handle_id, direct, [n in deps WHERE n:Service] as services,
+               [n in deps WHERE n:Optical_Path] as paths, [n in deps WHERE n:Optical_Multiplex_Section] as oms,
+               [n in deps WHERE n:Optical_Link] as links
+        """
 
     def get_connections(self):
         q = """
@@ -566,16 +570,7 @@ class EquipmentModel(PhysicalModel):
 class SubEquipmentModel(PhysicalModel):
 
     def get_location_path(self):
-        # TODO: check if size(nodes(p))/size(path) in neo4j>=4.4 is equivalent to length(nodes(p))/length(path) in neo4j==3.5
-        q = """
-            MATCH (n:Node {handle_id: $handle_id})<-[:Has]-(parent)
-            OPTIONAL MATCH p=()-[:Has*0..20]->(r)<-[:Located_in]-()-[:Has*0..20]->(parent)
-            WITH COLLECT(nodes(p)) as paths, MAX(size(nodes(p))) AS maxLength
-            WITH [path IN paths WHERE size(path)=maxLength] AS longestPaths
-            UNWIND(longestPaths) as location_path
-            RETURN location_path
-            """
-        return core.query_to_dict(self.manager, q, handle_id=self.handle_id)
+        return {'location_path': core.get_path_nodes(self.manager, self.handle_id, core.LOCATION_PATH)}
 
     def get_connections(self):
         q = """
@@ -592,21 +587,17 @@ class SubEquipmentModel(PhysicalModel):
 
 class HostModel(CommonQueries):
 
-    def get_dependent_as_types(self):
-        q = """
-            MATCH (node:Node {handle_id: $handle_id})
-            OPTIONAL MATCH (node)<-[:Depends_on]-(d)
-            WITH node, [n in collect(DISTINCT d)] as direct
-            MATCH (node)<-[:Depends_on*1..20]-(dep)
-            WITH direct, collect(DISTINCT dep) as deps
-            WITH direct, deps, [n in deps WHERE n:Service] as services
-            WITH direct, deps, services, [n in deps WHERE n:Optical_Path] as paths
-            WITH direct, deps, services, paths, [n in deps WHERE n:Optical_Multiplex_Section] as oms
-            WITH direct, deps, services, paths, oms, [n in deps WHERE n:Optical_Link] as links
-            RETURN direct, services, paths, oms, links
-            """
-        
-        return core.query_to_dict(self.manager, q, handle_id=self.handle_id)
+    _dependents_query = """
+        UNWIND $handle_ids AS handle_id
+        MATCH (node:Node {handle_id: handle_id})
+        OPTIONAL MATCH (node)<-[:Depends_on]-(d)
+        WITH node, collect(DISTINCT d) as direct
+        MATCH (node)<-[:Depends_on*1..20]-(dep)
+        WITH node, direct, collect(DISTINCT dep) as deps
+        RETURN node.handle_id AS handle_id, direct, [n in deps WHERE n:Service] as services,
+               [n in deps WHERE n:Optical_Path] as paths, [n in deps WHERE n:Optical_Multiplex_Section] as oms,
+               [n in deps WHERE n:Optical_Link] as links
+        """
 
 
 class PhysicalHostModel(HostModel, EquipmentModel):
@@ -736,19 +727,16 @@ class CableModel(PhysicalModel):
             """
         return core.query_to_list(self.manager, q, handle_id=self.handle_id)
 
-    def get_dependent_as_types(self):
-        q = """
-            MATCH (n:Node {handle_id: $handle_id})-[:Connected_to*1..20]-(equip)
-            WITH DISTINCT equip
-            MATCH (equip)<-[:Part_of|Depends_on*1..10]-(dep)
-            WITH collect(DISTINCT dep) as deps
-            WITH deps, [n in deps WHERE n:Service] as services
-            WITH deps, services, [n in deps WHERE n:Optical_Path] as paths
-            WITH deps, services, paths, [n in deps WHERE n:Optical_Multiplex_Section] as oms
-            WITH deps, services, paths, oms, [n in deps WHERE n:Optical_Link] as links
-            RETURN services, paths, oms, links
-            """
-        return core.query_to_dict(self.manager, q, handle_id=self.handle_id)
+    _dependents_query = """
+        UNWIND $handle_ids AS handle_id
+        MATCH (node:Node {handle_id: handle_id})-[:Connected_to*1..20]-(equip)
+        WITH DISTINCT node, equip
+        MATCH (equip)<-[:Part_of|Depends_on*1..10]-(dep)
+        WITH node, collect(DISTINCT dep) as deps
+        RETURN node.handle_id AS handle_id, [n in deps WHERE n:Service] as services,
+               [n in deps WHERE n:Optical_Path] as paths, [n in deps WHERE n:Optical_Multiplex_Section] as oms,
+               [n in deps WHERE n:Optical_Link] as links
+        """
 
     def get_services(self):
         q = """
@@ -790,28 +778,23 @@ class CableModel(PhysicalModel):
 class UnitModel(LogicalModel):
 
     def get_placement_path(self):
-        # TODO: check if size(nodes(p))/size(path) in neo4j>=4.4 is equivalent to length(nodes(p))/length(path) in neo4j==3.5
-        q = """
-            MATCH (n:Node {handle_id: $handle_id})-[:Part_of]->(parent)
-            OPTIONAL MATCH p=()-[:Has*0..20]->(parent)
-            WITH COLLECT(nodes(p)) as paths, MAX(size(nodes(p))) AS maxLength
-            WITH [path IN paths WHERE size(path)=maxLength] AS longestPaths
-            UNWIND(longestPaths) as placement_path
-            RETURN placement_path
-            """
-        return core.query_to_dict(self.manager, q, handle_id=self.handle_id)
+        return {'placement_path': self._parent_path_nodes(core.PLACEMENT_PATH)}
 
     def get_location_path(self):
-        # TODO: check if size(nodes(p))/size(path) in neo4j>=4.4 is equivalent to length(nodes(p))/length(path) in neo4j==3.5
+        path = self._parent_path_nodes(core.LOCATION_PATH)
+        # Only the parent itself means the parent has no location
+        return {'location_path': path if len(path) > 1 else []}
+
+    def _parent_path_nodes(self, prop):
+        # Units are not in the hierarchy, their paths are the paths of the node they are part of
         q = """
             MATCH (n:Node {handle_id: $handle_id})-[:Part_of]->(parent)
-            OPTIONAL MATCH p=()-[:Has*0..20]->(r)<-[:Located_in]-()-[:Has*0..20]->(parent)
-            WITH COLLECT(nodes(p)) as paths, MAX(size(nodes(p))) AS maxLength
-            WITH [path IN paths WHERE size(path)=maxLength] AS longestPaths
-            UNWIND(longestPaths) as location_path
-            RETURN location_path
+            RETURN parent.handle_id AS handle_id
             """
-        return core.query_to_dict(self.manager, q, handle_id=self.handle_id)
+        parent = core.query_to_dict(self.manager, q, handle_id=self.handle_id)
+        if not parent:
+            return []
+        return core.get_path_nodes(self.manager, parent['handle_id'], prop, include_self=True)
 
 
 class ServiceModel(LogicalModel):
@@ -104,6 +104,31 @@ DEFAULT_AUTO_FIELD = 'django.db.models.AutoField'
 ########## END DATABASE CONFIGURATION
 
 
+########## CACHE CONFIGURATION
+# See: https://docs.djangoproject.com/en/dev/ref/settings/#caches
+# locmem caches per process, use file or redis (needs the redis package) to share cached reports between processes.
+# With locmem a write only invalidates the reports cached by the writing process, others keep them for REPORT_CACHE_TTL.
+# CACHE_BACKEND can also be the path of any Django cache backend.
+# Only one request computes a missing report if cache.add is atomic (redis), with file two requests may do it.
+CACHE_BACKENDS = {
+    'locmem': 'django.core.cache.backends.locmem.LocMemCache',
+    'file': 'django.core.cache.backends.filebased.FileBasedCache',
+    'redis': 'django.core.cache.backends.redis.RedisCache',
+}
+CACHE_BACKEND = environ.get('CACHE_BACKEND', 'locmem')
+CACHES = {
+    'default': {
+        'BACKEND': CACHE_BACKENDS.get(CACHE_BACKEND, CACHE_BACKEND),
+        'LOCATION': environ.get('CACHE_LOCATION', ''),  # Directory for file, redis://host:port/db for redis
+    }
+}
+# Seconds report results are cached, writes to the node types a report reads invalidate them earlier.
+REPORT_CACHE_TTL = int(environ.get('REPORT_CACHE_TTL', '60'))
+# Seconds before the handle_id to node type map used for node URLs is loaded again.
+URL_MAP_TTL = int(environ.get('URL_MAP_TTL', '300'))
+########## END CACHE CONFIGURATION
+
+
 ########## GENERAL CONFIGURATION
 # See: https://docs.djangoproject.com/en/dev/ref/settings/#time-zone
 TIME_ZONE = 'Europe/Stockholm'
@@ -216,6 +241,7 @@ MIDDLEWARE = (
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'apps.noclook.middleware.QueryStatsMiddleware',
 )
 ########## END MIDDLEWARE CONFIGURATION
 
@@ -287,6 +313,13 @@ ACTSTREAM_SETTINGS = {
     'USE_JSONFIELD': True,
     'GFK_FETCH_DEPTH': 1,
 }
+
+# Commands run by the process_scan_queue workers, they should print a NERDS document for the target.
+# The queued host name or router is validated and appended as last argument after --.
+SCAN_COMMANDS = {
+    'Host': environ.get('SCAN_HOST_COMMAND', ''),
+    'Router': environ.get('SCAN_ROUTER_COMMAND', ''),
+}
 ########## END APP CONFIGURATION
 
 
@@ -343,6 +376,14 @@ LOGGING = {
             'filters': ['require_debug_true'],
             'class': 'logging.StreamHandler'
         },
+        'slowqueryfile': {
+            'level': 'WARNING',
+            'class': 'logging.handlers.RotatingFileHandler',
+            'filename': '{!s}/neo4j_slow_queries.log'.format(LOG_PATH),
+            'maxBytes': 1024*1024*5,  # 5 MB
+            'backupCount': 5,
+            'formatter': 'verbose',
+        },
     },
     'loggers': {
         '': {
@@ -355,6 +396,11 @@ LOGGING = {
             'level': 'ERROR',
             'propagate': True,
         },
+        'graphdb.slow_queries': {
+            'handlers': ['slowqueryfile'],
+            'level': 'WARNING',
+            'propagate': False,
+        },
     }
 }
 ########## END LOGGING CONFIGURATION
@@ -12,6 +12,8 @@ __author__ = 'lundberg'
 # Neo4j settings
 NEO4J_RESOURCE_URI = environ.get('NEO4J_RESOURCE_URI', 'bolt://localhost:7687')
 NEO4J_MAX_DATA_AGE = environ.get('NEO4J_MAX_DATA_AGE', '24')  # hours
+NEO4J_SLOW_QUERY_MS = environ.get('NEO4J_SLOW_QUERY_MS', '1000')  # 0 disables the slow query log
+NEO4J_QUERY_STATS_DIR = environ.get('NEO4J_QUERY_STATS_DIR')  # Per process query statistics for dump_query_stats
 NEO4J_USERNAME = environ.get('NEO4J_USERNAME', 'neo4j')
 NEO4J_PASSWORD = environ.get('NEO4J_PASSWORD', 'docker')
 
@@ -57,16 +59,6 @@ DATABASES = {
 ########## END DATABASE CONFIGURATION
 
 
-########## CACHE CONFIGURATION
-# See: https://docs.djangoproject.com/en/dev/ref/settings/#caches
-CACHES = {
-    'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-    }
-}
-########## END CACHE CONFIGURATION
-
-
 ########## SECRET CONFIGURATION
 SECRET_KEY = environ.get('SECRET_KEY', 'development')
 ########## END SECRET CONFIGURATION
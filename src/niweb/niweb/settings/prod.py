@@ -13,6 +13,8 @@ __author__ = 'lundberg'
 # Neo4j settings
 NEO4J_RESOURCE_URI = environ.get('NEO4J_RESOURCE_URI', 'bolt://localhost:7687')
 NEO4J_MAX_DATA_AGE = environ.get('NEO4J_MAX_DATA_AGE', '24')  # hours
+NEO4J_SLOW_QUERY_MS = environ.get('NEO4J_SLOW_QUERY_MS', '1000')  # 0 disables the slow query log
+NEO4J_QUERY_STATS_DIR = environ.get('NEO4J_QUERY_STATS_DIR')  # Per process query statistics for dump_query_stats
 NEO4J_USERNAME = environ.get('NEO4J_USERNAME')
 NEO4J_PASSWORD = environ.get('NEO4J_PASSWORD')
 # To be able to use the report mailing functionality you need to set a to address and a key.
@@ -129,9 +131,10 @@ DATABASES = {
 
 ########## CACHE CONFIGURATION
 # See: https://docs.djangoproject.com/en/dev/ref/settings/#caches
+CACHE_BACKEND = environ.get('CACHE_BACKEND', 'file')
 CACHES = {
     'default': {
-        'BACKEND': environ.get('CACHE_BACKEND', 'django.core.cache.backends.filebased.FileBasedCache'),
+        'BACKEND': CACHE_BACKENDS.get(CACHE_BACKEND, CACHE_BACKEND),
         'LOCATION': environ.get('CACHE_LOCATION', '/tmp/django_cache'),
     }
 }
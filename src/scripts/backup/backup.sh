@@ -29,7 +29,7 @@ pg_dump norduni | gzip > $BACKUPDIR/postgres-$TODAY.sql.gz
 [ -d $BACKUPDIR/json ] && rm -r $BACKUPDIR/json
 mkdir $BACKUPDIR/json
 cd $NORDUNIDIR/src/scripts/
-./noclook_producer.py -O $BACKUPDIR/json
+./noclook_producer.py -O $BACKUPDIR/json --ndjson
 cd $BACKUPDIR
 tar cfz ni_data-$TODAY.tar.gz json/
 rm -r json
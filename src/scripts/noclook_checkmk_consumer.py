@@ -82,14 +82,12 @@ def get_host(ip_address):
     :param ip_address: string
     :return: neo4j node or None
     """
-    q = '''
-        MATCH (n:Host)
-        USING SCAN n:Host
-        WHERE any(x IN n.ip_addresses WHERE x =~ $address)
-        RETURN distinct n
-        '''
-    for hit in nc.query_to_list(nc.graphdb.manager, q, address=ip_address):
-        return nc.get_node_model(nc.graphdb.manager, node=hit['n'])
+    try:
+        hosts = nc.get_nodes_by_ip(nc.graphdb.manager, ip_address, 'Host')
+    except ValueError:
+        return None
+    for host in hosts:
+        return host
 
 
 def set_nagios_checks(host, checks):
@@ -217,32 +215,33 @@ def insert(json_list):
     # Setup persistent storage for collections done over multiple hosts
     netapp_collection = getattr(django_settings, 'NETAPP_REPORT_SETTINGS', [])
 
-    # Parse collected Nagios data
-    for item in json_list:
-        base = item['host'].get('checkmk_livestatus')
-        if not base:
-            base = item['host']['nagiosxi_api']
-        base['host_name'] = base['host_name'].lower()
-        host = nc.get_unique_node_by_name(nc.graphdb.manager, base['host_name'], 'Host')
-        if not host:
-            host = get_host(base['host_address'])
-        if host:
-            check_descriptions = []
-            for check in base['checks']:
-                check_descriptions.append(check.get('description', 'Missing description'))
-                if check['check_command'] == 'CHECK_NRPE!check_uptime':     # Host uptime
-                    set_uptime(host, check)
-                if check['check_command'] == 'CHECK_NRPE!check_backup':     # TSM backup process
-                    set_backup(host, check)
-                if check['check_command'].startswith('check_netapp_vol'):   # NetApp storage usage
-                    netapp_collection = collect_netapp_storage_usage(host, check, netapp_collection)
-                if check['check_command'] == 'CHECK_NRPE!check_openmanage':     # Dell OpenManage info
-                    set_dell_service_tag(host, check)
-                if check['check_command'] == 'check_esxi':                      # Dell esxi HW info
-                    set_dell_service_tag(host, check)
-            set_nagios_checks(host, check_descriptions)
-            helpers.update_noclook_auto_manage(host)
-            logger.info('{name} done.'.format(name=host.data['name']))
+    # Parse collected Nagios data, last seen is written for all hosts at once
+    with helpers.deferred_auto_manage():
+        for item in json_list:
+            base = item['host'].get('checkmk_livestatus')
+            if not base:
+                base = item['host']['nagiosxi_api']
+            base['host_name'] = base['host_name'].lower()
+            host = nc.get_unique_node_by_name(nc.graphdb.manager, base['host_name'], 'Host')
+            if not host:
+                host = get_host(base['host_address'])
+            if host:
+                check_descriptions = []
+                for check in base['checks']:
+                    check_descriptions.append(check.get('description', 'Missing description'))
+                    if check['check_command'] == 'CHECK_NRPE!check_uptime':     # Host uptime
+                        set_uptime(host, check)
+                    if check['check_command'] == 'CHECK_NRPE!check_backup':     # TSM backup process
+                        set_backup(host, check)
+                    if check['check_command'].startswith('check_netapp_vol'):   # NetApp storage usage
+                        netapp_collection = collect_netapp_storage_usage(host, check, netapp_collection)
+                    if check['check_command'] == 'CHECK_NRPE!check_openmanage':     # Dell OpenManage info
+                        set_dell_service_tag(host, check)
+                    if check['check_command'] == 'check_esxi':                      # Dell esxi HW info
+                        set_dell_service_tag(host, check)
+                set_nagios_checks(host, check_descriptions)
+                helpers.update_noclook_auto_manage(host)
+                logger.info('{name} done.'.format(name=host.data['name']))
     # Set data collected from multiple hosts
     set_netapp_storage_usage(netapp_collection)
 
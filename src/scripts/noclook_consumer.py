@@ -22,6 +22,7 @@
 
 import sys
 import random
+import itertools
 import datetime
 import argparse
 import logging
@@ -124,30 +125,20 @@ def _consume_node(item, fallback_user):
         logger.error('Could not add node {} (handle_id={}, node_type={}, meta_type={}) got {}: {})'.format(node_name, handle_id, node_type, meta_type, ex_type, str(e)))
 
 
-def consume_noclook(nodes, relationships):
-    """
-    Inserts the backup made with NOCLook producer.
+BATCH_SIZE = 500
 
-    Batches all operations to minimise Neo4j session round-trips and use
-    bulk SQL inserts for Django NodeHandles.
-    """
-    BATCH_SIZE = 500
 
-    def _chunks(lst, n):
-        for i in range(0, len(lst), n):
-            yield lst[i:i + n]
+def _chunks(iterable, n):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, n))
+        if not chunk:
+            return
+        yield chunk
 
-    fallback_user = utils.get_user()
-
-    # Nodes
-    node_items = [
-        i['host']['noclook_producer']
-        for i in nodes
-        if i['host']['name'].startswith('node')
-    ]
 
+def _consume_node_batch(node_items, fallback_user, type_cache):
     # Cache NodeType lookups (one query per distinct type name instead of one per node)
-    type_cache = {}
     for item in node_items:
         name = item.get('node_type')
         if name not in type_cache:
@@ -193,6 +184,7 @@ def consume_noclook(nodes, relationships):
     for item in node_items:
         props = dict(item.get('properties') or {})
         props['handle_id'] = item.get('handle_id')
+        props.update({k: v for k, v in nc.node_index_properties(props).items() if v is not None})
         all_props.append({'handle_id': item.get('handle_id'), 'props': props})
 
     for (meta_type, type_label), group in neo4j_groups.items():
@@ -201,28 +193,23 @@ def consume_noclook(nodes, relationships):
             MERGE (node:Node:%s:%s {handle_id: n.handle_id})
             ON CREATE SET node.name = n.name
             """ % (meta_type, type_label)
-        for chunk in _chunks(group, BATCH_SIZE):
-            with nc.graphdb.manager.session as s:
-                s.run(q, {'nodes': chunk})
+        with nc.graphdb.manager.session as s:
+            s.run(q, {'nodes': group})
 
     set_q = """
         UNWIND $items AS item
         MATCH (n:Node {handle_id: item.handle_id})
         SET n = item.props
         """
-    for chunk in _chunks(all_props, BATCH_SIZE):
-        with nc.graphdb.manager.session as s:
-            s.run(set_q, {'items': chunk})
+    with nc.graphdb.manager.session as s:
+        s.run(set_q, {'items': all_props})
 
-    tot_nodes = len(node_items)
-    print('Added {!s} nodes.'.format(tot_nodes))
 
-    # Relationships
+def _consume_relationship_batch(relationships):
     # Group by (type, sorted property keys) to preserve the original MERGE
     # semantics where relationship identity included all properties.
     rel_groups = defaultdict(list)
-    for i in relationships:
-        rel = i['host']['noclook_producer']
+    for rel in relationships:
         rel_type = rel.get('type')
         properties = rel.get('properties') or {}
         prop_keys = tuple(sorted(properties.keys()))
@@ -246,12 +233,51 @@ def consume_noclook(nodes, relationships):
                 MATCH (start:Node {handle_id: r.start}), (end:Node {handle_id: r.end})
                 MERGE (start)-[rel:%s]->(end)
                 """ % rel_type
-        for chunk in _chunks(rels, BATCH_SIZE):
-            with nc.graphdb.manager.session as s:
-                s.run(q, {'rels': chunk})
+        with nc.graphdb.manager.session as s:
+            s.run(q, {'rels': rels})
 
-    tot_rels = sum(len(v) for v in rel_groups.values())
-    print('Added {!s} relationships.'.format(tot_rels))
+
+def consume_noclook(nodes, relationships):
+    """
+    Inserts the backup made with NOCLook producer.
+
+    Nodes and relationships can be any iterables, for example the generators
+    returned by utils.load_json. They are consumed BATCH_SIZE items at a time
+    so memory use does not grow with the size of the backup. Each batch uses
+    bulk SQL inserts for Django NodeHandles and one Neo4j statement per label
+    or relationship type.
+    """
+    fallback_user = utils.get_user()
+    type_cache = {}
+
+    try:
+        # Nodes
+        node_items = (
+            i['host']['noclook_producer']
+            for i in nodes
+            if i['host']['name'].startswith('node')
+        )
+        tot_nodes = 0
+        for chunk in _chunks(node_items, BATCH_SIZE):
+            _consume_node_batch(chunk, fallback_user, type_cache)
+            tot_nodes += len(chunk)
+        print('Added {!s} nodes.'.format(tot_nodes))
+
+        # Relationships
+        tot_rels = 0
+        for chunk in _chunks((i['host']['noclook_producer'] for i in relationships), BATCH_SIZE):
+            _consume_relationship_batch(chunk)
+            tot_rels += len(chunk)
+        print('Added {!s} relationships.'.format(tot_rels))
+    finally:
+        # Nodes and relationships are restored with plain Cypher, which does not maintain the typeahead names and
+        # the stored placement and location paths. Calculate them for every node, also when the restore failed part
+        # way, so the typeahead index is filled.
+        updated = nc.rebuild_typeahead(nc.graphdb.manager, batch_size=BATCH_SIZE)
+        print('Calculated the typeahead names of {!s} nodes.'.format(updated))
+        updated = nc.rebuild_location_paths(nc.graphdb.manager, batch_size=BATCH_SIZE)
+        print('Calculated the location paths of {!s} nodes.'.format(updated))
+        nc.clear_impact(nc.graphdb.manager)
 
 
 def run_consume(config_file):
@@ -263,6 +289,9 @@ def run_consume(config_file):
     juniper_conf_data = config.get('data', 'juniper_conf')
     remove_expired_juniper_conf = config.getboolean('delete_data', 'juniper_conf')
     juniper_conf_data_age = config.get('data_age', 'juniper_conf')
+    juniper_conf_workers = 0
+    if config.has_option('bulk_workers', 'juniper_conf'):
+        juniper_conf_workers = config.getint('bulk_workers', 'juniper_conf')
     # nmap services
     nmap_services_py_data = config.get('data', 'nmap_services_py')
     # nagios checkmk
@@ -275,7 +304,8 @@ def run_consume(config_file):
     if juniper_conf_data:
         data = utils.load_json(juniper_conf_data)
         switches = False
-        noclook_juniper_consumer.consume_juniper_conf(data, switches)
+        noclook_juniper_consumer.consume_juniper_conf(data, switches, bulk=juniper_conf_workers > 0,
+                                                      workers=juniper_conf_workers)
     if nmap_services_py_data:
         data = utils.load_json(nmap_services_py_data)
         noclook_nmap_consumer.insert_nmap(data)
@@ -33,10 +33,9 @@ import argparse
 import logging
 import django_hack
 
-import graphdb as nc
 import utils
-from apps.noclook import helpers
 from apps.nerds.lib.juniper_consumer import consume_juniper_conf
+from apps.nerds.lib import expired_data
 
 django_hack.nop()
 
@@ -92,68 +91,30 @@ logger = logging.getLogger('noclook_consumer.juniper')
 
 
 
-def remove_router_conf(user, data_age):
-    routerq = """
-        MATCH (router:Node:Router)
-        OPTIONAL MATCH (router)-[:Has*1..]->(physical)<-[:Part_of]-(logical)
-        WHERE (physical.noclook_auto_manage = true) OR (logical.noclook_auto_manage = true)
-        RETURN collect(distinct physical.handle_id) as physical, collect(distinct logical.handle_id) as logical
-        """
-    router_result = nc.query_to_dict(nc.graphdb.manager, routerq)
-    for handle_id in router_result.get('logical', []):
-        logical = nc.get_node_model(nc.graphdb.manager, handle_id)
-        if logical:
-            last_seen, expired = helpers.neo4j_data_age(logical.data, data_age)
-            if expired:
-                helpers.delete_node(user, logical.handle_id)
-                logger.warning('Deleted logical router: %s (%s).', logical.data.get('name'), handle_id)
-    for handle_id in router_result.get('physical', []):
-        physical = nc.get_node_model(nc.graphdb.manager, handle_id)
-        if physical:
-            last_seen, expired = helpers.neo4j_data_age(physical.data, data_age)
-            if expired:
-                helpers.delete_node(user, physical.handle_id)
-                logger.warning('Deleted physical router: %s (%s).', physical.data.get('name'), handle_id)
-
-
-def remove_peer_conf(user, data_age):
-    peerq = """
-        MATCH (peer_group:Node:Peering_Group)
-        MATCH (peer_group)<-[r:Uses]-(peering_partner:Peering_Partner)
-        WHERE (peer_group.noclook_auto_manage = true) OR (r.noclook_auto_manage = true)
-        RETURN collect(distinct peer_group.handle_id) as peer_groups, collect(id(r)) as uses_relationships
-        """
-    peer_result = nc.query_to_dict(nc.graphdb.manager, peerq)
-
-    for relationship_id in peer_result.get('uses_relationships', []):
-        relationship = nc.get_relationship_model(nc.graphdb.manager, relationship_id)
-        if relationship:
-            last_seen, expired = helpers.neo4j_data_age(relationship.data, data_age)
-            if expired:
-                rel_info = helpers.relationship_to_str(relationship)
-                helpers.delete_relationship(user, relationship.id)
-                logger.warning('Deleted relationship {rel_info}'.format(rel_info=rel_info))
-    for handle_id in peer_result.get('peer_groups', []):
-        peer_group = nc.get_node_model(nc.graphdb.manager, handle_id)
-        if peer_group:
-            last_seen, expired = helpers.neo4j_data_age(peer_group.data, data_age)
-            if expired:
-                helpers.delete_node(user, peer_group.handle_id)
-                logger.warning('Deleted node {name} ({handle_id}).'.format(name=peer_group.data.get('name'), handle_id=handle_id))
-
-
-def remove_juniper_conf(data_age):
+def remove_router_conf(user, data_age, dry_run=False):
+    counts = expired_data.remove_expired_router_data(user, data_age, dry_run=dry_run)
+    logger.warning('%s %s expired router nodes.', 'Found' if dry_run else 'Deleted', counts['nodes'])
+
+
+def remove_peer_conf(user, data_age, dry_run=False):
+    counts = expired_data.remove_expired_peer_data(user, data_age, dry_run=dry_run)
+    logger.warning('%s %s expired peering group nodes and %s Uses relationships.',
+                   'Found' if dry_run else 'Deleted', counts['nodes'], counts['relationships'])
+
+
+def remove_juniper_conf(data_age, dry_run=False):
     """
     :param data_age: Data older than this many days will be deleted.
+    :param dry_run: Only report how much would be deleted.
     :return: None
     """
     user = utils.get_user()
     data_age = int(data_age) * 24  # hours in a day
     logger.info('Deleting expired router nodes and sub equipment nodes:')
-    remove_router_conf(user, data_age)
+    remove_router_conf(user, data_age, dry_run)
     logger.info('...done!')
     logger.info('Deleting expired peering partner nodes and relationships:')
-    remove_peer_conf(user, data_age)
+    remove_peer_conf(user, data_age, dry_run)
     logger.info('...done!')
 
 
@@ -163,6 +124,11 @@ def main():
     parser.add_argument('--verbose', '-V', action='store_true', default=False)
     parser.add_argument('--switches', '-S', action='store_true', default=False, help='Insert as switches rather than routers')
     parser.add_argument('--data', '-d', required=False, help='Directory to load data from. Trumps config file.')
+    parser.add_argument('--bulk', '-b', action='store_true', default=False,
+                        help='Write the interfaces of each router in batches.')
+    parser.add_argument('--workers', '-w', type=int, default=1, help='Number of routers to process concurrently.')
+    parser.add_argument('--dry-run', '-N', action='store_true', default=False,
+                        help='Only report how much expired data would be deleted.')
     args = parser.parse_args()
     if not args.C and not args.data:
         print('Please provide a configuration file with -C or --data for a data directory.')
@@ -172,9 +138,9 @@ def main():
     if args.verbose:
         logger.setLevel(logging.INFO)
     if data:
-        consume_juniper_conf(utils.load_json(data), args.switches)
+        consume_juniper_conf(utils.load_json(data), args.switches, bulk=args.bulk, workers=args.workers)
     if config and config.has_option('delete_data', 'juniper_conf') and config.getboolean('delete_data', 'juniper_conf'):
-        remove_juniper_conf(config.get('data_age', 'juniper_conf'))
+        remove_juniper_conf(config.get('data_age', 'juniper_conf'), args.dry_run)
     return 0
 
 
@@ -28,6 +28,7 @@ import django_hack
 from django.core.exceptions import ObjectDoesNotExist
 from apps.noclook.models import NodeType
 import graphdb as nc
+import utils
 
 
 django_hack.nop()
@@ -79,55 +80,111 @@ def labels_to_meta_type(labels):
             return label
 
 
-def nodes_to_json():
-    json_list = []
+def node_to_json(node):
+    labels = list(node.labels)
+    data = nc.neo4j_entity_to_dict(node)
+    return {'host': {
+        'name': 'node_%d' % data['handle_id'],
+        'version': 1,
+        'noclook_producer': {
+            'handle_id': data['handle_id'],
+            'meta_type': labels_to_meta_type(labels),
+            'node_type': labels_to_node_type(labels),
+            'labels': labels,
+            'properties': data
+        }
+    }}
+
+
+def relationship_to_json(relationship, start, end):
+    data = {k: v for k, v in relationship.items()}
+    return {'host': {
+        'name': 'relationship_{!s}'.format(relationship.id),
+        'version': 1,
+        'noclook_producer': {
+            'id': relationship.id,
+            'type': relationship.type,
+            'start': start,
+            'end': end,
+            'properties': data
+        }
+    }}
+
+
+def iter_nodes(page_size=1000):
+    """
+    Yields all nodes as producer dicts, reading page_size nodes per query ordered by handle_id.
+    """
     q = """
         MATCH (n:Node)
+        WHERE n.handle_id > $last_handle_id
         RETURN n
+        ORDER BY n.handle_id
+        LIMIT $page_size
         """
-    for item in nc.query_to_iterator(nc.graphdb.manager, q):
-        labels = list(item['n'].labels)
-        data = {k: v for k, v in item['n'].items()}
-        json_list.append(
-            {'host': {
-                'name': 'node_%d' % data['handle_id'],
-                'version': 1,
-                'noclook_producer': {
-                    'handle_id': data['handle_id'],
-                    'meta_type': labels_to_meta_type(labels),
-                    'node_type': labels_to_node_type(labels),
-                    'labels': labels,
-                    'properties': data
-                }
-            }})
-    return json_list
-
-
-def relationships_to_json():
-    json_list = []
+    last_handle_id = -1
+    while True:
+        page = list(nc.query_to_iterator(nc.graphdb.manager, q, last_handle_id=last_handle_id, page_size=page_size))
+        for item in page:
+            yield node_to_json(item['n'])
+        if len(page) < page_size:
+            break
+        last_handle_id = page[-1]['n']['handle_id']
+
+
+def iter_relationships(page_size=1000):
+    """
+    Yields all relationships as producer dicts, reading page_size relationships per query ordered by id.
+    """
     q = """
         MATCH ()-[r]->()
+        WHERE id(r) > $last_id
         RETURN r, startNode(r).handle_id as start, endNode(r).handle_id as end
+        ORDER BY id(r)
+        LIMIT $page_size
         """
+    last_id = -1
+    while True:
+        page = list(nc.query_to_iterator(nc.graphdb.manager, q, last_id=last_id, page_size=page_size))
+        for item in page:
+            yield relationship_to_json(item['r'], item['start'], item['end'])
+        if len(page) < page_size:
+            break
+        last_id = page[-1]['r'].id
+
+
+def nodes_to_json():
+    return list(iter_nodes())
 
-    for item in nc.query_to_iterator(nc.graphdb.manager, q):
-        relationship = item['r']
-        start = item['start']
-        end = item['end']
-        data = {k: v for k, v in relationship.items()}
-        json_list.append(
-            {'host': {
-                'name': 'relationship_{!s}'.format(relationship.id),
-                'version': 1,
-                'noclook_producer': {
-                    'id': relationship.id,
-                    'type': relationship.type,
-                    'start': start,
-                    'end': end,
-                    'properties': data
-                }
-            }})
-    return json_list
+
+def relationships_to_json():
+    return list(iter_relationships())
+
+
+def output_ndjson(out_dir, prefix, items, shard_size=100000, compress=False):
+    """
+    Writes items as newline delimited JSON to {prefix}-00000.ndjson[.gz], starting a new file every shard_size items.
+    Returns the number of items written.
+    """
+    if not os.path.isdir(out_dir):
+        os.makedirs(out_dir)
+    suffix = '.ndjson.gz' if compress else '.ndjson'
+    f = None
+    count = 0
+    try:
+        for item in items:
+            if count % shard_size == 0:
+                if f:
+                    f.close()
+                path = os.path.join(out_dir, '{}-{:05d}{}'.format(prefix, count // shard_size, suffix))
+                f = utils.open_ndjson(path, 'wt')
+            f.write(json.dumps(item, sort_keys=True))
+            f.write('\n')
+            count += 1
+    finally:
+        if f:
+            f.close()
+    return count
 
 
 def main():
@@ -135,8 +192,26 @@ def main():
     parser = argparse.ArgumentParser()
     parser.add_argument('-O', nargs='?', help='Path to output directory.')
     parser.add_argument('-N', action='store_true', help='Don\'t write output to disk (JSON format).')
+    parser.add_argument('--ndjson', action='store_true',
+                        help='Stream nodes and relationships to newline delimited JSON files.')
+    parser.add_argument('-z', '--gzip', action='store_true', help='Compress the newline delimited JSON files.')
+    parser.add_argument('--shard-size', type=int, default=100000, help='Nodes or relationships per file.')
+    parser.add_argument('--page-size', type=int, default=1000, help='Nodes or relationships read per query.')
     args = parser.parse_args()
 
+    # Output directory should be ./json/ if nothing else is
+    # specified
+    out_dir = './json/'
+    if args.O:
+        out_dir = args.O
+
+    if args.ndjson:
+        nodes = output_ndjson(out_dir, 'nodes', iter_nodes(args.page_size), args.shard_size, args.gzip)
+        relationships = output_ndjson(out_dir, 'relationships', iter_relationships(args.page_size),
+                                      args.shard_size, args.gzip)
+        print('Wrote {!s} nodes and {!s} relationships to {!s}.'.format(nodes, relationships, out_dir))
+        return 0
+
     # Create the json representation of nodes and relationships
     out_data = nodes_to_json()
     out_data.extend(relationships_to_json())
@@ -144,14 +219,8 @@ def main():
     if args.N:
         print(json.dumps(out_data, sort_keys=True, indent=4))
     else:
-        # Output directory should be ./json/ if nothing else is
-        # specified
-        out_dir = './json/'
-        if args.O:
-            out_dir = args.O
         output(out_dir, out_data)
     return 0
 
 if __name__ == '__main__':
     main()
-
@@ -23,47 +23,15 @@ import argparse
 import logging
 import utils
 
-from apps.noclook import helpers
-import graphdb as nc
+from apps.nerds.lib import expired_data
 
 logger = logging.getLogger('noclook_purge_router')
 
 
-delete_log = []
-
-
-def delete_node(node, dry_run):
-    if not dry_run:
-        user = utils.get_user()
-        helpers.delete_node(user, node.handle_id)
-    name = u"{}<name='{}', handle_id={}>".format(type(node).__name__,
-                                                 node.data.get('name'),
-                                                 node.handle_id)
-    logger.info('Deleted node {}.'.format(name))
-    delete_log.append(name)
-
-
 def remove_router_conf(router_name, data_age, dry_run=False):
-    routerq = """
-        MATCH (router:Node:Router {{name: '{}'}})
-        OPTIONAL MATCH (router)-[:Has*1..]->(physical)
-        OPTIONAL MATCH (physical)<-[:Part_of]-(logical)
-        WHERE (physical.noclook_auto_manage = true) OR (logical.noclook_auto_manage = true)
-        RETURN collect(distinct physical.handle_id) as physical, collect(distinct logical.handle_id) as logical
-        """.format(router_name)
-    router_result = nc.query_to_dict(nc.graphdb.manager, routerq)
-    for handle_id in router_result.get('logical', []):
-        logical = nc.get_node_model(nc.graphdb.manager, handle_id)
-        if logical:
-            last_seen, expired = helpers.neo4j_data_age(logical.data, data_age)
-            if expired:
-                delete_node(logical, dry_run)
-    for handle_id in router_result.get('physical', []):
-        physical = nc.get_node_model(nc.graphdb.manager, handle_id)
-        if physical:
-            last_seen, expired = helpers.neo4j_data_age(physical.data, data_age)
-            if expired:
-                delete_node(physical, dry_run)
+    counts = expired_data.remove_expired_router_data(utils.get_user(), data_age, router_name=router_name,
+                                                     dry_run=dry_run)
+    return counts['nodes']
 
 
 def main():
@@ -77,9 +45,9 @@ def main():
     # Load the configuration file
     if args.verbose:
         logger.setLevel(logging.INFO)
-    remove_router_conf(args.router_name, args.age, args.dry_run)
-    if delete_log:
-        logger.warning("Deleted %s nodes", len(delete_log))
+    deleted = remove_router_conf(args.router_name, args.age, args.dry_run)
+    if deleted:
+        logger.warning("%s %s nodes", "Found" if args.dry_run else "Deleted", deleted)
     return 0
 
 
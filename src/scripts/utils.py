@@ -1,4 +1,5 @@
 import os
+import gzip
 import logging
 import json
 try:
@@ -19,15 +20,46 @@ logger = logging.getLogger('noclook_utils')
 django_hack.nop()
 
 
+NDJSON_SUFFIXES = ('.ndjson', '.ndjson.gz')
+
+
+def open_ndjson(path, mode='rt'):
+    """
+    Opens a newline delimited JSON file, gzip compressed if the name ends with .gz.
+    """
+    if path.endswith('.gz'):
+        return gzip.open(path, mode, encoding='utf-8')
+    return open(path, mode, encoding='utf-8')
+
+
+def load_ndjson(path):
+    """
+    Yields one JSON object per line, one line at a time.
+    """
+    with open_ndjson(path) as f:
+        for line_number, line in enumerate(f, start=1):
+            if line.strip():
+                try:
+                    yield json.loads(line)
+                except ValueError as e:
+                    logger.error('Encountered a problem with {f} line {n}.'.format(f=path, n=line_number))
+                    logger.error(e)
+
+
 def load_json(json_dir, starts_with='', with_filename=False):
     """
-    Thinks all files in the supplied dir are text files containing json.
+    Thinks all files in the supplied dir are text files containing json. Files ending with .ndjson or .ndjson.gz
+    contain one json object per line and are streamed.
     """
     logger.info('Loading data from {!s}.'.format(json_dir))
     try:
         for subdir, dirs, files in os.walk(json_dir):
-            gen = (_file for _file in files if _file.startswith(starts_with))
+            gen = (_file for _file in sorted(files) if _file.startswith(starts_with))
             for a_file in gen:
+                if a_file.endswith(NDJSON_SUFFIXES):
+                    for item in load_ndjson(os.path.join(subdir, a_file)):
+                        yield (item, a_file) if with_filename else item
+                    continue
                 try:
                     f = open(os.path.join(subdir, a_file), 'r')
                     if with_filename: